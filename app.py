@@ -2,7 +2,7 @@
 import os
 import aws_cdk as cdk
 from geoservices.geodata_stack import GeodataStack
-from geoservices.titiler_service_stack import TitilerServiceStack
+from geoservices.titiler_service_stack import ERROR_CACHING_TTLS, TitilerServiceStack
 
 app = cdk.App()
 GeodataStack(
@@ -23,6 +23,8 @@ TitilerServiceStack(
     app,
     "titiler-staging",
     stage="staging",
+    cold_start_metric=True,
+    error_caching_ttls=ERROR_CACHING_TTLS,
     env=cdk.Environment(account=os.getenv('cdk_default_account'), region=os.getenv('cdk_default_region'))
 )
 
@@ -30,6 +32,8 @@ TitilerServiceStack(
     app,
     "titiler-production",
     stage="production",
+    cold_start_metric=True,
+    error_caching_ttls=ERROR_CACHING_TTLS,
     env=cdk.Environment(account=os.getenv('cdk_default_account'), region=os.getenv('cdk_default_region'))
 )
 
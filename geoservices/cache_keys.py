@@ -0,0 +1,61 @@
+import json
+import os
+
+TILE_PARAMETERS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "resources", "cache_keys.json")
+
+# CloudFront Function (viewer request) canonicalizing the query string before
+# the cache lookup, so requests differing only in parameter order, parameter
+# name case or unused parameters share one cache entry. Mirrors
+# canonical_query in resources/cache_keys.py; the allow-list of tile
+# parameters comes from the same file.
+CANONICAL_QUERY_FUNCTION = """
+var TILE_PARAMETERS = %(tile_parameters)s;
+
+function handler(event) {
+    var request = event.request;
+    var tiles = request.uri.indexOf('/tiles/') !== -1;
+    var params = {};
+    var names = [];
+    Object.keys(request.querystring).forEach(function (sent) {
+        var name = sent.toLowerCase();
+        if (tiles && TILE_PARAMETERS.indexOf(name) === -1) {
+            return;
+        }
+        var param = request.querystring[sent];
+        var values = param.multiValue ? param.multiValue.map(function (v) { return v.value; }) : [param.value];
+        if (!params[name]) {
+            params[name] = [];
+            names.push(name);
+        }
+        params[name] = params[name].concat(values);
+    });
+    names.sort();
+    var querystring = {};
+    names.forEach(function (name) {
+        var values = params[name];
+        querystring[name] = { value: values[0] };
+        if (values.length > 1) {
+            querystring[name].multiValue = values.map(function (v) { return { value: v }; });
+        }
+    });
+    request.querystring = querystring;%(dynamic_tiles)s
+    return request;
+}
+"""
+
+# Tile requests that still have a query string are moved under /_dynamic/ so
+# they miss the tile store (see DYNAMIC_PREFIX in resources/middleware.py).
+DYNAMIC_TILES = """
+    if (names.length > 0) {
+        request.uri = '/_dynamic' + request.uri;
+    }"""
+
+def tile_parameters():
+    with open(TILE_PARAMETERS_FILE) as f:
+        return sorted(json.load(f)["tile_parameters"])
+
+def canonical_query_function(dynamic_tiles=False):
+    return CANONICAL_QUERY_FUNCTION % {
+        "tile_parameters": json.dumps(tile_parameters()),
+        "dynamic_tiles": DYNAMIC_TILES if dynamic_tiles else "",
+    }
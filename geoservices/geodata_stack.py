@@ -9,7 +9,7 @@ from aws_cdk import (
     aws_wafv2 as waf
 )
 from constructs import Construct
-from helpers.ip_list import IpList
+from helpers import ip_list
 
 class GeodataStack(Stack):
     def __init__(self, scope: Construct, construct_id: str, stage: str, **kwargs) -> None:
@@ -46,7 +46,7 @@ class GeodataStack(Stack):
 
         # IP Set
         ipset_ip4 = waf.CfnIPSet(self, f"geodata-{stage}-ip4-ipset",
-            addresses=IpList().ip4(),
+            addresses=ip_list.shared().ip4(),
             ip_address_version="IPV4",
             scope="CLOUDFRONT",
             description="On Campus and VPN IP4 Addresses",
@@ -54,7 +54,7 @@ class GeodataStack(Stack):
         )
 
         ipset_ip6 = waf.CfnIPSet(self, f"geodata-{stage}-ip6-ipset",
-            addresses=IpList().ip6(),
+            addresses=ip_list.shared().ip6(),
             ip_address_version="IPV6",
             scope="CLOUDFRONT",
             description="On Campus and VPN IP6 Addresses",
@@ -0,0 +1,56 @@
+# GDAL and rio-tiler settings for the TiTiler Lambda function. Kept out of
+# the stack so that local benchmarks can run with the same configuration.
+GDAL_ENVIRONMENT = {
+    "CPL_VSIL_CURL_ALLOWED_EXTENSIONS": ".tif,.TIF,.tiff",
+    "GDAL_CACHEMAX": "800",  # 800 mb
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+    "GDAL_HTTP_MULTIPLEX": "YES",
+    "GDAL_HTTP_VERSION": "2",
+    "PYTHONWARNINGS": "ignore",
+    "VSI_CACHE": "TRUE",
+    "VSI_CACHE_SIZE": "5000000",  # 5 MB (per file-handle)
+    "RIO_TILER_MAX_THREADS": "1" # turn off rio-tiler threading, better for lamda
+}
+
+# Named tuning profiles: Lambda memory size (which also sets the CPU share,
+# one vCPU per 1769 MB) and overrides of GDAL_ENVIRONMENT. Stacks select one
+# with `tuning_profile`. Only "default" has been in production; the other two
+# are starting points that haven't been measured yet. Compare them with
+# resources/benchmarks/sweep.py before relying on or changing the numbers.
+#
+#  * default: the settings the service has always used.
+#  * cog: single COGs. Tiles of one dataset reuse the same file handle, so a
+#    larger per-handle VSI cache should pay off; a tile is one read, so the
+#    second vCPU of 3008 MB is expected to go unused.
+#  * mosaic: large mosaics. A tile reads several assets, so rio-tiler reads
+#    them in parallel and the function gets more vCPUs; the per-handle VSI
+#    cache is kept small because many handles are open at once.
+TUNING_PROFILES = {
+    "default": {
+        "memory_size": 3008,
+        "environment": {},
+    },
+    "cog": {
+        "memory_size": 2048,
+        "environment": {
+            "GDAL_CACHEMAX": "512",
+            "VSI_CACHE_SIZE": "25000000",  # 25 MB (per file-handle)
+        },
+    },
+    "mosaic": {
+        "memory_size": 4096,
+        "environment": {
+            "GDAL_CACHEMAX": "1024",
+            "VSI_CACHE_SIZE": "2000000",  # 2 MB (per file-handle)
+            "RIO_TILER_MAX_THREADS": "4",
+        },
+    },
+}
+
+# (memory size, environment) for a tuning profile.
+def tuning_profile(name="default"):
+    if name not in TUNING_PROFILES:
+        raise ValueError(f"Unknown tuning profile {name!r}, expected one of {', '.join(TUNING_PROFILES)}")
+    profile = TUNING_PROFILES[name]
+    return profile["memory_size"], {**GDAL_ENVIRONMENT, **profile["environment"]}
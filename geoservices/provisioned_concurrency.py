@@ -0,0 +1,33 @@
+# Provisioned concurrency for the TiTiler function alias, per stage. Stacks
+# enable it with `provisioned_concurrency`. Between min and max, Application
+# Auto Scaling tracks `utilization` (the share of provisioned environments
+# busy); schedules raise or lower min and max at set times (cron fields in
+# the schedule's time zone), e.g. ahead of weekday classes. Size these from
+# the ColdStarts metric (resources/instrumentation.py): cold starts left at
+# busy times mean min is too low, none at all and low utilization that it is
+# too high.
+PROVISIONED_CONCURRENCY = {
+    "staging": {
+        "min": 1,
+        "max": 2,
+        "utilization": 0.7,
+        "time_zone": "America/New_York",
+        "schedules": [],
+    },
+    "production": {
+        "min": 1,
+        "max": 10,
+        "utilization": 0.7,
+        "time_zone": "America/New_York",
+        "schedules": [
+            # Weekdays 8am-10pm: more environments ready for class use.
+            {"name": "weekday-day", "cron": {"minute": "0", "hour": "8", "week_day": "MON-FRI"}, "min": 3, "max": 20},
+            {"name": "weekday-night", "cron": {"minute": "0", "hour": "22", "week_day": "MON-FRI"}, "min": 1, "max": 10},
+        ],
+    },
+}
+
+def provisioned_concurrency(stage):
+    if stage not in PROVISIONED_CONCURRENCY:
+        raise ValueError(f"No provisioned concurrency settings for stage {stage!r}, expected one of {', '.join(PROVISIONED_CONCURRENCY)}")
+    return PROVISIONED_CONCURRENCY[stage]
@@ -0,0 +1,129 @@
+import os
+from aws_cdk import (
+    Stack,
+    CfnOutput,
+    Duration,
+    aws_certificatemanager as certificatemanager,
+    aws_ec2 as ec2,
+    aws_ecs as ecs,
+    aws_ecs_patterns as ecs_patterns,
+    aws_elasticloadbalancingv2 as elbv2,
+    aws_iam as iam,
+    custom_resources as cr,
+)
+
+from constructs import Construct
+from geoservices.lambda_environment import tuning_profile as load_tuning_profile
+from geoservices.titiler_service_stack import stage_domain
+
+# CloudFront's origin-facing addresses, as an AWS-managed prefix list.
+CLOUDFRONT_ORIGIN_FACING = "com.amazonaws.global.cloudfront.origin-facing"
+
+# TiTiler as a long-running container service: the image's `container` target
+# (uvicorn workers running the same app and middleware as the Lambda function,
+# see resources/server.py) on ECS Fargate behind an Application Load Balancer.
+# Workers keep GDAL handles and caches across requests, which should make it
+# cheaper than Lambda under steady load; that hasn't been measured yet (see
+# resources/benchmarks/bench_container.py). Put it behind the TiTiler
+# CloudFront distribution with
+# TitilerServiceStack(container_origin=container_stack.origin_domain); the
+# function stays deployed as the fallback origin. The load balancer only
+# accepts HTTPS from CloudFront, on `origin_domain`, whose CNAME to the load
+# balancer and certificate validation record are added in DNS by hand, like
+# the stage's domain.
+class TitilerContainerStack(Stack):
+
+    def __init__(self, scope: Construct, construct_id: str, stage: str, cpu: int = 2048, memory_limit_mib: int = 4096,
+                 workers: int = 2, min_tasks: int = 1, max_tasks: int = 4, target_cpu_utilization: int = 60,
+                 tuning_profile: str = "default", origin_domain: str = None, **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+        origin_domain = origin_domain or f"origin.{stage_domain(stage)}"
+
+        # GDAL settings from the tuning profile (see
+        # geoservices/lambda_environment.py). GDAL's block cache is per
+        # process, so each worker gets an even share of half the task memory.
+        _, env = load_tuning_profile(tuning_profile)
+        env["GDAL_CACHEMAX"] = str(memory_limit_mib // (2 * workers))
+        env["TITILER_WORKERS"] = str(workers)
+        env["TITILER_BASE_URL"] = stage_domain(stage)
+        env["TITILER_S3_BUCKET"] = f"figgy-geo-{stage}"
+
+        # Public subnets only: tasks reach S3 and ECR through their public
+        # ip, so there is no NAT gateway to pay for.
+        vpc = ec2.Vpc(self, f"titiler-{stage}-Vpc",
+            max_azs=2,
+            nat_gateways=0,
+            subnet_configuration=[ec2.SubnetConfiguration(name="public", subnet_type=ec2.SubnetType.PUBLIC)],
+        )
+        cluster = ecs.Cluster(self, f"titiler-{stage}-Cluster", vpc=vpc)
+
+        certificate = certificatemanager.Certificate(self, f"titiler-{stage}-OriginCertificate",
+            domain_name=origin_domain,
+            validation=certificatemanager.CertificateValidation.from_dns()
+        )
+
+        service = ecs_patterns.ApplicationLoadBalancedFargateService(self, f"titiler-{stage}-Service",
+            cluster=cluster,
+            cpu=cpu,
+            memory_limit_mib=memory_limit_mib,
+            desired_count=min_tasks,
+            assign_public_ip=True,
+            public_load_balancer=True,
+            protocol=elbv2.ApplicationProtocol.HTTPS,
+            certificate=certificate,
+            redirect_http=False,
+            open_listener=False,
+            runtime_platform=ecs.RuntimePlatform(
+                cpu_architecture=ecs.CpuArchitecture.X86_64,
+                operating_system_family=ecs.OperatingSystemFamily.LINUX,
+            ),
+            task_image_options=ecs_patterns.ApplicationLoadBalancedTaskImageOptions(
+                image=ecs.ContainerImage.from_asset(os.path.join(os.getcwd(), "resources"), target="container"),
+                container_port=8080,
+                environment=env,
+                log_driver=ecs.LogDrivers.aws_logs(stream_prefix=f"titiler-{stage}"),
+            ),
+        )
+        service.target_group.configure_health_check(path="/healthz", healthy_http_codes="200")
+        service.target_group.set_attribute("deregistration_delay.timeout_seconds", "30")
+
+        # Only CloudFront may reach the load balancer. The managed prefix
+        # list's id differs by region, so it is looked up on deploy.
+        prefix_list = cr.AwsCustomResource(self, f"titiler-{stage}-CloudFrontPrefixList",
+            on_update=cr.AwsSdkCall(
+                service="EC2",
+                action="describeManagedPrefixLists",
+                parameters={"Filters": [{"Name": "prefix-list-name", "Values": [CLOUDFRONT_ORIGIN_FACING]}]},
+                physical_resource_id=cr.PhysicalResourceId.of(CLOUDFRONT_ORIGIN_FACING),
+                output_paths=["PrefixLists.0.PrefixListId"],
+            ),
+            policy=cr.AwsCustomResourcePolicy.from_sdk_calls(resources=cr.AwsCustomResourcePolicy.ANY_RESOURCE),
+        )
+        service.load_balancer.connections.allow_from(
+            ec2.Peer.prefix_list(prefix_list.get_response_field("PrefixLists.0.PrefixListId")),
+            ec2.Port.tcp(443),
+            "CloudFront origin-facing addresses",
+        )
+
+        # S3 Permissions
+        service.task_definition.add_to_task_role_policy(iam.PolicyStatement(
+            actions=["s3:GetObject"],
+            resources=[
+                f"arn:aws:s3:::figgy-geo-{stage}/*",
+                "arn:aws:s3:::*/*"
+            ],
+        ))
+
+        # Tasks are added and removed on CPU, which rendering saturates
+        # before memory.
+        scaling = service.service.auto_scale_task_count(min_capacity=min_tasks, max_capacity=max_tasks)
+        scaling.scale_on_cpu_utilization(f"titiler-{stage}-CpuScaling",
+            target_utilization_percent=target_cpu_utilization,
+            scale_in_cooldown=Duration.minutes(5),
+            scale_out_cooldown=Duration.minutes(1),
+        )
+
+        self.origin_domain = origin_domain
+        self.load_balancer_dns = service.load_balancer.load_balancer_dns_name
+        CfnOutput(self, "Load Balancer", value=self.load_balancer_dns)
+        CfnOutput(self, "Origin Domain", value=origin_domain)
@@ -5,10 +5,14 @@ from aws_cdk import (
     DockerImage,
     Duration,
     Fn,
+    Size,
+    TimeZone,
     CfnOutput,
+    aws_applicationautoscaling as appscaling,
     aws_certificatemanager as certificatemanager,
     aws_cloudfront as cloudfront,
     aws_cloudfront_origins as cloudfront_origins,
+    aws_cloudwatch as cloudwatch,
     aws_iam as iam,
     aws_s3 as s3,
     aws_wafv2 as waf,
@@ -18,27 +22,91 @@ from aws_cdk import (
 )
 
 from constructs import Construct
+from geoservices.cache_keys import canonical_query_function
+from geoservices.lambda_environment import tuning_profile as load_tuning_profile
+from geoservices.provisioned_concurrency import provisioned_concurrency as load_provisioned_concurrency
+
+# Seconds CloudFront caches error responses from TiTiler, by status, for
+# stacks to pass as error_caching_ttls. Requests for missing resources (404)
+# and invalid parameters (400) are answered from the edge instead of
+# invoking the function again; server errors are retried soon. Without
+# error_caching_ttls, CloudFront's default (10 seconds for every error)
+# applies.
+ERROR_CACHING_TTLS = {400: 300, 404: 300, 500: 10, 502: 10, 503: 10, 504: 10}
+
+# Public hostname of the TiTiler service for a stage.
+def stage_domain(stage):
+    if stage == "staging":
+        return "map-tiles-staging.princeton.edu"
+    return "map-tiles.princeton.edu"
 
 class TitilerServiceStack(Stack):
-    def __init__(self, scope: Construct, construct_id: str, stage: str, **kwargs) -> None:
+    def __init__(self, scope: Construct, construct_id: str, stage: str, tile_cache_mb: int = 0, profile_imports: bool = False,
+                 warm_concurrency: int = 1, warm_resources: list = None,
+                 instrumentation: bool = False, trace_gdal_requests: bool = False, tuning_profile: str = "default",
+                 tile_store: bool = False, mosaic_index_sidecars: bool = False,
+                 canonical_cache_keys: bool = False, streaming: bool = False,
+                 provisioned_concurrency: bool = False, metadata_sidecars: bool = False,
+                 check_resources: bool = False, error_caching_ttls: dict = None,
+                 container_origin: str = None, cold_start_metric: bool = False, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
-        # Environment Variables
-        env = {
-            "CPL_VSIL_CURL_ALLOWED_EXTENSIONS": ".tif,.TIF,.tiff",
-            "GDAL_CACHEMAX": "800",  # 800 mb
-            "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
-            "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
-            "GDAL_HTTP_MULTIPLEX": "YES",
-            "GDAL_HTTP_VERSION": "2",
-            "PYTHONWARNINGS": "ignore",
-            "VSI_CACHE": "TRUE",
-            "VSI_CACHE_SIZE": "5000000",  # 5 MB (per file-handle)
-            "RIO_TILER_MAX_THREADS": "1" # turn off rio-tiler threading, better for lamda
-        }
+        # Environment Variables and memory size from the tuning profile
+        # (see geoservices/lambda_environment.py).
+        memory_size, env = load_tuning_profile(tuning_profile)
+
+        # Optional cache of rendered tiles in the function's /tmp storage.
+        # Used in TileCacheMiddleware; /tmp is sized to hold it plus the
+        # COG header cache.
+        if tile_cache_mb:
+            env["TITILER_TILE_CACHE_MB"] = str(tile_cache_mb)
+        ephemeral_storage_mb = max(512, tile_cache_mb + 256)
+
+        # Log the import time of every module during init to CloudWatch.
+        # Summarize locally with `python application.py --profile-imports`.
+        if profile_imports:
+            env["PYTHONPROFILEIMPORTTIME"] = "1"
+
+        # Per-request stage timings as Server-Timing headers and CloudWatch
+        # EMF metrics (see resources/instrumentation.py). Counting GDAL range
+        # requests relies on GDAL debug logging and is enabled separately.
+        if instrumentation:
+            env["TITILER_SERVER_TIMING"] = "1"
+            env["TITILER_EMF_METRICS"] = "1"
+        if trace_gdal_requests:
+            env["TITILER_TRACE_GDAL"] = "1"
+
+        # One ColdStarts metric per on-demand execution environment, to size
+        # provisioned concurrency against.
+        if cold_start_metric:
+            env["TITILER_COLD_START_METRIC"] = "1"
+
+        # Load mosaics from their quadkey index sidecars (mosaic.json.idx,
+        # written by resources/quadkey_index.py) when present.
+        if mosaic_index_sidecars:
+            env["TITILER_MOSAIC_SIDECARS"] = "1"
+
+        # Answer COG info, bounds, statistics and TileJSON requests from
+        # their metadata sidecars (display_raster.tif.meta.json, written by
+        # resources/metadata_sidecar.py) when present and current.
+        if metadata_sidecars:
+            env["TITILER_METADATA_SIDECARS"] = "1"
+
+        # Look up the file behind a resource id before handing the request to
+        # titiler, answering 404 for missing resources without opening them
+        # (see resources/routing.py).
+        if check_resources:
+            env["TITILER_CHECK_RESOURCES"] = "1"
+
+        # Optional streaming mode: the image's streaming target runs the app
+        # with uvicorn behind the Lambda Web Adapter (resources/server.py) and
+        # the function url streams responses, gzipping JSON as it goes.
+        if streaming:
+            env["TITILER_COMPRESS_JSON"] = "1"
 
         ecr_image = aws_lambda.EcrImageCode.from_asset_image(
-            directory = os.path.join(os.getcwd(), "resources")
+            directory = os.path.join(os.getcwd(), "resources"),
+            target = "streaming" if streaming else "function",
         )
 
         # Lambda Function Definition
@@ -48,9 +116,10 @@ class TitilerServiceStack(Stack):
             runtime=aws_lambda.Runtime.FROM_IMAGE,
             code=ecr_image,
             handler=aws_lambda.Handler.FROM_IMAGE,
-            memory_size=3008,
+            memory_size=memory_size,
             timeout=Duration.seconds(600),
             environment=env,
+            ephemeral_storage_size=Size.mebibytes(ephemeral_storage_mb),
         )
 
         # S3 Permissions
@@ -63,18 +132,69 @@ class TitilerServiceStack(Stack):
         )
         lambda_function.add_to_role_policy(permission)
 
+        # Optional provisioned concurrency on a "live" alias of the current
+        # version, scaled on utilization and per-stage schedules (see
+        # geoservices/provisioned_concurrency.py). The function url, and so
+        # CloudFront, then invokes the alias, whose provisioned execution
+        # environments are initialized ahead of bursts. It replaces the
+        # warmer below.
+        url_target = lambda_function
+        if provisioned_concurrency:
+            settings = load_provisioned_concurrency(stage)
+            live = aws_lambda.Alias(self, f"titiler-{stage}-live",
+                alias_name="live",
+                version=lambda_function.current_version,
+                provisioned_concurrent_executions=settings["min"],
+            )
+            scaling = live.add_auto_scaling(min_capacity=settings["min"], max_capacity=settings["max"])
+            scaling.scale_on_utilization(utilization_target=settings["utilization"])
+            for schedule in settings["schedules"]:
+                scaling.scale_on_schedule(schedule["name"],
+                    schedule=appscaling.Schedule.cron(**schedule["cron"]),
+                    min_capacity=schedule["min"],
+                    max_capacity=schedule["max"],
+                    time_zone=TimeZone.of(settings["time_zone"]),
+                )
+            url_target = live
+
+            cold_start_rate = cloudwatch.MathExpression(
+                expression="100 * FILL(cold, 0) / invocations",
+                label="Cold start rate (%)",
+                using_metrics={
+                    "cold": cloudwatch.Metric(
+                        namespace="Geoservices/TiTiler",
+                        metric_name="ColdStarts",
+                        dimensions_map={"FunctionName": lambda_function.function_name},
+                        statistic="Sum",
+                    ),
+                    "invocations": lambda_function.metric_invocations(statistic="Sum"),
+                },
+                period=Duration.minutes(5),
+            )
+            cloudwatch.Dashboard(self, f"titiler-{stage}-Concurrency",
+                dashboard_name=f"titiler-{stage}-concurrency",
+                widgets=[[
+                    cloudwatch.GraphWidget(title="Cold start rate", left=[cold_start_rate]),
+                    cloudwatch.GraphWidget(title="Provisioned concurrency utilization", left=[
+                        live.metric("ProvisionedConcurrencyUtilization", statistic="Maximum", period=Duration.minutes(1)),
+                    ]),
+                    cloudwatch.GraphWidget(title="Concurrent executions", left=[
+                        live.metric("ProvisionedConcurrentExecutions", statistic="Maximum", period=Duration.minutes(1)),
+                        lambda_function.metric("ConcurrentExecutions", statistic="Maximum", period=Duration.minutes(1)),
+                    ]),
+                ]],
+            )
+
         # Add function url to primary lambda
         # Use instead of API gateway to bypass 30 second gateway timeout limit
-        lambda_url = lambda_function.add_function_url(
-            auth_type=aws_lambda.FunctionUrlAuthType.NONE
+        lambda_url = url_target.add_function_url(
+            auth_type=aws_lambda.FunctionUrlAuthType.NONE,
+            invoke_mode=aws_lambda.InvokeMode.RESPONSE_STREAM if streaming else aws_lambda.InvokeMode.BUFFERED,
         )
         function_url = Fn.select(2, Fn.split('/', lambda_url.url))
 
         # Certificate
-        if stage == "staging":
-            custom_domain = "map-tiles-staging.princeton.edu"
-        else:
-            custom_domain = "map-tiles.princeton.edu"
+        custom_domain = stage_domain(stage)
 
         certificate = certificatemanager.Certificate(self, f"titiler-{stage}-Certificate",
             domain_name=custom_domain,
@@ -107,21 +227,104 @@ class TitilerServiceStack(Stack):
                 custom_headers=[cloudfront.ResponseCustomHeader(header="Cache-Control", value="public, max-age= 31536000", override=True)]
             )
         )
+        function_origin = cloudfront_origins.HttpOrigin(function_url)
+        serving_origin = function_origin
+        default_origin = function_origin
+
+        # Optional container service (TitilerContainerStack): CloudFront sends
+        # requests over HTTPS to its load balancer's origin domain, and to the
+        # function url when the service is unavailable. Tile store misses go
+        # to the service.
+        if container_origin:
+            serving_origin = cloudfront_origins.HttpOrigin(container_origin,
+                protocol_policy=cloudfront.OriginProtocolPolicy.HTTPS_ONLY,
+                read_timeout=Duration.seconds(60),
+            )
+            default_origin = cloudfront_origins.OriginGroup(
+                primary_origin=serving_origin,
+                fallback_origin=function_origin,
+                fallback_status_codes=[502, 503, 504],
+            )
+        additional_behaviors = {}
+
+        # Optional CloudFront Function normalizing query strings before the
+        # cache lookup (sorted, lowercased names, tile parameters
+        # allow-listed; see geoservices/cache_keys.py). The function applies
+        # the same normalization in CanonicalQueryMiddleware.
+        function_associations = []
+        if canonical_cache_keys:
+            canonical_query = cloudfront.Function(self, f"titiler-{stage}-CanonicalQuery",
+                comment="Normalize query strings before the cache lookup",
+                runtime=cloudfront.FunctionRuntime.JS_2_0,
+                code=cloudfront.FunctionCode.from_inline(canonical_query_function()),
+            )
+            function_associations.append(cloudfront.FunctionAssociation(
+                function=canonical_query,
+                event_type=cloudfront.FunctionEventType.VIEWER_REQUEST,
+            ))
+
+        # Optional store of pre-rendered tiles. Tile requests try the tile
+        # bucket first and fall back to the function when the tile isn't
+        # there (S3 answers 403 for missing keys without s3:ListBucket). The
+        # function writes the tiles it renders back to the bucket
+        # (TileStoreMiddleware), and resources/seed.py can fill it ahead of
+        # time. Objects are keyed by path only, so a CloudFront Function
+        # moves tile requests with a query string under /_dynamic/, which is
+        # never stored, and they always reach the function. The same
+        # function normalizes the query string first.
+        if tile_store:
+            tile_bucket = s3.Bucket(self, f"titiler-{stage}-TileStore",
+                block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+                encryption=s3.BucketEncryption.S3_MANAGED,
+                enforce_ssl=True,
+            )
+            tile_bucket.grant_put(lambda_function)
+            lambda_function.add_environment("TITILER_TILE_STORE", f"s3://{tile_bucket.bucket_name}")
+
+            dynamic_tiles = cloudfront.Function(self, f"titiler-{stage}-DynamicTiles",
+                comment="Normalize query strings and send tile requests with one to the TiTiler function",
+                runtime=cloudfront.FunctionRuntime.JS_2_0,
+                code=cloudfront.FunctionCode.from_inline(canonical_query_function(dynamic_tiles=True)),
+            )
+            additional_behaviors["*/tiles/*"] = cloudfront.BehaviorOptions(
+                origin=cloudfront_origins.OriginGroup(
+                    primary_origin=cloudfront_origins.S3BucketOrigin.with_origin_access_control(tile_bucket),
+                    fallback_origin=serving_origin,
+                    fallback_status_codes=[403, 404],
+                ),
+                cache_policy=cache_policy,
+                allowed_methods=cloudfront.AllowedMethods.ALLOW_GET_HEAD_OPTIONS,
+                response_headers_policy=response_headers_policy,
+                viewer_protocol_policy=cloudfront.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
+                origin_request_policy=cloudfront.OriginRequestPolicy.CORS_S3_ORIGIN,
+                function_associations=[cloudfront.FunctionAssociation(
+                    function=dynamic_tiles,
+                    event_type=cloudfront.FunctionEventType.VIEWER_REQUEST,
+                )],
+            )
+            CfnOutput(self, "Tile Store Bucket", value=tile_bucket.bucket_name)
+
         distribution = cloudfront.Distribution(self, f"titiler-{stage}-DistPolicy",
             certificate=certificate,
             domain_names=[custom_domain],
             default_behavior=cloudfront.BehaviorOptions(
-                origin=cloudfront_origins.HttpOrigin(function_url),
+                origin=default_origin,
                 cache_policy=cache_policy,
                 allowed_methods=cloudfront.AllowedMethods.ALLOW_GET_HEAD_OPTIONS,
                 response_headers_policy=response_headers_policy,
                 viewer_protocol_policy=cloudfront.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
-                origin_request_policy=cloudfront.OriginRequestPolicy.CORS_S3_ORIGIN
-            )
+                origin_request_policy=cloudfront.OriginRequestPolicy.CORS_S3_ORIGIN,
+                function_associations=function_associations,
+            ),
+            additional_behaviors=additional_behaviors,
+            error_responses=[
+                cloudfront.ErrorResponse(http_status=status, ttl=Duration.seconds(ttl))
+                for status, ttl in sorted((error_caching_ttls or {}).items())
+            ] or None,
         )
 
         # Add base url env var so TiTiler generates correct tile URLs.
-        # Used in HostMiddleware.
+        # Used in TitilerMiddleware.
         lambda_function.add_environment("TITILER_BASE_URL", custom_domain)
 
         # Add env var to set the correct s3 bucket
@@ -130,10 +333,34 @@ class TitilerServiceStack(Stack):
         CfnOutput(self, "Function URL", value=function_url)
         CfnOutput(self, "Cloudfront Endpoint", value=distribution.domain_name)
 
-        # Lambda warmer
-        eventRule = aws_events.Rule(
-          self,
-          f"titiler-{stage}-warmer",
-          schedule=aws_events.Schedule.cron(minute="0/15")
-        )
-        eventRule.add_target(aws_events_targets.LambdaFunction(lambda_function))
+        # Lambda warmer, unless provisioned concurrency keeps environments
+        # initialized.
+        if not provisioned_concurrency:
+            # The handler fans the event out to warm_concurrency containers and
+            # opens the warm_resources ("{id}/cog" or "{id}/mosaicjson") in each.
+            eventRule = aws_events.Rule(
+              self,
+              f"titiler-{stage}-warmer",
+              schedule=aws_events.Schedule.cron(minute="0/15")
+            )
+            eventRule.add_target(aws_events_targets.LambdaFunction(
+                lambda_function,
+                event=aws_events.RuleTargetInput.from_object({
+                    "warmer": {
+                        "concurrency": warm_concurrency,
+                        "resources": warm_resources or [],
+                    }
+                })
+            ))
+
+            # The most containers a warmer event may ask for.
+            lambda_function.add_environment("TITILER_WARMER_MAX_CONCURRENCY", str(warm_concurrency))
+
+            if warm_concurrency > 1:
+                # Let the warmer invoke the function itself. The ARN is matched by
+                # name prefix because referencing the function here would create
+                # a circular dependency with its role.
+                lambda_function.add_to_role_policy(iam.PolicyStatement(
+                    actions=["lambda:InvokeFunction"],
+                    resources=[f"arn:aws:lambda:{self.region}:{self.account}:function:{self.stack_name}-*"],
+                ))
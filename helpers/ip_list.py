@@ -1,10 +1,38 @@
+import ipaddress
+import json
+import logging
+import os
 import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+logger = logging.getLogger(__name__)
+
+# Last known GlobalProtect gateway addresses, committed with the repo and
+# updated by each synth that resolves a gateway to a new address.
+LAST_KNOWN = os.path.join(os.path.dirname(__file__), "global_protect_ips.json")
+
+# Campus and GlobalProtect VPN addresses for the geodata WAF IP sets.
+# GlobalProtect gateways are resolved concurrently, each lookup bounded by
+# `timeout` seconds, and the result is kept for `ttl` seconds, so a synth
+# resolves them once however many stacks ask. A gateway that can't be
+# resolved keeps its last known address (from `last_known`); one with
+# neither fails the synth rather than leave VPN users out of the IP set.
+# Addresses are collapsed into the fewest covering CIDRs and sorted.
 class IpList:
+    def __init__(self, timeout=5, ttl=300, max_workers=16, last_known=LAST_KNOWN):
+        self.timeout = timeout
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self.last_known = last_known
+        self._lock = threading.Lock()
+        self._resolved = None
+        self._resolved_at = 0
     def ip4(self):
-        return self.campus_ip4() + self.global_protect_ips()
+        return collapse(self.campus_ip4() + self.global_protect_ips())
     def ip6(self):
-        return self.campus_ip6()
+        return collapse(self.campus_ip6())
     def campus_ip4(self):
         return [ "128.112.0.0/16",
                 "140.180.0.0/16",
@@ -25,15 +53,64 @@ class IpList:
                 "2620:c4::/48",
                 "2604:4540::/32"]
     def host_to_ip(self, hostname):
-        try:
-            ip = socket.gethostbyname(hostname)
-            return f"{ip}/32"
-        except:
-            pass
+        ip = socket.gethostbyname(hostname)
+        return f"{ip}/32"
     def global_protect_ips(self):
-        fqdns = self.global_protect_fqdns()
-        ips = list(map(self.host_to_ip, fqdns))
-        return [i for i in ips if i is not None]
+        with self._lock:
+            if self._resolved is None or time.monotonic() - self._resolved_at > self.ttl:
+                self._resolved = self.resolve(self.global_protect_fqdns())
+                self._resolved_at = time.monotonic()
+            return list(self._resolved)
+    # Resolve hostnames in parallel. Hosts that fail or don't answer in time
+    # keep their last known address, or raise.
+    def resolve(self, hostnames):
+        known = self.read_last_known()
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(hostnames)))) as executor:
+            results = list(executor.map(self.lookup, hostnames))
+
+        ips = []
+        failed = []
+        resolved = dict(known)
+        for hostname, result in zip(hostnames, results):
+            if isinstance(result, str):
+                resolved[hostname] = result
+                ips.append(result)
+            elif hostname in known:
+                logger.warning("could not resolve %s (%s), keeping %s", hostname, result, known[hostname])
+                ips.append(known[hostname])
+            else:
+                failed.append(f"{hostname} ({result})")
+        if resolved != known:
+            self.write_last_known(resolved)
+        if failed:
+            raise RuntimeError(f"could not resolve {len(failed)} GlobalProtect gateways: " + ", ".join(failed))
+        return ips
+    # The address of hostname, or the error it failed with. The lookup runs on
+    # a daemon thread, so one stalled past the timeout doesn't keep the synth
+    # from exiting.
+    def lookup(self, hostname):
+        result = {}
+
+        def run():
+            try:
+                result["ip"] = self.host_to_ip(hostname)
+            except Exception as e:
+                result["error"] = e
+
+        thread = threading.Thread(target=run, name="ip-list-resolve", daemon=True)
+        thread.start()
+        thread.join(self.timeout)
+        return result.get("ip") or result.get("error") or TimeoutError("timed out")
+    def read_last_known(self):
+        try:
+            with open(self.last_known) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+    def write_last_known(self, addresses):
+        with open(self.last_known, "w") as f:
+            json.dump(dict(sorted(addresses.items())), f, indent=2)
+            f.write("\n")
     def global_protect_fqdns(self):
        return [ "us-west-g-princeto.gpogn2y5gg2j.gw.gpcloudservice.com",
                 "us-southeast-g-princeto.gpogn2y5gg2j.gw.gpcloudservice.com",
@@ -118,3 +195,19 @@ class IpList:
                 "australia-southeast-princeto.gpogn2y5gg2j.gw.gpcloudservice.com",
                 "new-zealand-princeto.gpogn2y5gg2j.gw.gpcloudservice.com",
                 "australia-east-princeto.gpogn2y5gg2j.gw.gpcloudservice.com"]
+
+# Smallest sorted list of CIDRs covering `cidrs`.
+def collapse(cidrs):
+    networks = [ipaddress.ip_network(cidr, strict=False) for cidr in cidrs]
+    return [str(network) for network in ipaddress.collapse_addresses(networks)]
+
+_shared = None
+_shared_lock = threading.Lock()
+
+# The IpList shared by every stack in a synth.
+def shared():
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = IpList()
+        return _shared
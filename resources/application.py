@@ -0,0 +1,206 @@
+"""TiTiler application serving only the routers we use.
+
+`titiler.application.main` builds every router titiler ships (STAC, TMS,
+algorithms, colormaps, viewers) and imports their dependencies, which is most
+of the Lambda init time. This module builds the same endpoints for the
+routers in TITILER_ROUTERS (default "cog,mosaicjson") and imports a router's
+dependencies only when it is mounted.
+
+Run `python application.py --profile-imports` to report the import cost of
+`handler` by module.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+DEFAULT_ROUTERS = "cog,mosaicjson"
+INSTRUMENTATION_SETTINGS = ("TITILER_SERVER_TIMING", "TITILER_EMF_METRICS", "TITILER_TRACE_GDAL")
+
+def create_app(routers=None):
+    from fastapi import Depends, FastAPI
+    from starlette.middleware.cors import CORSMiddleware
+    from titiler.application.settings import ApiSettings
+    from titiler.core.errors import DEFAULT_STATUS_CODES, add_exception_handlers
+
+    import cache_keys
+    import compression
+    import instrumentation
+    import metadata_sidecar
+    import middleware
+    import tile_cache
+    import tile_store
+
+    if routers is None:
+        routers = os.getenv("TITILER_ROUTERS", DEFAULT_ROUTERS)
+    if isinstance(routers, str):
+        routers = [r.strip() for r in routers.split(",") if r.strip()]
+
+    api_settings = ApiSettings()
+    dependencies = []
+    if api_settings.global_access_token:
+        dependencies.append(Depends(access_token_validator(api_settings.global_access_token)))
+    app = FastAPI(
+        title=api_settings.name,
+        openapi_url="/api",
+        docs_url="/api.html",
+        root_path=api_settings.root_path,
+        dependencies=dependencies,
+    )
+
+    for name in routers:
+        ROUTERS[name](app)
+
+    add_exception_handlers(app, DEFAULT_STATUS_CODES)
+
+    @app.get("/healthz", description="Health Check.", summary="Health Check.", tags=["Health Check"])
+    def ping():
+        return {"ping": "pong!"}
+
+    # Starlette runs the last added middleware first: the optional cold
+    # start metric and instrumentation, CORS, then query string
+    # normalization, the optional tile store write-back (which needs the
+    # public path), the optional JSON compression, the optional metadata
+    # sidecars (also by public path), then our rewriting, then the optional
+    # local tile cache. Keeping our middleware inside CORS means responses
+    # replayed from a cache still get CORS headers.
+    if os.getenv("TITILER_TILE_CACHE_MB"):
+        app.add_middleware(tile_cache.TileCacheMiddleware)
+    app.add_middleware(middleware.TitilerMiddleware)
+    if os.getenv("TITILER_METADATA_SIDECARS"):
+        app.add_middleware(metadata_sidecar.MetadataSidecarMiddleware)
+    if os.getenv("TITILER_COMPRESS_JSON"):
+        app.add_middleware(compression.JSONCompressionMiddleware)
+    if os.getenv("TITILER_TILE_STORE"):
+        app.add_middleware(tile_store.TileStoreMiddleware)
+    app.add_middleware(cache_keys.CanonicalQueryMiddleware)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    if any(instrumentation.enabled(name) for name in INSTRUMENTATION_SETTINGS):
+        app.add_middleware(instrumentation.InstrumentationMiddleware)
+    if instrumentation.enabled("TITILER_COLD_START_METRIC"):
+        app.add_middleware(instrumentation.ColdStartMiddleware)
+
+    return app
+
+# As titiler.application.main: with TITILER_API_GLOBAL_ACCESS_TOKEN set,
+# every request needs ?access_token=<token>.
+def access_token_validator(token):
+    from fastapi import HTTPException, Security
+    from fastapi.security.api_key import APIKeyQuery
+
+    def validate_access_token(access_token: str = Security(APIKeyQuery(name="access_token", auto_error=False))):
+        if not access_token:
+            raise HTTPException(status_code=401, detail="Missing `access_token`")
+        if access_token != token:
+            raise HTTPException(status_code=401, detail="Invalid `access_token`")
+        return True
+
+    return validate_access_token
+
+def add_cog(app):
+    from titiler.core.factory import TilerFactory
+    from titiler.extensions import cogValidateExtension, cogViewerExtension, stacExtension
+
+    import batch
+    import cog_cache
+
+    # Open COGs using the header cache in cog_cache.py, with the /validate,
+    # /viewer and /stac endpoints titiler.application.main adds.
+    cog = TilerFactory(
+        reader=cog_cache.CogReader,
+        router_prefix="/cog",
+        extensions=[cogValidateExtension(), cogViewerExtension(), stacExtension(), batch.CogBatchTiles()],
+    )
+    app.include_router(cog.router, prefix="/cog", tags=["Cloud Optimized GeoTIFF"])
+
+def add_mosaicjson(app):
+    from titiler.core.errors import add_exception_handlers
+    from titiler.mosaic.errors import MOSAIC_STATUS_CODES
+
+    import batch
+    import mosaic_cache
+
+    # Read mosaic.json documents through the in-process cache in mosaic_cache.py.
+    mosaic = mosaic_cache.MosaicTilerFactory(
+        router_prefix="/mosaicjson", backend=mosaic_cache.MosaicBackend, extensions=[batch.MosaicBatchTiles()]
+    )
+    app.include_router(mosaic.router, prefix="/mosaicjson", tags=["MosaicJSON"])
+    add_exception_handlers(app, MOSAIC_STATUS_CODES)
+
+def add_stac(app):
+    from rio_tiler.io import STACReader
+    from titiler.core.factory import MultiBaseTilerFactory
+
+    stac = MultiBaseTilerFactory(reader=STACReader, router_prefix="/stac")
+    app.include_router(stac.router, prefix="/stac", tags=["SpatioTemporal Asset Catalog"])
+
+def add_tms(app):
+    from titiler.core.factory import TMSFactory
+
+    app.include_router(TMSFactory().router, tags=["Tiling Schemes"])
+
+def add_algorithms(app):
+    from titiler.core.factory import AlgorithmFactory
+
+    app.include_router(AlgorithmFactory().router, tags=["Algorithms"])
+
+def add_colormaps(app):
+    from titiler.core.factory import ColorMapFactory
+
+    app.include_router(ColorMapFactory().router, tags=["ColorMaps"])
+
+ROUTERS = {
+    "cog": add_cog,
+    "mosaicjson": add_mosaicjson,
+    "stac": add_stac,
+    "tms": add_tms,
+    "algorithms": add_algorithms,
+    "colormaps": add_colormaps,
+}
+
+# Import `module` in a fresh interpreter with -X importtime and return
+# (total microseconds, {top-level package: self microseconds}).
+def profile_imports(module="handler"):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    packages = defaultdict(int)
+    total = 0
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        packages[name.split(".")[0]] += int(self_us)
+        if len(indent) == 1:
+            total += int(cumulative_us)
+    return total, dict(packages)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profile-imports", action="store_true", help="report import cost by package")
+    parser.add_argument("--module", default="handler")
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+
+    if args.profile_imports:
+        total, packages = profile_imports(args.module)
+        print(f"{'package':<32}{'self ms':>10}")
+        for name, self_us in sorted(packages.items(), key=lambda kv: kv[1], reverse=True)[: args.top]:
+            print(f"{name:<32}{self_us / 1000:>10.1f}")
+        print(f"{'total import ' + args.module:<32}{total / 1000:>10.1f}")
+
+if __name__ == "__main__":
+    main()
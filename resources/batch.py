@@ -0,0 +1,209 @@
+import os
+import uuid
+from typing import Literal
+
+import rasterio
+from fastapi import Depends, HTTPException, Query
+from starlette.responses import Response
+from titiler.core.factory import FactoryExtension
+from titiler.core.resources.enums import ImageType
+from titiler.core.utils import render_image
+from typing_extensions import Annotated
+
+MAX_TILES = int(os.getenv("TITILER_BATCH_MAX_TILES", "64"))
+
+TILES_DESCRIPTION = "Comma separated list of z/x/y tiles, e.g. `10/301/384,10/302/384`."
+
+# GET /tiles/batch?tiles=z/x/y,... on a TilerFactory: renders every listed
+# tile from one open dataset and returns them as one multipart/mixed
+# response. Tiles are read in z, y, x order so neighbouring tiles run back to
+# back and reuse the byte ranges in GDAL's VSI cache and the decoded blocks in
+# its block cache; parts are returned in the order requested. Query
+# parameter names arrive lowercased (see cache_keys.py), hence the
+# tilematrixsetid alias.
+class CogBatchTiles(FactoryExtension):
+    def register(self, factory):
+        @factory.router.get("/tiles/batch", **batch_endpoint_params)
+        def tiles_batch(
+            tiles: Annotated[str, Query(description=TILES_DESCRIPTION)],
+            tileMatrixSetId: Annotated[Literal[tuple(factory.supported_tms.list())], Query(alias="tilematrixsetid")] = "WebMercatorQuad",
+            scale: Annotated[int, Query(gt=0, le=4, description="Tile size scale. 1=256x256, 2=512x512...")] = 1,
+            format: Annotated[ImageType, Query()] = None,
+            src_path=Depends(factory.path_dependency),
+            reader_params=Depends(factory.reader_dependency),
+            tile_params=Depends(factory.tile_dependency),
+            layer_params=Depends(factory.layer_dependency),
+            dataset_params=Depends(factory.dataset_dependency),
+            post_process=Depends(factory.process_dependency),
+            rescale=Depends(factory.rescale_dependency),
+            color_formula=Depends(factory.color_formula_dependency),
+            colormap=Depends(factory.colormap_dependency),
+            render_params=Depends(factory.render_dependency),
+            env=Depends(factory.environment_dependency),
+        ):
+            """Create several map tiles from a dataset."""
+            from rio_tiler.errors import TileOutsideBounds
+
+            requested = parse_tiles(tiles)
+            tms = factory.supported_tms.get(tileMatrixSetId)
+            images = {}
+            with rasterio.Env(**env):
+                with factory.reader(src_path, tms=tms, **reader_params.as_dict()) as src_dst:
+                    dst_colormap = getattr(src_dst, "colormap", None)
+                    for z, x, y in read_order(requested):
+                        try:
+                            images[(z, x, y)] = src_dst.tile(
+                                x,
+                                y,
+                                z,
+                                tilesize=scale * 256,
+                                **tile_params.as_dict(),
+                                **layer_params.as_dict(),
+                                **dataset_params.as_dict(),
+                            )
+                        except TileOutsideBounds:
+                            images[(z, x, y)] = None
+
+            render = dict(
+                post_process=post_process,
+                rescale=rescale,
+                color_formula=color_formula,
+                colormap=colormap or dst_colormap,
+                format=format,
+                render_params=render_params,
+            )
+            return multipart_response([(tile, render_tile(images[tile], **render)) for tile in requested])
+
+        move_to_front(factory.router)
+
+# The same endpoint on a MosaicTilerFactory. The mosaic document is read
+# once for all the tiles.
+class MosaicBatchTiles(FactoryExtension):
+    def register(self, factory):
+        @factory.router.get("/tiles/batch", **batch_endpoint_params)
+        def tiles_batch(
+            tiles: Annotated[str, Query(description=TILES_DESCRIPTION)],
+            tileMatrixSetId: Annotated[Literal[tuple(factory.supported_tms.list())], Query(alias="tilematrixsetid")] = "WebMercatorQuad",
+            scale: Annotated[int, Query(gt=0, le=4, description="Tile size scale. 1=256x256, 2=512x512...")] = 1,
+            format: Annotated[ImageType, Query()] = None,
+            src_path=Depends(factory.path_dependency),
+            backend_params=Depends(factory.backend_dependency),
+            reader_params=Depends(factory.reader_dependency),
+            layer_params=Depends(factory.layer_dependency),
+            dataset_params=Depends(factory.dataset_dependency),
+            pixel_selection=Depends(factory.pixel_selection_dependency),
+            tile_params=Depends(factory.tile_dependency),
+            post_process=Depends(factory.process_dependency),
+            rescale=Depends(factory.rescale_dependency),
+            color_formula=Depends(factory.color_formula_dependency),
+            colormap=Depends(factory.colormap_dependency),
+            render_params=Depends(factory.render_dependency),
+            env=Depends(factory.environment_dependency),
+        ):
+            """Create several map tiles from a MosaicJSON."""
+            from cogeo_mosaic.errors import NoAssetFoundError
+            from rio_tiler.errors import TileOutsideBounds
+            from titiler.mosaic.factory import MOSAIC_THREADS
+
+            requested = parse_tiles(tiles)
+            tms = factory.supported_tms.get(tileMatrixSetId)
+            images = {}
+            with rasterio.Env(**env):
+                with factory.backend(
+                    src_path,
+                    tms=tms,
+                    reader=factory.dataset_reader,
+                    reader_options=reader_params.as_dict(),
+                    **backend_params.as_dict(),
+                ) as src_dst:
+                    for z, x, y in read_order(requested):
+                        try:
+                            images[(z, x, y)], _ = src_dst.tile(
+                                x,
+                                y,
+                                z,
+                                pixel_selection=pixel_selection,
+                                tilesize=scale * 256,
+                                threads=MOSAIC_THREADS,
+                                **tile_params.as_dict(),
+                                **layer_params.as_dict(),
+                                **dataset_params.as_dict(),
+                            )
+                        except (NoAssetFoundError, TileOutsideBounds):
+                            images[(z, x, y)] = None
+
+            render = dict(
+                post_process=post_process,
+                rescale=rescale,
+                color_formula=color_formula,
+                colormap=colormap,
+                format=format,
+                render_params=render_params,
+            )
+            return multipart_response([(tile, render_tile(images[tile], **render)) for tile in requested])
+
+        move_to_front(factory.router)
+
+batch_endpoint_params = {
+    "response_class": Response,
+    "responses": {
+        200: {
+            "content": {"multipart/mixed": {}},
+            "description": "One part per requested tile, in request order. Each part has a "
+            "Content-Location of z/x/y; tiles without data have X-Tile-Status 404 and no body.",
+        }
+    },
+}
+
+# Extensions are registered after the factory's own routes, where
+# /tiles/{tileMatrixSetId} would match /tiles/batch first.
+def move_to_front(router):
+    router.routes.insert(0, router.routes.pop())
+
+# [(z, x, y), ...] from "z/x/y,z/x/y"; duplicates are dropped.
+def parse_tiles(tiles):
+    requested = []
+    for item in tiles.split(","):
+        if not item.strip():
+            continue
+        try:
+            z, x, y = (int(v) for v in item.strip().split("/"))
+        except ValueError:
+            raise HTTPException(400, f"Invalid tile {item!r}, expected z/x/y")
+        if (z, x, y) not in requested:
+            requested.append((z, x, y))
+    if not requested:
+        raise HTTPException(400, "No tiles requested")
+    if len(requested) > MAX_TILES:
+        raise HTTPException(400, f"Too many tiles: {len(requested)}, the maximum is {MAX_TILES}")
+    return requested
+
+def read_order(requested):
+    return sorted(requested, key=lambda tile: (tile[0], tile[2], tile[1]))
+
+# (content, media type) for a tile image, or None when it has no data.
+def render_tile(image, post_process, rescale, color_formula, colormap, format, render_params):
+    if image is None:
+        return None
+    if post_process:
+        image = post_process(image)
+    if rescale:
+        image.rescale(rescale)
+    if color_formula:
+        image.apply_color_formula(color_formula)
+    return render_image(image, output_format=format, colormap=colormap, **render_params.as_dict())
+
+def multipart_response(parts):
+    boundary = uuid.uuid4().hex
+    chunks = []
+    for (z, x, y), rendered in parts:
+        chunks.append(f"--{boundary}\r\nContent-Location: {z}/{x}/{y}\r\n".encode())
+        if rendered is None:
+            chunks.append(b"X-Tile-Status: 404\r\nContent-Length: 0\r\n\r\n\r\n")
+            continue
+        content, media_type = rendered
+        chunks.append(f"Content-Type: {media_type}\r\nContent-Length: {len(content)}\r\n\r\n".encode())
+        chunks.append(content)
+        chunks.append(b"\r\n")
+    chunks.append(f"--{boundary}--\r\n".encode())
+    return Response(b"".join(chunks), media_type=f"multipart/mixed; boundary={boundary}")
@@ -0,0 +1,271 @@
+"""Load test comparing the container and Lambda serving paths.
+
+Renders the tile workloads of bench_e2e.py from synthetic data behind the
+local S3 stand-in two ways: through handler.handler one request at a time,
+as each Lambda execution environment serves them, and through server.py
+with uvicorn workers under concurrent load, as a TitilerContainerStack task
+serves them (pinned to --vcpus CPUs). Reports throughput per vCPU and the
+cost per 1000 tiles of each, from the prices given (us-east-1 x86 by
+default). The Lambda path runs in a subprocess pinned to as many CPUs as
+its memory size gets vCPUs (rounded up). The container cost assumes tasks
+are busy --utilization of the time; Lambda is billed per request.
+--lambda-only skips the container path, which needs uvicorn.
+
+    cd resources && python benchmarks/bench_container.py --workers 2 --vcpus 2 --concurrency 8
+    python benchmarks/bench_container.py --workers 4 --vcpus 4 --memory-gb 8 --output container.json
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+RESOURCES = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, RESOURCES)
+sys.path.insert(0, os.path.dirname(RESOURCES))
+sys.path.insert(0, BENCHMARKS)
+
+from bench_e2e import BUCKET, prepare_data, workloads  # noqa: E402
+from bench_handler import environment, percentile  # noqa: E402
+from bench_image import free_port  # noqa: E402
+from events import function_url_event, lambda_context  # noqa: E402
+from s3_server import S3Server  # noqa: E402
+
+# Lambda allocates one vCPU per 1769 MB of memory.
+LAMBDA_MB_PER_VCPU = 1769
+
+TILE_WORKLOADS = ("cog_tile", "mosaicjson_tile")
+
+# (path, query string) of every tile request in the workloads within its
+# resource's bounds. The workloads also request neighbouring tiles, which
+# fall outside small resources at low zooms and are answered with a 404.
+def tile_requests(manifest, zooms):
+    import morecantile
+
+    tms = morecantile.tms.get("WebMercatorQuad")
+    loads = workloads(manifest, zooms)
+    requests = []
+    for name in TILE_WORKLOADS:
+        bounds = manifest[name.split("_")[0]]["bounds"]
+        for event in loads[name]:
+            z, x, y = (int(n) for n in event["rawPath"].split("@")[0].split("/")[-3:])
+            if morecantile.Tile(x, y, z) in tms.tiles(*bounds, zooms=[z]):
+                requests.append((event["rawPath"], event["rawQueryString"]))
+    return requests
+
+def latency_summary(latencies):
+    return {
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "mean_ms": round(statistics.mean(latencies), 2),
+    }
+
+# Sequential requests through the Lambda handler. Lambda bills each request
+# its duration, rounded up to the millisecond, times its memory.
+def run_lambda(requests, rounds, memory_size, prices):
+    from handler import handler
+
+    for path, query in requests:
+        handler(function_url_event("GET", path, query), lambda_context(memory_size))
+    latencies = []
+    for _ in range(rounds):
+        for path, query in requests:
+            start = time.perf_counter()
+            response = handler(function_url_event("GET", path, query), lambda_context(memory_size))
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response["statusCode"] != 200:
+                raise RuntimeError(f"{path} returned {response['statusCode']}")
+    vcpus = memory_size / LAMBDA_MB_PER_VCPU
+    billed_seconds = statistics.mean(math.ceil(ms) for ms in latencies) / 1000
+    cost = billed_seconds * memory_size / 1024 * prices["lambda_gb_second"] + prices["lambda_request"]
+    tiles_per_second = 1000 / statistics.mean(latencies)
+    return {
+        "memory_size": memory_size,
+        "vcpus": round(vcpus, 2),
+        "requests": len(latencies),
+        **latency_summary(latencies),
+        "tiles_per_second_per_environment": round(tiles_per_second, 1),
+        "tiles_per_second_per_vcpu": round(tiles_per_second / vcpus, 1),
+        "cost_per_1k_tiles": round(cost * 1000, 5),
+    }
+
+# The first `count` CPUs this process may run on, or None where CPU
+# affinity isn't supported.
+def pinned_cpus(count):
+    return sorted(os.sched_getaffinity(0))[:count] if hasattr(os, "sched_getaffinity") else None
+
+def pin(cpus):
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+
+# run_lambda in a fresh process pinned to the CPUs a Lambda environment of
+# memory_size gets, so it can't use more than the function would.
+def run_lambda_pinned(requests, rounds, memory_size, prices):
+    cpus = pinned_cpus(math.ceil(memory_size / LAMBDA_MB_PER_VCPU))
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1, initializer=pin, initargs=(cpus,)) as pool:
+        results = pool.apply(run_lambda, (requests, rounds, memory_size, prices))
+    results["pinned_cpus"] = len(cpus) if cpus else None
+    return results
+
+def start_server(port, workers, vcpus, env):
+    # Pin the server and its workers to as many CPUs as the task would get.
+    cpus = pinned_cpus(vcpus)
+    process = subprocess.Popen(
+        [sys.executable, "server.py"],
+        cwd=RESOURCES,
+        env={**os.environ, **env, "PORT": str(port), "TITILER_WORKERS": str(workers)},
+        preexec_fn=(lambda: pin(cpus)) if cpus else None,
+    )
+    deadline = time.perf_counter() + 60
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=5):
+                return process
+        except (urllib.error.URLError, ConnectionError):
+            if process.poll() is not None:
+                raise RuntimeError("server.py exited")
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("server.py did not become healthy")
+
+def fetch(url):
+    start = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=60) as response:
+        response.read()
+        status = response.status
+    if status != 200:
+        raise RuntimeError(f"{url} returned {status}")
+    return (time.perf_counter() - start) * 1000
+
+# Concurrent load against server.py for `duration` seconds. A Fargate task
+# is billed for its vCPUs and memory while it runs, whatever it serves.
+def run_container(requests, workers, vcpus, memory_gb, concurrency, duration, utilization, env, prices):
+    port = free_port()
+    process = start_server(port, workers, vcpus, env)
+    urls = [f"http://127.0.0.1:{port}{path}" + (f"?{query}" if query else "") for path, query in requests]
+    try:
+        # Every worker opens the datasets before the measurement.
+        for _ in range(workers):
+            for url in urls:
+                fetch(url)
+
+        latencies = []
+        lock = threading.Lock()
+        stop = time.perf_counter() + duration
+
+        def client(offset):
+            i = offset
+            while time.perf_counter() < stop:
+                elapsed = fetch(urls[i % len(urls)])
+                with lock:
+                    latencies.append(elapsed)
+                i += 1
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    tiles_per_second = len(latencies) / elapsed
+    task_hour = vcpus * prices["fargate_vcpu_hour"] + memory_gb * prices["fargate_gb_hour"]
+    cost = task_hour / (tiles_per_second * 3600 * utilization)
+    return {
+        "workers": workers,
+        "vcpus": vcpus,
+        "memory_gb": memory_gb,
+        "concurrency": concurrency,
+        "utilization": utilization,
+        "requests": len(latencies),
+        **latency_summary(latencies),
+        "tiles_per_second_per_task": round(tiles_per_second, 1),
+        "tiles_per_second_per_vcpu": round(tiles_per_second / vcpus, 1),
+        "cost_per_1k_tiles": round(cost * 1000, 5),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default=os.path.join(tempfile.gettempdir(), "titiler-e2e-data"))
+    parser.add_argument("--grid", type=int, default=3, help="mosaic is grid x grid COGs")
+    parser.add_argument("--size", type=int, default=2048, help="COG width and height in pixels")
+    parser.add_argument("--zoom", type=int, action="append", help="tile zooms (default 9 and 12)")
+    parser.add_argument("--profile", default="default", help="tuning profile from geoservices/lambda_environment.py")
+    parser.add_argument("--rounds", type=int, default=5, help="passes over the tiles through the Lambda handler")
+    parser.add_argument("--workers", type=int, default=2, help="uvicorn worker processes")
+    parser.add_argument("--vcpus", type=int, default=2, help="task vCPUs (the server is pinned to as many CPUs)")
+    parser.add_argument("--memory-gb", type=float, default=4, help="task memory, for its cost")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients against the container")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of container load")
+    parser.add_argument("--utilization", type=float, default=0.6, help="average share of the time tasks are busy")
+    parser.add_argument("--lambda-gb-second", type=float, default=0.0000166667)
+    parser.add_argument("--lambda-request", type=float, default=0.0000002)
+    parser.add_argument("--fargate-vcpu-hour", type=float, default=0.04048)
+    parser.add_argument("--fargate-gb-hour", type=float, default=0.004445)
+    parser.add_argument("--lambda-only", action="store_true", help="skip the container path")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    from geoservices.lambda_environment import tuning_profile
+
+    prices = {
+        "lambda_gb_second": args.lambda_gb_second,
+        "lambda_request": args.lambda_request,
+        "fargate_vcpu_hour": args.fargate_vcpu_hour,
+        "fargate_gb_hour": args.fargate_gb_hour,
+    }
+    manifest = prepare_data(args.data, args.grid, args.size)
+    requests = tile_requests(manifest, args.zoom or [9, 12])
+    server = S3Server(args.data).start()
+
+    memory_size, gdal_env = tuning_profile(args.profile)
+    env = {
+        **gdal_env,
+        **server.client_environment(),
+        "TITILER_S3_BUCKET": BUCKET,
+        "TITILER_BASE_URL": "map-tiles.princeton.edu",
+        "TITILER_COG_CACHE_DIR": os.path.join(tempfile.mkdtemp(), "cog-headers"),
+    }
+    os.environ.update(env)
+
+    results = {"environment": environment(), "profile": args.profile, "tiles": len(requests), "prices": prices}
+    results["lambda"] = run_lambda_pinned(requests, args.rounds, memory_size, prices)
+    if not args.lambda_only:
+        # As TitilerContainerStack sizes it: half the memory for GDAL's block
+        # cache, shared between the workers.
+        container_env = {**env, "GDAL_CACHEMAX": str(int(args.memory_gb * 1024) // (2 * args.workers))}
+        results["container"] = run_container(
+            requests, args.workers, args.vcpus, args.memory_gb, args.concurrency, args.duration, args.utilization,
+            container_env, prices,
+        )
+    server.shutdown()
+
+    print(f"{'path':<12}{'p50 ms':>9}{'p95 ms':>9}{'tiles/s/vCPU':>14}{'$/1k tiles':>12}")
+    for name in ("lambda", "container"):
+        if name not in results:
+            continue
+        stats = results[name]
+        print(f"{name:<12}{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}"
+              f"{stats['tiles_per_second_per_vcpu']:>14.1f}{stats['cost_per_1k_tiles']:>12.5f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+if __name__ == "__main__":
+    main()
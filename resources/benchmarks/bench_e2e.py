@@ -0,0 +1,148 @@
+"""Offline end-to-end tile benchmark.
+
+Generates synthetic COGs and a mosaic.json in the figgy-geo-{stage} layout,
+serves them from a local S3 stand-in (benchmarks/s3_server.py) and runs
+tile, tilejson and preview workloads through handler.handler with the GDAL
+environment the stack deploys. Reports latency and the requests and bytes
+each workload fetched from "S3", so GDAL settings, cache layers and titiler
+upgrades can be compared without touching AWS.
+
+    cd resources && python benchmarks/bench_e2e.py --output e2e.json
+    python benchmarks/bench_e2e.py --profile mosaic --env GDAL_HTTP_MERGE_CONSECUTIVE_RANGES=NO
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+RESOURCES = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RESOURCES)
+sys.path.insert(0, os.path.dirname(RESOURCES))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_handler import environment, percentile  # noqa: E402
+from events import function_url_event, lambda_context  # noqa: E402
+from s3_server import S3Server  # noqa: E402
+
+BUCKET = "figgy-geo-bench"
+
+def workloads(manifest, zooms):
+    from synthetic import center_tile
+
+    loads = {}
+    for service in ("cog", "mosaicjson"):
+        rid = manifest[service]["id"]
+        bounds = manifest[service]["bounds"]
+        tiles = []
+        for zoom in zooms:
+            z, x, y = center_tile(bounds, zoom)
+            tiles += [(z, x + dx, y + dy) for dx in (0, 1) for dy in (0, 1)]
+        loads[f"{service}_tile"] = [
+            function_url_event("GET", f"/{rid}/{service}/tiles/WebMercatorQuad/{z}/{x}/{y}@1x.png")
+            for z, x, y in tiles
+        ]
+        loads[f"{service}_tilejson"] = [
+            function_url_event("GET", f"/{rid}/{service}/WebMercatorQuad/tilejson.json")
+        ]
+    cog_id = manifest["cog"]["id"]
+    loads["cog_preview"] = [function_url_event("GET", f"/{cog_id}/cog/preview.png", "max_size=512")]
+    return loads
+
+def run_workload(handler, server, events, rounds):
+    first = None
+    latencies = []
+    fetched = []
+    statuses = set()
+    for i in range(rounds):
+        for event in events:
+            server.stats.reset()
+            t = time.perf_counter()
+            response = handler(event, lambda_context())
+            elapsed = (time.perf_counter() - t) * 1000
+            statuses.add(response["statusCode"])
+            if first is None:
+                first = elapsed
+            latencies.append(elapsed)
+            fetched.append(server.stats.snapshot())
+    return {
+        "status": sorted(statuses),
+        "requests": len(latencies),
+        "first_ms": round(first, 2),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "mean_ms": round(statistics.mean(latencies), 2),
+        "s3_requests_per_request": round(statistics.mean(f["requests"] for f in fetched), 2),
+        "s3_range_requests_per_request": round(statistics.mean(f["range_requests"] for f in fetched), 2),
+        "s3_kb_per_request": round(statistics.mean(f["bytes"] for f in fetched) / 1024, 1),
+        "first_s3_kb": round(fetched[0]["bytes"] / 1024, 1),
+    }
+
+def prepare_data(root, grid, size):
+    from synthetic import make_dataset
+
+    manifest_path = os.path.join(root, "manifest.json")
+    if not os.path.exists(manifest_path):
+        make_dataset(os.path.join(root, BUCKET), url_root=f"s3://{BUCKET}", grid=grid, size=size)
+        os.replace(os.path.join(root, BUCKET, "manifest.json"), manifest_path)
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default=os.path.join(tempfile.gettempdir(), "titiler-e2e-data"))
+    parser.add_argument("--grid", type=int, default=3, help="mosaic is grid x grid COGs")
+    parser.add_argument("--size", type=int, default=2048, help="COG width and height in pixels")
+    parser.add_argument("--zoom", type=int, action="append", help="tile zooms (default 9 and 12)")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--workload", action="append", help="run only these workloads")
+    parser.add_argument("--profile", default="default", help="tuning profile from geoservices/lambda_environment.py")
+    parser.add_argument("--env", action="append", default=[], help="KEY=VALUE overriding the GDAL environment")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    from geoservices.lambda_environment import tuning_profile
+
+    manifest = prepare_data(args.data, args.grid, args.size)
+    server = S3Server(args.data).start()
+
+    memory_size, gdal_env = tuning_profile(args.profile)
+    gdal_env.update(dict(item.split("=", 1) for item in args.env))
+    os.environ.update(gdal_env)
+    os.environ.update(server.client_environment())
+    os.environ["TITILER_S3_BUCKET"] = BUCKET
+    os.environ.setdefault("TITILER_BASE_URL", "map-tiles.princeton.edu")
+    os.environ.setdefault("TITILER_COG_CACHE_DIR", os.path.join(tempfile.mkdtemp(), "cog-headers"))
+
+    from handler import handler
+
+    results = {
+        "environment": environment(),
+        "profile": args.profile,
+        "memory_size": memory_size,
+        "gdal_environment": gdal_env,
+        "workloads": {},
+    }
+    print(f"{'workload':<20}{'first ms':>10}{'p50 ms':>9}{'p95 ms':>9}{'S3 req':>8}{'ranges':>8}{'KB/req':>9}")
+    for name, events in workloads(manifest, args.zoom or [9, 12]).items():
+        if args.workload and name not in args.workload:
+            continue
+        stats = run_workload(handler, server, events, args.rounds)
+        results["workloads"][name] = stats
+        print(f"{name:<20}{stats['first_ms']:>10.1f}{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}"
+              f"{stats['s3_requests_per_request']:>8.1f}{stats['s3_range_requests_per_request']:>8.1f}"
+              f"{stats['s3_kb_per_request']:>9.1f}")
+
+    server.shutdown()
+    # ru_maxrss is in KB on Linux.
+    results["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+if __name__ == "__main__":
+    main()
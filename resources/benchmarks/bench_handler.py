@@ -0,0 +1,178 @@
+"""Latency and allocation benchmark for the Lambda entry point.
+
+Drives handler.handler (Mangum, middleware and titiler) with synthetic Lambda
+Function URL events for COG and mosaic tiles, TileJSON documents and CORS
+preflight requests, against synthetic data on local disk. Reports p50, p95
+and p99 latency, requests per second and tracemalloc peak allocation per
+request, and can write the results as JSON and compare them with a previous
+run.
+
+    cd resources && python benchmarks/bench_handler.py --output bench.json
+    python benchmarks/bench_handler.py --compare bench.json --threshold 1.25
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from events import cors_preflight_event, function_url_event, lambda_context  # noqa: E402
+
+def scenarios(manifest, zoom):
+    from synthetic import center_tile
+
+    cog_id = manifest["cog"]["id"]
+    mosaic_id = manifest["mosaicjson"]["id"]
+    cz, cx, cy = center_tile(manifest["cog"]["bounds"], zoom)
+    mz, mx, my = center_tile(manifest["mosaicjson"]["bounds"], zoom)
+    return {
+        "cog_tile": lambda: function_url_event("GET", f"/{cog_id}/cog/tiles/WebMercatorQuad/{cz}/{cx}/{cy}@1x.png"),
+        "mosaicjson_tile": lambda: function_url_event("GET", f"/{mosaic_id}/mosaicjson/tiles/WebMercatorQuad/{mz}/{mx}/{my}@1x.png"),
+        "cog_tilejson": lambda: function_url_event("GET", f"/{cog_id}/cog/WebMercatorQuad/tilejson.json"),
+        "mosaicjson_tilejson": lambda: function_url_event("GET", f"/{mosaic_id}/mosaicjson/WebMercatorQuad/tilejson.json"),
+        "cors_preflight": lambda: cors_preflight_event(f"/{mosaic_id}/mosaicjson/WebMercatorQuad/tilejson.json"),
+    }
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def run_scenario(handler, make_event, iterations, warmup):
+    status = None
+    for _ in range(warmup):
+        response = handler(make_event(), lambda_context())
+        status = response["statusCode"]
+
+    latencies = []
+    response_bytes = 0
+    start = time.perf_counter()
+    for _ in range(iterations):
+        event = make_event()
+        t = time.perf_counter()
+        response = handler(event, lambda_context())
+        latencies.append((time.perf_counter() - t) * 1000)
+        body = response.get("body") or ""
+        response_bytes += len(base64.b64decode(body)) if response.get("isBase64Encoded") else len(body)
+    elapsed = time.perf_counter() - start
+
+    # Allocation is measured in a separate pass because tracemalloc slows
+    # every allocation down and would skew the latencies.
+    allocations = []
+    tracemalloc.start()
+    for _ in range(min(iterations, 20)):
+        event = make_event()
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        handler(event, lambda_context())
+        allocations.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    return {
+        "status": status,
+        "iterations": iterations,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(statistics.mean(latencies), 3),
+        "rps": round(iterations / elapsed, 1),
+        "alloc_peak_kb": round(statistics.median(allocations) / 1024, 1),
+        "response_bytes": response_bytes // iterations,
+    }
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    versions = {}
+    for package in ("titiler.core", "rio_tiler", "rasterio", "mangum", "starlette", "fastapi"):
+        try:
+            module = __import__(package, fromlist=["__version__"])
+            versions[package] = getattr(module, "__version__", None)
+        except ImportError:
+            versions[package] = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "versions": versions,
+    }
+
+# Scenarios whose p95 latency grew by more than `threshold` times.
+def regressions(results, baseline, threshold):
+    found = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous and current["p95_ms"] > previous["p95_ms"] * threshold:
+            found.append((name, previous["p95_ms"], current["p95_ms"]))
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--zoom", type=int, default=11)
+    parser.add_argument("--data", help="directory with synthetic data (generated when missing)")
+    parser.add_argument("--scenario", action="append", help="run only these scenarios")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    parser.add_argument("--threshold", type=float, default=1.25, help="allowed p95 growth against --compare")
+    args = parser.parse_args()
+
+    data = args.data or os.path.join(tempfile.gettempdir(), "titiler-bench-data")
+    manifest_path = os.path.join(data, "manifest.json")
+    if not os.path.exists(manifest_path):
+        from synthetic import make_dataset
+
+        make_dataset(data)
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    os.environ["TITILER_DATA_ROOT"] = data
+    os.environ.setdefault("TITILER_BASE_URL", "map-tiles.princeton.edu")
+    os.environ.setdefault("TITILER_S3_BUCKET", "figgy-geo-bench")
+    os.environ.setdefault("TITILER_COG_CACHE_DIR", os.path.join(tempfile.mkdtemp(), "cog-headers"))
+
+    import_start = time.perf_counter()
+    from handler import handler
+    import_ms = (time.perf_counter() - import_start) * 1000
+
+    results = {"environment": environment(), "import_ms": round(import_ms, 1), "scenarios": {}}
+    print(f"{'scenario':<22}{'status':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'rps':>9}{'alloc KB':>10}")
+    for name, make_event in scenarios(manifest, args.zoom).items():
+        if args.scenario and name not in args.scenario:
+            continue
+        stats = run_scenario(handler, make_event, args.iterations, args.warmup)
+        results["scenarios"][name] = stats
+        print(f"{name:<22}{stats['status']:>7}{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}"
+              f"{stats['p99_ms']:>9.2f}{stats['rps']:>9.1f}{stats['alloc_peak_kb']:>10.1f}")
+    print(f"import handler: {import_ms:.0f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        found = regressions(results, baseline, args.threshold)
+        for name, before, after in found:
+            print(f"REGRESSION {name}: p95 {before:.2f} ms -> {after:.2f} ms")
+        if found:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
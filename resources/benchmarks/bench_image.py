@@ -0,0 +1,171 @@
+"""Image size and cold start benchmark for the Lambda container image.
+
+Builds the image from resources/Dockerfile, reports its size and the largest
+packages in it, then measures cold starts in fresh containers: the time to
+`import handler` (the function's init) and, through the Runtime Interface
+Emulator in the Lambda base image, the time from starting a container to the
+first response of handler.handler. Run it after changing dependencies or the
+Dockerfile, and pass --compare with a previous run's output to fail on
+regressions.
+
+    cd resources && python benchmarks/bench_image.py --output image.json
+    python benchmarks/bench_image.py --compare image.json --threshold 1.1
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+RESOURCES = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, BENCHMARKS)
+
+from events import function_url_event  # noqa: E402
+
+IMPORT_TIME = "import time; start = time.perf_counter(); import {module}; print((time.perf_counter() - start) * 1000)"
+
+# Module the function's init imports, by Dockerfile target.
+ENTRY_MODULES = {"function": "handler", "streaming": "server", "container": "server"}
+
+# Sizes of the top level entries of the task root, in a container.
+PACKAGE_SIZES = """
+import json, os
+root = os.environ["LAMBDA_TASK_ROOT"]
+sizes = {}
+for name in os.listdir(root):
+    path = os.path.join(root, name)
+    total = os.path.getsize(path)
+    for directory, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(directory, f)) for f in files)
+    sizes[name] = total
+print(json.dumps(sizes))
+"""
+
+ENVIRONMENT = {
+    "TITILER_BASE_URL": "map-tiles.princeton.edu",
+    "TITILER_S3_BUCKET": "figgy-geo-bench",
+}
+
+def docker(*args, **kwargs):
+    return subprocess.run(["docker", *args], check=True, capture_output=True, text=True, **kwargs).stdout.strip()
+
+def build(tag, target):
+    start = time.perf_counter()
+    docker("build", "--target", target, "-t", tag, RESOURCES)
+    return time.perf_counter() - start
+
+def env_args():
+    args = []
+    for key, value in ENVIRONMENT.items():
+        args += ["-e", f"{key}={value}"]
+    return args
+
+def package_sizes(tag):
+    output = docker("run", "--rm", "--entrypoint", "python", tag, "-c", PACKAGE_SIZES)
+    return json.loads(output)
+
+def import_ms(tag, module):
+    return float(docker("run", "--rm", *env_args(), "--entrypoint", "python", tag, "-c", IMPORT_TIME.format(module=module)))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+# Milliseconds from starting a container to the response of its first
+# invocation, a /healthz Function URL event through the emulator.
+def first_invoke_ms(tag, timeout=60):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/2015-03-31/functions/function/invocations"
+    payload = json.dumps(function_url_event("GET", "/healthz")).encode()
+    start = time.perf_counter()
+    container = docker("run", "-d", "--rm", "-p", f"127.0.0.1:{port}:8080", *env_args(), tag)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(urllib.request.Request(url, data=payload), timeout=timeout) as response:
+                    body = json.loads(response.read())
+                if body.get("statusCode") != 200:
+                    raise RuntimeError(f"healthz returned {body.get('statusCode')}")
+                return (time.perf_counter() - start) * 1000
+            except (urllib.error.URLError, ConnectionError):
+                # The emulator isn't listening yet.
+                time.sleep(0.05)
+        raise RuntimeError("no response from the runtime interface emulator")
+    finally:
+        subprocess.run(["docker", "stop", "-t", "1", container], capture_output=True)
+
+def summary(values):
+    return {
+        "p50_ms": round(statistics.median(values), 1),
+        "max_ms": round(max(values), 1),
+        "runs": len(values),
+    }
+
+# Measures that grew by more than `threshold` times.
+def regressions(results, baseline, threshold):
+    found = []
+    measures = [
+        ("image_mb", lambda r: r.get("image_mb")),
+        ("import_p50_ms", lambda r: r.get("import", {}).get("p50_ms")),
+        ("first_invoke_p50_ms", lambda r: r.get("first_invoke", {}).get("p50_ms")),
+    ]
+    for name, get in measures:
+        before, after = get(baseline), get(results)
+        if before and after and after > before * threshold:
+            found.append((name, before, after))
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", default="function", choices=ENTRY_MODULES, help="Dockerfile target")
+    parser.add_argument("--tag", default="titiler-bench-image")
+    parser.add_argument("--runs", type=int, default=5, help="fresh containers per measurement")
+    parser.add_argument("--no-build", action="store_true", help="measure an already built --tag")
+    parser.add_argument("--top", type=int, default=15, help="largest packages to list")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    parser.add_argument("--threshold", type=float, default=1.1, help="allowed growth against --compare")
+    args = parser.parse_args()
+
+    results = {"target": args.target}
+    if not args.no_build:
+        results["build_s"] = round(build(args.tag, args.target), 1)
+    results["image_mb"] = round(int(docker("image", "inspect", "-f", "{{.Size}}", args.tag)) / 1e6, 1)
+    sizes = package_sizes(args.tag)
+    results["task_root_mb"] = round(sum(sizes.values()) / 1e6, 1)
+    results["packages_mb"] = {
+        name: round(size / 1e6, 2) for name, size in sorted(sizes.items(), key=lambda item: -item[1])[:args.top]
+    }
+    results["import"] = summary([import_ms(args.tag, ENTRY_MODULES[args.target]) for _ in range(args.runs)])
+    if args.target == "function":
+        results["first_invoke"] = summary([first_invoke_ms(args.tag) for _ in range(args.runs)])
+
+    print(f"image: {results['image_mb']} MB, task root: {results['task_root_mb']} MB")
+    for name, size in results["packages_mb"].items():
+        print(f"  {name:<40}{size:>8.2f} MB")
+    print(f"import {ENTRY_MODULES[args.target]}: p50 {results['import']['p50_ms']} ms, max {results['import']['max_ms']} ms")
+    if "first_invoke" in results:
+        print(f"first invoke: p50 {results['first_invoke']['p50_ms']} ms, max {results['first_invoke']['max_ms']} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        found = regressions(results, baseline, args.threshold)
+        for name, before, after in found:
+            print(f"REGRESSION {name}: {before} -> {after}")
+        if found:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
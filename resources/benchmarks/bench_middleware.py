@@ -0,0 +1,114 @@
+"""Per-request overhead of TitilerMiddleware.
+
+Runs the scenarios from tests/test_middleware.py straight through the ASGI
+callable (no HTTP client, no titiler).
+
+    cd resources && python benchmarks/bench_middleware.py [--iterations N]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("TITILER_BASE_URL", "map-tiles.princeton.edu")
+os.environ.setdefault("TITILER_S3_BUCKET", "figgy-geo-production")
+# Measure the rewriting itself rather than TileJSON cache hits.
+os.environ.setdefault("TITILER_TILEJSON_CACHE_SIZE", "0")
+
+from middleware import TitilerMiddleware  # noqa: E402
+
+TILEJSON = json.dumps({
+    "tilejson": "2.2.0",
+    "version": "1.0.0",
+    "scheme": "xyz",
+    "tiles": ["https://tiles.prod/mosaicjson/tiles/WebMercatorQuad/{z}/{x}/{y}@1x?url=s3%3A%2F%2Fgeo-production%2F24%2F43%2F18%2F2443189116dd4a28bdd7da1384deb51e%2Fmosaic.json"],
+    "minzoom": 8,
+    "maxzoom": 13,
+    "bounds": [67.50154032366855, 9.00205452967639, 94.49732854268473, 31.999615061786308],
+    "center": [80.99943443317665, 20.50083479573135, 8],
+}).encode()
+
+SCENARIOS = [
+    ("mosaicjson", "GET", "/123456/mosaicjson", b"stage=staging"),
+    ("cog", "GET", "/123456/cog", b"stage=production"),
+    ("cog tile", "GET", "/123456/cog/tiles/WebMercatorQuad/12/1205/1540@1x", b"rescale=0,255&bidx=1"),
+    ("mosaic tilejson", "GET", "/2443189116dd4a28bdd7da1384deb51e/mosaicjson/tilejson.json", b"stage=production"),
+    ("cog tilejson", "GET", "/2443189116dd4a28bdd7da1384deb51e/cog/tilejson.json", b"stage=production"),
+    ("cors preflight", "OPTIONS", "/2443189116dd4a28bdd7da1384deb51e/mosaicjson/tilejson.json", b"stage=production"),
+]
+
+HEADERS = [
+    (b"host", b"abcdefgh.lambda-url.us-east-1.on.aws"),
+    (b"accept", b"*/*"),
+    (b"accept-encoding", b"gzip, deflate, br"),
+    (b"user-agent", b"Mozilla/5.0"),
+    (b"origin", b"https://maps.princeton.edu"),
+    (b"x-forwarded-for", b"128.112.0.1"),
+]
+
+# Downstream stand-in for titiler: answers tilejson paths with a document
+# and everything else with an empty body.
+async def endpoint(scope, receive, send):
+    body = TILEJSON if "tilejson" in scope["path"] else b""
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+async def send(message):
+    pass
+
+def make_scope(method, path, query_string):
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "https",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query_string,
+        "headers": list(HEADERS),
+        "server": ("localhost", 443),
+        "client": ("128.112.0.1", 0),
+    }
+
+async def run(app, method, path, query_string, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await app(make_scope(method, path, query_string), receive, send)
+    elapsed = time.perf_counter() - start
+
+    # Scope construction isn't part of the middleware; measure and subtract it.
+    start = time.perf_counter()
+    for _ in range(iterations):
+        make_scope(method, path, query_string)
+    baseline = time.perf_counter() - start
+
+    return (elapsed - baseline) / iterations * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    app = TitilerMiddleware(endpoint)
+
+    print(f"{'scenario':<18}{'us':>10}")
+    for name, method, path, query_string in SCENARIOS:
+        # warm up
+        asyncio.run(run(app, method, path, query_string, 100))
+        print(f"{name:<18}{asyncio.run(run(app, method, path, query_string, args.iterations)):>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Synthetic Lambda events and context for driving handler.handler locally."""
+import time
+import uuid
+from types import SimpleNamespace
+
+DOMAIN = "abcdefgh.lambda-url.us-east-1.on.aws"
+
+# Lambda Function URL (payload format 2.0) request event, as CloudFront
+# forwards it to the titiler function.
+def function_url_event(method, path, query_string="", headers=None):
+    request_headers = {
+        "host": DOMAIN,
+        "accept": "*/*",
+        "accept-encoding": "gzip, deflate, br",
+        "origin": "https://maps.princeton.edu",
+        "user-agent": "Amazon CloudFront",
+        "x-forwarded-for": "128.112.0.1",
+        "x-forwarded-proto": "https",
+    }
+    request_headers.update(headers or {})
+    return {
+        "version": "2.0",
+        "routeKey": "$default",
+        "rawPath": path,
+        "rawQueryString": query_string,
+        "headers": request_headers,
+        "requestContext": {
+            "accountId": "anonymous",
+            "apiId": "abcdefgh",
+            "domainName": DOMAIN,
+            "domainPrefix": "abcdefgh",
+            "http": {
+                "method": method,
+                "path": path,
+                "protocol": "HTTP/1.1",
+                "sourceIp": "128.112.0.1",
+                "userAgent": "Amazon CloudFront",
+            },
+            "requestId": str(uuid.uuid4()),
+            "routeKey": "$default",
+            "stage": "$default",
+            "time": time.strftime("%d/%b/%Y:%H:%M:%S +0000", time.gmtime()),
+            "timeEpoch": int(time.time() * 1000),
+        },
+        "isBase64Encoded": False,
+    }
+
+def cors_preflight_event(path):
+    return function_url_event("OPTIONS", path, headers={
+        "access-control-request-method": "GET",
+        "access-control-request-headers": "content-type",
+    })
+
+def lambda_context(memory_mb=3008):
+    return SimpleNamespace(
+        function_name="titiler-local-TitilerFunction",
+        function_version="$LATEST",
+        invoked_function_arn="arn:aws:lambda:us-east-1:000000000000:function:titiler-local-TitilerFunction",
+        memory_limit_in_mb=memory_mb,
+        aws_request_id=str(uuid.uuid4()),
+        log_group_name="/aws/lambda/titiler-local",
+        log_stream_name="local",
+        get_remaining_time_in_millis=lambda: 600000,
+    )
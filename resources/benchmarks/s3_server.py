@@ -0,0 +1,167 @@
+"""Minimal local stand-in for S3, for offline benchmarks.
+
+Serves files under `root` as path-style objects (`/{bucket}/{key}` maps to
+`{root}/{bucket}/{key}`) with the parts of the S3 API that GDAL and boto3 use
+to read data: GET with byte ranges, HEAD, ETag and If-None-Match. Request
+signatures are not checked. Requests, range requests and bytes sent are
+counted so benchmarks can report what each request fetched.
+
+    python benchmarks/s3_server.py /tmp/titiler-e2e --port 9000
+"""
+import argparse
+import email.utils
+import hashlib
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+NOT_FOUND = (
+    b'<?xml version="1.0" encoding="UTF-8"?>'
+    b"<Error><Code>NoSuchKey</Code><Message>The specified key does not exist.</Message></Error>"
+)
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.range_requests = 0
+            self.bytes_sent = 0
+
+    def record(self, is_range, sent):
+        with self.lock:
+            self.requests += 1
+            self.range_requests += 1 if is_range else 0
+            self.bytes_sent += sent
+
+    def snapshot(self):
+        with self.lock:
+            return {"requests": self.requests, "range_requests": self.range_requests, "bytes": self.bytes_sent}
+
+class S3Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.serve(head=True)
+
+    def do_GET(self):
+        self.serve(head=False)
+
+    def serve(self, head):
+        path = os.path.join(self.server.root, unquote(urlsplit(self.path).path).lstrip("/"))
+        if not os.path.isfile(path):
+            self.respond(404, {"Content-Type": "application/xml"}, b"" if head else NOT_FOUND)
+            self.server.stats.record(False, 0)
+            return
+
+        etag = self.server.etag(path)
+        stat = os.stat(path)
+        headers = {
+            "ETag": etag,
+            "Last-Modified": email.utils.formatdate(stat.st_mtime, usegmt=True),
+            "Accept-Ranges": "bytes",
+            "Content-Type": "application/octet-stream",
+        }
+        if self.headers.get("If-None-Match") == etag:
+            self.respond(304, headers, b"")
+            self.server.stats.record(False, 0)
+            return
+
+        size = stat.st_size
+        start, end, status = 0, size - 1, 200
+        match = re.match(r"bytes=(\d*)-(\d*)$", self.headers.get("Range", ""))
+        if match:
+            first, last = match.groups()
+            if first:
+                start = int(first)
+                end = min(int(last), size - 1) if last else size - 1
+            else:
+                start = max(0, size - int(last))
+            if start >= size:
+                self.respond(416, {"Content-Range": f"bytes */{size}"}, b"")
+                self.server.stats.record(True, 0)
+                return
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+        length = end - start + 1
+        body = b""
+        if not head:
+            with open(path, "rb") as f:
+                f.seek(start)
+                body = f.read(length)
+        self.respond(status, headers, body, length)
+        self.server.stats.record(bool(match), len(body))
+
+    def respond(self, status, headers, body, length=None):
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(length if length is not None else len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+class S3Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, root, host="127.0.0.1", port=0):
+        super().__init__((host, port), S3Handler)
+        self.root = root
+        self.stats = Stats()
+        self._etags = {}
+
+    @property
+    def endpoint(self):
+        host, port = self.server_address[:2]
+        return f"{host}:{port}"
+
+    def etag(self, path):
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        if key not in self._etags:
+            with open(path, "rb") as f:
+                self._etags[key] = f'"{hashlib.md5(f.read()).hexdigest()}"'
+        return self._etags[key]
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    # Environment that points GDAL and boto3 at this server.
+    def client_environment(self):
+        return {
+            "AWS_S3_ENDPOINT": self.endpoint,
+            "AWS_HTTPS": "NO",
+            "AWS_VIRTUAL_HOSTING": "FALSE",
+            "AWS_ENDPOINT_URL_S3": f"http://{self.endpoint}",
+            "AWS_ACCESS_KEY_ID": "local",
+            "AWS_SECRET_ACCESS_KEY": "local",
+            "AWS_DEFAULT_REGION": "us-east-1",
+            "AWS_REGION": "us-east-1",
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("root")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+
+    server = S3Server(args.root, args.host, args.port)
+    print(f"serving {args.root} on http://{server.endpoint}")
+    for key, value in server.client_environment().items():
+        print(f"export {key}={value}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
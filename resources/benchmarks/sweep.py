@@ -0,0 +1,120 @@
+"""Parameter sweep over tuning profiles, GDAL settings and Lambda memory sizes.
+
+Runs benchmarks/bench_e2e.py once per combination of tuning profile and
+--set values, each in a fresh process (GDAL reads some settings only once),
+against the same synthetic data and local S3 stand-in. Reports tile latency,
+peak RSS and the cost per 1,000 tiles for each memory size.
+
+Memory sizes are modelled, not measured: Lambda gives a function one vCPU
+per 1769 MB, so below that latency is scaled up by the missing CPU share,
+and combinations whose peak RSS doesn't fit the memory size are marked as
+out of memory. Confirm a winner on a deployed stage before adopting it.
+
+    cd resources && python benchmarks/sweep.py --profile cog --profile mosaic \\
+        --set GDAL_CACHEMAX=256,800 --set VSI_CACHE_SIZE=5000000,25000000 \\
+        --memory 1024,2048,3008 --output sweep.json
+"""
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(os.path.dirname(BENCHMARKS)))
+
+# x86_64 Lambda pricing (us-east-1).
+PRICE_PER_GB_SECOND = 0.0000166667
+PRICE_PER_REQUEST = 0.20 / 1_000_000
+MB_PER_VCPU = 1769
+
+def combinations(settings):
+    keys = list(settings)
+    for values in itertools.product(*(settings[key] for key in keys)):
+        yield dict(zip(keys, values))
+
+def run_benchmark(profile, overrides, args):
+    with tempfile.NamedTemporaryFile(suffix=".json") as output:
+        command = [
+            sys.executable, os.path.join(BENCHMARKS, "bench_e2e.py"),
+            "--data", args.data,
+            "--rounds", str(args.rounds),
+            "--profile", profile,
+            "--output", output.name,
+        ]
+        for workload in args.workload:
+            command += ["--workload", workload]
+        for key, value in overrides.items():
+            command += ["--env", f"{key}={value}"]
+        subprocess.run(command, check=True, capture_output=True, text=True)
+        with open(output.name) as f:
+            return json.load(f)
+
+# Latency at `memory_mb`, scaling single-request CPU time by the CPU share.
+def modelled_ms(measured_ms, memory_mb):
+    return measured_ms * max(1.0, MB_PER_VCPU / memory_mb)
+
+def cost_per_1k(duration_ms, memory_mb):
+    gb_seconds = memory_mb / 1024 * duration_ms / 1000
+    return 1000 * (gb_seconds * PRICE_PER_GB_SECOND + PRICE_PER_REQUEST)
+
+def summarize(result, memory_sizes):
+    latencies = [w["p50_ms"] for w in result["workloads"].values()]
+    p95s = [w["p95_ms"] for w in result["workloads"].values()]
+    p50 = sum(latencies) / len(latencies)
+    p95 = sum(p95s) / len(p95s)
+    rows = []
+    for memory_mb in memory_sizes or [result["memory_size"]]:
+        duration = modelled_ms(p50, memory_mb)
+        rows.append({
+            "memory_mb": memory_mb,
+            "p50_ms": round(duration, 1),
+            "p95_ms": round(modelled_ms(p95, memory_mb), 1),
+            "peak_rss_mb": result["peak_rss_mb"],
+            "oom": result["peak_rss_mb"] > memory_mb,
+            "cost_per_1k_tiles": round(cost_per_1k(duration, memory_mb), 6),
+        })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profile", action="append", help="tuning profiles to start from (default: default)")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=V1,V2",
+                        help="values to sweep for a GDAL or rio-tiler setting")
+    parser.add_argument("--memory", help="comma separated memory sizes in MB (default: the profile's)")
+    parser.add_argument("--workload", action="append", help="bench_e2e workloads (default: cog_tile, mosaicjson_tile)")
+    parser.add_argument("--data", default=os.path.join(tempfile.gettempdir(), "titiler-e2e-data"))
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+    args.workload = args.workload or ["cog_tile", "mosaicjson_tile"]
+
+    settings = {}
+    for item in args.set:
+        key, values = item.split("=", 1)
+        settings[key] = values.split(",")
+    memory_sizes = [int(m) for m in args.memory.split(",")] if args.memory else None
+
+    rows = []
+    for profile in args.profile or ["default"]:
+        for overrides in combinations(settings):
+            result = run_benchmark(profile, overrides, args)
+            for row in summarize(result, memory_sizes):
+                rows.append({"profile": profile, "settings": overrides, **row})
+
+    rows.sort(key=lambda row: (row["oom"], row["cost_per_1k_tiles"]))
+    print(f"{'profile':<10}{'memory':>8}{'p50 ms':>9}{'p95 ms':>9}{'RSS MB':>8}{'$/1k tiles':>12}  settings")
+    for row in rows:
+        settings_text = " ".join(f"{k}={v}" for k, v in row["settings"].items())
+        cost = "OOM" if row["oom"] else f"{row['cost_per_1k_tiles']:.6f}"
+        print(f"{row['profile']:<10}{row['memory_mb']:>8}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}"
+              f"{row['peak_rss_mb']:>8.0f}{cost:>12}  {settings_text}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+
+if __name__ == "__main__":
+    main()
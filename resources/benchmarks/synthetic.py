@@ -0,0 +1,114 @@
+"""Synthetic COGs and mosaic.json documents in the figgy-geo-{stage} layout."""
+import hashlib
+import json
+import os
+
+import numpy
+import rasterio
+from rasterio.io import MemoryFile
+from rasterio.transform import from_bounds
+from rio_cogeo.cogeo import cog_translate
+from rio_cogeo.profiles import cog_profiles
+
+def resource_id(name):
+    return hashlib.md5(name.encode()).hexdigest()
+
+# {root}/12/34/56/123456/{file_name}, as routing.Resolver expects.
+def resource_path(root, rid, file_name):
+    return f"{root}/{rid[0:2]}/{rid[2:4]}/{rid[4:6]}/{rid}/{file_name}"
+
+# Write a 3 band uint8 COG covering bounds. The data is a gradient with
+# noise so that it compresses like a scanned map rather than a flat color.
+def make_cog(path, bounds, size=2048, seed=0):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    rng = numpy.random.default_rng(seed)
+    y, x = numpy.mgrid[0:size, 0:size]
+    bands = [
+        (x * 255 // size + rng.integers(0, 32, (size, size))) % 256,
+        (y * 255 // size + rng.integers(0, 32, (size, size))) % 256,
+        ((x + y) * 255 // (2 * size) + rng.integers(0, 32, (size, size))) % 256,
+    ]
+    profile = {
+        "driver": "GTiff",
+        "width": size,
+        "height": size,
+        "count": 3,
+        "dtype": "uint8",
+        "crs": "EPSG:4326",
+        "transform": from_bounds(*bounds, size, size),
+    }
+    with MemoryFile() as memfile:
+        with memfile.open(**profile) as dst:
+            dst.write(numpy.stack(bands).astype("uint8"))
+        with memfile.open() as src:
+            cog_translate(src, path, cog_profiles.get("deflate"), in_memory=True, quiet=True)
+    return path
+
+# Write a mosaic.json whose assets are `asset_urls`, with footprints `bounds`.
+def make_mosaic(path, asset_urls, asset_bounds, minzoom=8, maxzoom=12):
+    from cogeo_mosaic.mosaic import MosaicJSON
+
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [[[w, s], [e, s], [e, n], [w, n], [w, s]]],
+            },
+            "properties": {"path": url},
+        }
+        for url, (w, s, e, n) in zip(asset_urls, asset_bounds)
+    ]
+    mosaic = MosaicJSON.from_features(
+        features, minzoom, maxzoom, accessor=lambda f: f["properties"]["path"], quiet=True
+    )
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(mosaic.model_dump_json(exclude_none=True))
+    return path
+
+# Build one COG resource and one mosaic resource (a grid x grid set of COGs)
+# under `root`. Asset urls inside the mosaic are written against `url_root`,
+# which is `root` itself unless the files are served from somewhere else.
+def make_dataset(root, url_root=None, grid=2, size=1024, origin=(-74.8, 40.2), span=0.2):
+    url_root = url_root or root
+    west, south = origin
+
+    cog_id = resource_id("synthetic-cog")
+    cog_bounds = (west, south, west + span, south + span)
+    make_cog(resource_path(root, cog_id, "display_raster.tif"), cog_bounds, size=size)
+
+    asset_urls = []
+    asset_bounds = []
+    for i in range(grid):
+        for j in range(grid):
+            rid = resource_id(f"synthetic-asset-{i}-{j}")
+            bounds = (west + i * span, south + j * span, west + (i + 1) * span, south + (j + 1) * span)
+            make_cog(resource_path(root, rid, "display_raster.tif"), bounds, size=size, seed=i * grid + j)
+            asset_urls.append(resource_path(url_root, rid, "display_raster.tif"))
+            asset_bounds.append(bounds)
+
+    mosaic_id = resource_id("synthetic-mosaic")
+    make_mosaic(resource_path(root, mosaic_id, "mosaic.json"), asset_urls, asset_bounds)
+
+    manifest = {
+        "cog": {"id": cog_id, "bounds": cog_bounds},
+        "mosaicjson": {"id": mosaic_id, "bounds": (west, south, west + grid * span, south + grid * span)},
+    }
+    with open(os.path.join(root, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+    return manifest
+
+def center_tile(bounds, zoom):
+    import morecantile
+
+    tms = morecantile.tms.get("WebMercatorQuad")
+    w, s, e, n = bounds
+    tile = tms.tile((w + e) / 2, (s + n) / 2, zoom)
+    return tile.z, tile.x, tile.y
+
+if __name__ == "__main__":
+    import sys
+
+    root = sys.argv[1] if len(sys.argv) > 1 else "/tmp/titiler-synthetic"
+    print(json.dumps(make_dataset(root), indent=2))
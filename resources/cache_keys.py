@@ -0,0 +1,44 @@
+import json
+import os
+
+# Query parameters kept on tile requests (see cache_keys.json). The same list
+# is compiled into the CloudFront Function in geoservices/cache_keys.py.
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache_keys.json")) as f:
+    TILE_PARAMETERS = frozenset(json.load(f)["tile_parameters"])
+
+# Canonical form of a query string, as CloudFront computes it before the
+# cache lookup: parameter names are lowercased, parameters are sorted by name
+# (repeated parameters keep their order) and, on tile paths, parameters not
+# in TILE_PARAMETERS are dropped. Values are left encoded as received.
+#
+# Values of a repeated name are grouped the way CloudFront groups them in a
+# function event: by the name as sent, in order of first appearance, before
+# names differing only in case are merged.
+def canonical_query(path, query_string):
+    if not query_string:
+        return query_string
+    tiles = "/tiles/" in path
+    sent = {}
+    for item in query_string.split(b"&"):
+        if item:
+            name, _, value = item.partition(b"=")
+            sent.setdefault(name, []).append(value)
+    params = {}
+    for name, values in sent.items():
+        name = name.lower()
+        if tiles and name.decode("latin-1") not in TILE_PARAMETERS:
+            continue
+        params.setdefault(name, []).extend(values)
+    return b"&".join(name + b"=" + value for name in sorted(params) for value in params[name])
+
+# Middleware giving requests that reach the function directly the query
+# string CloudFront would have forwarded, so both produce the same response
+# for the same cache key. Replaces titiler's LowerCaseQueryStringMiddleware.
+class CanonicalQueryMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope.get("query_string"):
+            scope["query_string"] = canonical_query(scope["path"], scope["query_string"])
+        await self.app(scope, receive, send)
@@ -0,0 +1,190 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Small LRU cache for state kept across invocations of a warm Lambda
+# container. Entries can be bounded by count and by total size in bytes and
+# can expire after a ttl (in seconds). Hit/miss/eviction counters are kept so
+# that the usefulness of each cache can be checked from the logs.
+class LRUCache:
+    def __init__(self, maxsize=128, maxbytes=None, ttl=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.currbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, count=False) is not None
+
+    def get(self, key, default=None, count=True):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or self._expired(entry):
+                if count:
+                    self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            if count:
+                self.hits += 1
+            return entry[0]
+
+    # Return a value even if its ttl has passed, so that it can be revalidated
+    # instead of fetched again. Does not touch the counters or LRU order.
+    def peek(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            return default if entry is None else entry[0]
+
+    def set(self, key, value, size=0):
+        if self.maxsize <= 0 or (self.maxbytes is not None and size > self.maxbytes):
+            return
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.currbytes -= old[2]
+            self._data[key] = (value, expires, size)
+            self.currbytes += size
+            while len(self._data) > self.maxsize or (
+                self.maxbytes is not None and self.currbytes > self.maxbytes
+            ):
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self.currbytes -= evicted_size
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return default
+            self.currbytes -= entry[2]
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.currbytes = 0
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "bytes": self.currbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _expired(self, entry):
+        return entry[1] is not None and entry[1] <= time.monotonic()
+
+# Byte-budgeted LRU of files in a directory, used for caches under Lambda's
+# /tmp that outlive a single invocation. Recency is tracked in process and
+# mirrored to file mtimes, so a new process picks up the previous order.
+class DiskCache:
+    def __init__(self, directory, maxbytes):
+        self.directory = directory
+        self.maxbytes = maxbytes
+        self.currbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            self.misses += 1
+            return None
+
+        with self._lock:
+            entries = self._index()
+            if path in entries:
+                entries.move_to_end(path)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return data
+
+    # Read a file without touching the counters or LRU order.
+    def peek(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def set(self, key, data):
+        if len(data) > self.maxbytes:
+            return
+        path = self._path(key)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            entries = self._index()
+            self.currbytes -= entries.pop(path, 0)
+            entries[path] = len(data)
+            self.currbytes += len(data)
+            while self.currbytes > self.maxbytes and entries:
+                evicted, size = entries.popitem(last=False)
+                self.currbytes -= size
+                self.evictions += 1
+                try:
+                    os.remove(evicted)
+                except OSError:
+                    pass
+
+    def pop(self, key):
+        path = self._path(key)
+        with self._lock:
+            self.currbytes -= self._index().pop(path, 0)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            size = len(self._index())
+        return {
+            "size": size,
+            "bytes": self.currbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    # Files already on disk, oldest first; read once per process.
+    def _index(self):
+        if self._entries is None:
+            files = []
+            if os.path.isdir(self.directory):
+                for entry in os.scandir(self.directory):
+                    if entry.is_file() and not entry.name.endswith(".tmp"):
+                        stat = entry.stat()
+                        files.append((stat.st_mtime, entry.path, stat.st_size))
+            self._entries = OrderedDict((path, size) for _, path, size in sorted(files))
+            self.currbytes = sum(self._entries.values())
+        return self._entries
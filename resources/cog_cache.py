@@ -0,0 +1,155 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import attr
+import rasterio
+from rio_tiler.io import Reader
+
+import instrumentation
+from caches import DiskCache
+from storage import s3_client, split_s3_url
+
+# Parsed COG headers, stored as small JSON files under Lambda's /tmp so they
+# survive across invocations in the same execution environment. Each entry is
+# keyed by the dataset url and records the object's ETag, the layout GDAL
+# needs (size, overviews, block shapes, dtype, bounds) and header_size: the
+# offset of the first tile, i.e. the length of the header and IFDs at the
+# start of a COG. Entries older than ttl seconds are revalidated against the
+# object's current ETag; the directory is kept under maxbytes by dropping the
+# least recently used files. The ETag of a new entry is looked up in the
+# background, so the first open of a COG doesn't wait for an extra HEAD; an
+# entry still without one takes the object's ETag when it is revalidated.
+class CogHeaderCache:
+    def __init__(self, directory, maxbytes=64 * 1024 * 1024, ttl=300, max_header_size=4 * 1024 * 1024):
+        self.files = DiskCache(directory, maxbytes)
+        self.ttl = ttl
+        self.max_header_size = max_header_size
+        self.etags = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cog-etag")
+
+    def get(self, url):
+        data = self.files.get(url)
+        if data is None:
+            return None
+        entry = json.loads(data)
+
+        if time.time() - entry["checked"] > self.ttl:
+            etag = object_etag(url)
+            if entry["etag"] is not None and entry["etag"] != etag:
+                self.files.pop(url)
+                return None
+            entry["etag"] = etag
+            entry["checked"] = time.time()
+            self._write(url, entry)
+
+        return entry
+
+    def put(self, url, dataset, etag=None):
+        entry = header_metadata(dataset)
+        entry["url"] = url
+        entry["etag"] = etag
+        entry["checked"] = time.time()
+        self._write(url, entry)
+        if etag is None:
+            self.etags.submit(self._record_etag, url)
+        return entry
+
+    def _record_etag(self, url):
+        try:
+            etag = object_etag(url)
+            data = self.files.peek(url)
+            if data is None:
+                return
+            entry = json.loads(data)
+            if entry["etag"] is None:
+                entry["etag"] = etag
+                self._write(url, entry)
+        except Exception:
+            # Revalidation records it instead.
+            pass
+
+    def stats(self):
+        return self.files.stats()
+
+    def _write(self, url, entry):
+        self.files.set(url, json.dumps(entry, separators=(",", ":")).encode())
+
+# ETag of the object behind a dataset url. Local files (tests, benchmarks)
+# use their modification time and size instead.
+def object_etag(url):
+    if url.startswith("s3://"):
+        bucket, key = split_s3_url(url)
+        return s3_client().head_object(Bucket=bucket, Key=key)["ETag"]
+    stat = os.stat(url)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+def header_metadata(dataset):
+    overviews = dataset.overviews(1)
+    offsets = [dataset.get_tag_item("BLOCK_OFFSET_0_0", "TIFF", bidx=1)]
+    offsets += [dataset.get_tag_item("BLOCK_OFFSET_0_0", "TIFF", bidx=1, ovr=i) for i in range(len(overviews))]
+    offsets = [int(o) for o in offsets if o]
+    return {
+        "header_size": min(offsets) if offsets else None,
+        "width": dataset.width,
+        "height": dataset.height,
+        "count": dataset.count,
+        "dtypes": list(dataset.dtypes),
+        "nodata": dataset.nodata,
+        "crs": dataset.crs.to_string() if dataset.crs else None,
+        "bounds": list(dataset.bounds),
+        "transform": list(dataset.transform)[:6],
+        "overviews": overviews,
+        "block_shapes": [list(shape) for shape in dataset.block_shapes],
+    }
+
+header_cache = CogHeaderCache(
+    os.getenv("TITILER_COG_CACHE_DIR", "/tmp/titiler-cog-headers"),
+    maxbytes=int(os.getenv("TITILER_COG_CACHE_MB", "64")) * 1024 * 1024,
+    ttl=float(os.getenv("TITILER_COG_CACHE_TTL", "300")),
+)
+
+# rio-tiler Reader that uses the header cache. When the header layout of a
+# dataset is known, GDAL is told to ingest exactly that many bytes when it
+# opens the file, so the header and all IFDs arrive in a single range request
+# and tile reads go straight to the byte ranges they need.
+@attr.s
+class CogReader(Reader):
+    def __attrs_post_init__(self):
+        with instrumentation.stage("open"):
+            if self.dataset is None and self.input:
+                self.dataset = self._open(self.input)
+            super().__attrs_post_init__()
+
+    def tile(self, *args, **kwargs):
+        with instrumentation.stage("read"):
+            return super().tile(*args, **kwargs)
+
+    def part(self, *args, **kwargs):
+        with instrumentation.stage("read"):
+            return super().part(*args, **kwargs)
+
+    def preview(self, *args, **kwargs):
+        with instrumentation.stage("read"):
+            return super().preview(*args, **kwargs)
+
+    def _open(self, url):
+        entry = None
+        try:
+            entry = header_cache.get(url)
+        except Exception:
+            # The cache only ever saves requests; never fail a read because of it.
+            pass
+
+        header_size = entry and entry.get("header_size")
+        if header_size and header_size <= header_cache.max_header_size:
+            with rasterio.Env(GDAL_INGESTED_BYTES_AT_OPEN=header_size):
+                return self._ctx_stack.enter_context(rasterio.open(url))
+
+        dataset = self._ctx_stack.enter_context(rasterio.open(url))
+        if entry is None:
+            try:
+                header_cache.put(url, dataset)
+            except Exception:
+                pass
+        return dataset
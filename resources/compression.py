@@ -0,0 +1,65 @@
+import zlib
+
+from middleware import is_plain_json
+
+# Middleware gzipping JSON responses (TileJSON, info, statistics) for clients
+# that accept it, as the body is produced: each chunk is compressed and
+# flushed as it arrives, so a streamed response keeps its time to first byte
+# and the whole body is never held in memory. Images are already compressed
+# and are passed through, as are responses under `minimum_size` sent in one
+# message. Enabled with TITILER_COMPRESS_JSON; it has to run outside
+# TitilerMiddleware, which rewrites plain TileJSON bodies.
+class JSONCompressionMiddleware:
+    def __init__(self, app, minimum_size=500, level=6):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not accepts_gzip(scope):
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+
+        async def compressing_send(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                if is_plain_json(message.get("headers", [])):
+                    start = message
+                    return
+            elif message["type"] == "http.response.body" and start is not None:
+                body = message.get("body", b"")
+                more_body = message.get("more_body", False)
+                if compressor is None:
+                    if not more_body and len(body) < self.minimum_size:
+                        await send(start)
+                        start = None
+                        await send(message)
+                        return
+                    compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+                    await send({**start, "headers": compressed_headers(start.get("headers", []))})
+                if more_body:
+                    body = compressor.compress(body) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                else:
+                    body = compressor.compress(body) + compressor.flush()
+                await send({"type": "http.response.body", "body": body, "more_body": more_body})
+                return
+
+            await send(message)
+
+        await self.app(scope, receive, compressing_send)
+
+def accepts_gzip(scope):
+    for key, value in scope.get("headers", []):
+        if key == b"accept-encoding":
+            return b"gzip" in value
+    return False
+
+def compressed_headers(headers):
+    vary = [v for k, v in headers if k.lower() == b"vary"]
+    headers = [(k, v) for k, v in headers if k.lower() not in (b"content-length", b"vary")]
+    headers.append((b"content-encoding", b"gzip"))
+    headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+    return headers
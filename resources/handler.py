@@ -1,33 +1,18 @@
 """AWS Lambda handler."""
 import logging
-import middleware
-import urllib3
-import json
 from mangum import Mangum
-from titiler.application.main import app
-from titiler.application.settings import ApiSettings
-from fastapi import Response
-from starlette.middleware.cors import CORSMiddleware
-from titiler.core.middleware import LowerCaseQueryStringMiddleware
+from application import create_app
+import warmer
 
-# Reset middleware so we can apply our own settings
-app.user_middleware = []
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-app.add_middleware(LowerCaseQueryStringMiddleware)
-app.add_middleware(middleware.HostMiddleware)
-app.add_middleware(middleware.RewriteMiddleware)
-app.add_middleware(middleware.TileJSONMiddleware)
+app = create_app()
 
 logging.getLogger("mangum.lifespan").setLevel(logging.ERROR)
 logging.getLogger("mangum.http").setLevel(logging.ERROR)
 
-api_settings = ApiSettings()
+asgi_handler = Mangum(app, api_gateway_base_path=app.root_path, lifespan="auto")
 
-handler = Mangum(app, api_gateway_base_path=api_settings.root_path, lifespan="auto")
+def handler(event, context):
+    # Scheduled warm-up events skip Mangum and the ASGI app entirely.
+    if warmer.is_warmer_event(event):
+        return warmer.warm(event, context, app)
+    return asgi_handler(event, context)
@@ -0,0 +1,258 @@
+import contextvars
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from middleware import resource_from_path
+
+NAMESPACE = "Geoservices/TiTiler"
+
+_record = contextvars.ContextVar("titiler_request_record", default=None)
+_cold = True
+
+# Timings and counters for one request. Stages are the parts of a request we
+# can attribute: "open" (dataset or mosaic document open, i.e. header reads),
+# "read" (range reads, decoding and resampling inside rio-tiler, which GDAL
+# does in one pass) and "render" (post-processing and image encoding, from the
+# end of the last open or read to the start of the response). Whatever is left of the
+# total is framework and middleware time.
+class RequestRecord:
+    def __init__(self, resource_id=None, service=None, endpoint=None, cold=False):
+        self.start = time.perf_counter()
+        self.resource_id = resource_id
+        self.service = service
+        self.endpoint = endpoint
+        self.cold = cold
+        self.stages = {}
+        self.active = 0
+        self.last_stage_end = None
+        self.range_requests = 0
+        self.bytes_fetched = 0
+        self.status = None
+        self.response_start = None
+        self.lock = threading.Lock()
+
+    def add_stage(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_range(self, size):
+        with self.lock:
+            self.range_requests += 1
+            self.bytes_fetched += size
+
+    def timings(self):
+        total = (self.response_start or time.perf_counter()) - self.start
+        stages = dict(self.stages)
+        if self.last_stage_end is not None and self.response_start is not None:
+            stages["render"] = max(0.0, self.response_start - self.last_stage_end)
+        stages["middleware"] = max(0.0, total - sum(stages.values()))
+        stages["total"] = total
+        return {name: seconds * 1000 for name, seconds in stages.items()}
+
+def current():
+    return _record.get()
+
+# Wrap func to run in a copy of the caller's context, so work handed to a
+# thread pool (rio-tiler reads mosaic assets in one) is counted against the
+# request that submitted it. Each call gets its own copy: a context can't be
+# entered by two threads at once.
+def in_context(func):
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+
+    return run
+
+# Time a block as `name`. Nested stages are not counted separately, so a
+# mosaic read that opens and reads its assets is one "read".
+@contextmanager
+def stage(name):
+    record = current()
+    if record is None or record.active:
+        yield
+        return
+    record.active += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        record.active -= 1
+        record.add_stage(name, end - start)
+        record.last_stage_end = end
+
+# Optional Server-Timing headers and CloudWatch Embedded Metric Format log
+# lines for every request. EMF lines are plain JSON on stdout, which Lambda
+# ships to CloudWatch Logs and CloudWatch turns into metrics without an agent.
+# Metrics are dimensioned by service and endpoint; the resource id is logged
+# as a property (queryable with Logs Insights) rather than a dimension,
+# because every distinct dimension value is a billed custom metric.
+class InstrumentationMiddleware:
+    def __init__(self, app, server_timing=None, emf=None, trace_gdal=None, stream=None):
+        self.app = app
+        self.server_timing = enabled("TITILER_SERVER_TIMING") if server_timing is None else server_timing
+        self.emf = enabled("TITILER_EMF_METRICS") if emf is None else emf
+        self.stream = stream or sys.stdout
+        if enabled("TITILER_TRACE_GDAL") if trace_gdal is None else trace_gdal:
+            trace_gdal_requests()
+
+    async def __call__(self, scope, receive, send):
+        global _cold
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        resource = resource_from_path(scope["path"])
+        record = RequestRecord(*resource, cold=_cold) if resource else RequestRecord(cold=_cold)
+        _cold = False
+        token = _record.set(record)
+
+        async def instrumented_send(message):
+            if message["type"] == "http.response.start":
+                record.response_start = time.perf_counter()
+                record.status = message["status"]
+                if self.server_timing:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing_header(record).encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, instrumented_send)
+        finally:
+            _record.reset(token)
+            if self.emf:
+                self.stream.write(json.dumps(emf_entry(record)) + "\n")
+
+# One ColdStarts metric from each on-demand execution environment whose first
+# request ran its init, i.e. waited for it. Environments initialized for
+# provisioned concurrency (AWS_LAMBDA_INITIALIZATION_TYPE) or first used by
+# the warmer don't count, nor do health checks and warmer events posted by
+# the Lambda Web Adapter. Divided by the function's Invocations, this is the
+# cold start rate provisioned concurrency is sized against. Enabled with
+# TITILER_COLD_START_METRIC.
+class ColdStartMiddleware:
+    def __init__(self, app, stream=None):
+        self.app = app
+        self.stream = stream or sys.stdout
+
+    async def __call__(self, scope, receive, send):
+        global _cold_start_counted
+        if (
+            not _cold_start_counted
+            and scope["type"] == "http"
+            and scope.get("method") in ("GET", "HEAD")
+            and scope["path"] != "/healthz"
+        ):
+            _cold_start_counted = True
+            if _cold and os.getenv("AWS_LAMBDA_INITIALIZATION_TYPE", "on-demand") == "on-demand":
+                self.stream.write(json.dumps(cold_start_entry()) + "\n")
+        await self.app(scope, receive, send)
+
+_cold_start_counted = False
+
+# Called when the warmer has used this execution environment: later requests
+# are warm.
+def mark_warm():
+    global _cold
+    _cold = False
+
+def cold_start_entry():
+    return {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": NAMESPACE,
+                    "Dimensions": [["FunctionName"]],
+                    "Metrics": [{"Name": "ColdStarts", "Unit": "Count"}],
+                }
+            ],
+        },
+        "FunctionName": os.getenv("AWS_LAMBDA_FUNCTION_NAME", "local"),
+        "ColdStarts": 1,
+    }
+
+def enabled(name):
+    return os.getenv(name, "").lower() in ("1", "true", "yes", "on")
+
+def server_timing_header(record):
+    entries = [f"{name};dur={ms:.1f}" for name, ms in record.timings().items()]
+    if record.range_requests:
+        entries.append(f'ranges;desc="{record.range_requests}"')
+        entries.append(f'fetched;desc="{record.bytes_fetched}"')
+    entries.append(f'cold;desc="{int(record.cold)}"')
+    return ", ".join(entries)
+
+def emf_entry(record):
+    timings = record.timings()
+    metrics = {f"{name.capitalize()}Time": ms for name, ms in timings.items() if name != "total"}
+    metrics["Latency"] = timings["total"]
+    metrics["RangeRequests"] = record.range_requests
+    metrics["BytesFetched"] = record.bytes_fetched
+    units = {"RangeRequests": "Count", "BytesFetched": "Bytes"}
+    return {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": NAMESPACE,
+                    "Dimensions": [["Service"], ["Service", "Endpoint"], ["ColdStart"]],
+                    "Metrics": [
+                        {"Name": name, "Unit": units.get(name, "Milliseconds")} for name in metrics
+                    ],
+                }
+            ],
+        },
+        "Service": record.service or "other",
+        "Endpoint": record.endpoint or "other",
+        "ColdStart": str(record.cold).lower(),
+        "ResourceId": record.resource_id,
+        "Status": record.status,
+        **{name: round(value, 3) for name, value in metrics.items()},
+    }
+
+# GDAL reports each HTTP range request it makes ("S3: Downloading 0-16383
+# (https://...)") as a CPL_DEBUG message, which rasterio forwards to Python
+# logging. Counting those gives range requests and bytes fetched per request.
+# The first request of each open ("GetFileSize(...)") is counted too, but its
+# size isn't logged, so bytes fetched only covers the explicit range reads.
+# Debug messages cost time, so this is opt-in (TITILER_TRACE_GDAL).
+DOWNLOADING = re.compile(r"Downloading (\d+)-(\d+) \(")
+
+class GDALRequestCounter(logging.Handler):
+    def emit(self, record):
+        if record.levelno >= logging.WARNING:
+            # Warnings and errors still reach the normal log handlers.
+            logging.getLogger().handle(record)
+            return
+        request = current()
+        if request is None:
+            return
+        message = record.getMessage()
+        match = DOWNLOADING.search(message)
+        if match:
+            first, last = match.groups()
+            request.add_range(int(last) - int(first) + 1)
+        elif "GetFileSize(" in message:
+            request.add_range(0)
+
+_gdal_counter = None
+
+def trace_gdal_requests():
+    global _gdal_counter
+    if _gdal_counter is not None:
+        return
+    os.environ["CPL_DEBUG"] = "ON"
+    _gdal_counter = GDALRequestCounter()
+    for name in ("rasterio._env", "rasterio._err"):
+        logger = logging.getLogger(name)
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+        logger.addHandler(_gdal_counter)
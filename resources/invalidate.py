@@ -0,0 +1,228 @@
+"""Invalidate the cached tiles of updated resources and warm them again.
+
+Tile urls carry the resource id in their path (see tilejson_tile_url in
+middleware.py), so a resource's responses are all under /{id}/. The ids are
+coalesced into at most --max-paths wildcard paths (CloudFront allows 15
+wildcard invalidation paths in progress per distribution): one /{id}/* path
+per resource while they fit, otherwise /{prefix}* paths over ids that share
+the longest prefixes, which also invalidates other resources with those
+prefixes. Ids with no common prefix would be merged into /*, which fails
+unless --allow-all is given.
+
+Warm function containers keep serving a changed resource from their
+in-process caches until those expire (see IN_PROCESS_TTLS), and meanwhile
+CloudFront and the tile store write-back would cache the stale responses
+again. So the tool first waits --settle seconds, by default the longest of
+those ttls as configured on --function (or their defaults), then deletes
+the resources' tiles from the tile store, if given, and invalidates them.
+Once the invalidation has completed, each resource's TileJSON and its
+tiles in the lowest --zooms zoom levels are requested through CloudFront,
+so the first visitors find them cached.
+
+    python invalidate.py 1234567/cog abcdef/mosaicjson \\
+        --host map-tiles-staging.princeton.edu --store s3://bucket
+    python invalidate.py --from-file updated.txt --host map-tiles.princeton.edu --dry-run
+"""
+import argparse
+import json
+import logging
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+MAX_WILDCARD_PATHS = 15
+
+# The function's in-process caches and their default ttls in seconds. Each
+# can serve a resource's old data until its entry expires.
+IN_PROCESS_TTLS = {
+    "TITILER_TILE_CACHE_TTL": 300,
+    "TITILER_TILEJSON_CACHE_TTL": 300,
+    "TITILER_COG_CACHE_TTL": 300,
+    "TITILER_MOSAIC_CACHE_TTL": 300,
+    "TITILER_METADATA_CACHE_TTL": 300,
+    "TITILER_MISSING_RESOURCE_TTL": 60,
+}
+
+# Longest in-process cache ttl of a function with `environment` (its
+# configured environment variables), or of the defaults.
+def settle_seconds(environment=None):
+    environment = environment or {}
+    return max(float(environment.get(name, default)) for name, default in IN_PROCESS_TTLS.items())
+
+def function_environment(client, function):
+    response = client.get_function_configuration(FunctionName=function)
+    return response.get("Environment", {}).get("Variables", {})
+
+# Invalidation paths covering `resource_ids`, at most `max_paths` of them.
+# Starting from one group per id (in sorted order), the two neighbouring
+# groups with the longest common prefix are merged until few enough remain;
+# a merged group is invalidated by its common prefix. Merging groups without
+# a common prefix would invalidate the whole distribution, which raises a
+# ValueError unless allow_all is given.
+def invalidation_paths(resource_ids, max_paths=MAX_WILDCARD_PATHS, allow_all=False):
+    groups = [[resource_id] for resource_id in sorted(set(resource_ids))]
+    while len(groups) > max_paths:
+        lengths = [len(common_prefix(a[0], b[-1])) for a, b in zip(groups, groups[1:])]
+        if max(lengths) == 0 and not allow_all:
+            raise ValueError(
+                f"{len(groups)} groups of ids without a common prefix can't be coalesced into {max_paths} paths "
+                "without invalidating /*; split the batch or pass --allow-all"
+            )
+        i = lengths.index(max(lengths))
+        groups[i:i + 2] = [groups[i] + groups[i + 1]]
+    return [group_path(group) for group in groups]
+
+def group_path(group):
+    if len(group) == 1:
+        return f"/{group[0]}/*"
+    return f"/{common_prefix(group[0], group[-1])}*"
+
+def common_prefix(a, b):
+    n = 0
+    while n < min(len(a), len(b)) and a[n] == b[n]:
+        n += 1
+    return a[:n]
+
+def distribution_id(client, host):
+    for page in client.get_paginator("list_distributions").paginate():
+        for distribution in page.get("DistributionList", {}).get("Items", []):
+            if host in distribution.get("Aliases", {}).get("Items", []):
+                return distribution["Id"]
+    raise RuntimeError(f"no CloudFront distribution has the alias {host}")
+
+def invalidate(client, distribution, paths, wait=True):
+    response = client.create_invalidation(
+        DistributionId=distribution,
+        InvalidationBatch={
+            "Paths": {"Quantity": len(paths), "Items": paths},
+            "CallerReference": f"invalidate-{time.time_ns()}",
+        },
+    )
+    invalidation = response["Invalidation"]["Id"]
+    if wait:
+        client.get_waiter("invalidation_completed").wait(DistributionId=distribution, Id=invalidation)
+    return invalidation
+
+# (status, body) of a GET request; status is None when the request failed
+# without a response (connection error or timeout).
+def fetch(url, timeout=60):
+    request = urllib.request.Request(url, headers={"User-Agent": "geoservices-invalidate"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, b""
+    except (urllib.error.URLError, OSError, TimeoutError) as e:
+        logger.warning("could not fetch %s: %s", url, e)
+        return None, b""
+
+# Urls to warm for a resource: its TileJSON and the tiles of its lowest
+# `zooms` zoom levels, from the TileJSON's tile url template.
+def warm_urls(base_url, resource_id, service, zooms, tms_id="WebMercatorQuad", fetch=fetch):
+    import morecantile
+
+    tilejson_url = f"{base_url}/{resource_id}/{service}/{tms_id}/tilejson.json"
+    status, body = fetch(tilejson_url)
+    if status != 200:
+        raise RuntimeError(f"{resource_id}/{service}: tilejson returned {status}")
+    tilejson = json.loads(body)
+    minzoom = tilejson["minzoom"]
+    maxzoom = min(tilejson["maxzoom"], minzoom + zooms - 1)
+    template = tilejson["tiles"][0]
+    tms = morecantile.tms.get(tms_id)
+    tiles = tms.tiles(*tilejson["bounds"], zooms=list(range(minzoom, maxzoom + 1)))
+    return [tilejson_url] + [template.format(z=t.z, x=t.x, y=t.y) for t in tiles]
+
+def warm(urls, concurrency=8, fetch=fetch):
+    summary = {"ok": 0, "empty": 0, "errors": 0}
+    with ThreadPoolExecutor(concurrency) as pool:
+        for status, _ in pool.map(fetch, urls):
+            if status == 200:
+                summary["ok"] += 1
+            elif status is None or status >= 500:
+                summary["errors"] += 1
+            else:
+                summary["empty"] += 1
+    return summary
+
+def read_resources(args):
+    resources = list(args.resources)
+    if args.from_file:
+        with open(args.from_file) as f:
+            resources += [line.strip() for line in f if line.strip()]
+    parsed = []
+    for resource in resources:
+        resource_id, _, service = resource.partition("/")
+        parsed.append((resource_id, service or "cog"))
+    return parsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("resources", nargs="*", help='updated resources as "{id}/cog" or "{id}/mosaicjson"')
+    parser.add_argument("--from-file", help="file with one resource per line")
+    parser.add_argument("--host", required=True, help="CloudFront alias, e.g. map-tiles.princeton.edu")
+    parser.add_argument("--distribution", help="distribution id (default: looked up by --host)")
+    parser.add_argument("--max-paths", type=int, default=MAX_WILDCARD_PATHS)
+    parser.add_argument("--allow-all", action="store_true", help="allow coalescing the ids into /*")
+    parser.add_argument("--function", help="name or ARN of the TiTiler function, whose cache ttls --settle defaults to")
+    parser.add_argument("--settle", type=float,
+                        help="seconds to wait for in-process caches to expire (default: the longest ttl)")
+    parser.add_argument("--store", help="tile store (s3://bucket/prefix or directory) to delete the tiles from")
+    parser.add_argument("--zooms", type=int, default=3, help="zoom levels to warm from each resource's minzoom")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--no-warm", action="store_true", help="don't wait for the invalidation or warm")
+    parser.add_argument("--dry-run", action="store_true", help="print the invalidation paths only")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    resources = read_resources(args)
+    if not resources:
+        parser.error("no resources given")
+    try:
+        paths = invalidation_paths([resource_id for resource_id, _ in resources], args.max_paths, args.allow_all)
+    except ValueError as e:
+        parser.error(str(e))
+    for path in paths:
+        print(path)
+    if "/*" in paths:
+        logger.warning("invalidating every path on %s", args.host)
+    if args.dry_run:
+        return
+
+    import boto3
+
+    settle = args.settle
+    if settle is None:
+        settle = settle_seconds(function_environment(boto3.client("lambda"), args.function) if args.function else None)
+    if settle > 0:
+        print(f"waiting {settle:.0f}s for in-process caches to expire")
+        time.sleep(settle)
+
+    if args.store:
+        from tile_store import open_tile_store
+
+        store = open_tile_store(args.store)
+        deleted = sum(store.delete_prefix(f"{resource_id}/") for resource_id in {r for r, _ in resources})
+        print(f"deleted {deleted} tiles from {args.store}")
+
+    client = boto3.client("cloudfront")
+    distribution = args.distribution or distribution_id(client, args.host)
+    invalidation = invalidate(client, distribution, paths, wait=not args.no_warm)
+    print(f"invalidation {invalidation} on {distribution}")
+    if args.no_warm:
+        return
+
+    base_url = f"https://{args.host}"
+    urls = []
+    for resource_id, service in resources:
+        try:
+            urls += warm_urls(base_url, resource_id, service, args.zooms)
+        except RuntimeError as e:
+            logger.warning("%s", e)
+    print(json.dumps({"urls": len(urls), **warm(urls, args.concurrency)}))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""Precomputed metadata sidecars for COG resources.
+
+Run `python metadata_sidecar.py 1234567 abcdef ...` (with TITILER_S3_BUCKET
+or TITILER_DATA_ROOT set) to write display_raster.tif.meta.json next to each
+resource's COG: its info, bounds, statistics and TileJSON as the function
+renders them, and the COG's ETag. MetadataSidecarMiddleware answers those
+requests from the sidecar while the ETag still matches, without GDAL opening
+the COG.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+from caches import LRUCache
+from middleware import resource_url
+from routing import RESOURCE_ID, ROUTES
+from storage import error_status, s3_client, split_s3_url
+
+logger = logging.getLogger(__name__)
+
+SIDECAR_SUFFIX = ".meta.json"
+VERSION = 1
+
+# Endpoints answered from a sidecar, by the path after "/{id}/{service}/".
+ENDPOINTS = {
+    "info": "info",
+    "bounds": "bounds",
+    "statistics": "statistics",
+    "WebMercatorQuad/tilejson.json": "tilejson",
+}
+
+# Identifies the current version of a COG: its S3 ETag, or the size and
+# modification time of a local file.
+def source_etag(url):
+    if url.startswith("s3://"):
+        from botocore.exceptions import ClientError
+
+        bucket, key = split_s3_url(url)
+        try:
+            return s3_client().head_object(Bucket=bucket, Key=key)["ETag"]
+        except ClientError as e:
+            if error_status(e) in (403, 404):
+                return None
+            raise
+    try:
+        stat = os.stat(url)
+    except FileNotFoundError:
+        return None
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+def read_sidecar(url):
+    if url.startswith("s3://"):
+        from botocore.exceptions import ClientError
+
+        bucket, key = split_s3_url(url + SIDECAR_SUFFIX)
+        try:
+            body = s3_client().get_object(Bucket=bucket, Key=key)["Body"].read()
+        except ClientError as e:
+            if error_status(e) in (403, 404):
+                return None
+            raise
+    else:
+        try:
+            with open(url + SIDECAR_SUFFIX, "rb") as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+    try:
+        document = json.loads(body)
+    except ValueError:
+        logger.warning("ignoring invalid metadata sidecar for %s", url)
+        return None
+    return document if document.get("version") == VERSION else None
+
+# Sidecars of the COGs requested recently. An entry is (sidecar, COG ETag):
+# the sidecar when it matched the COG's ETag, or None when there was no
+# current sidecar. Looking a resource up costs one GET of its sidecar, plus
+# a HEAD of the COG when there is a sidecar to check; once the ttl has
+# passed, an entry with a sidecar is revalidated with a HEAD alone. Lookups
+# run off the event loop.
+class MetadataSidecars:
+    def __init__(self, maxsize=1024, ttl=300):
+        self.sidecars = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.lookups = ThreadPoolExecutor(max_workers=4, thread_name_prefix="metadata-sidecar")
+
+    async def get(self, url):
+        entry = self.sidecars.get(url)
+        if entry is not None:
+            return entry[0]
+        try:
+            entry = await asyncio.wrap_future(self.lookups.submit(self.lookup, url, self.sidecars.peek(url)))
+        except Exception as e:
+            # Not cached: S3 errors are retried by the next request.
+            logger.warning("could not look up the metadata sidecar for %s: %s", url, e)
+            return None
+        self.sidecars.set(url, entry)
+        return entry[0]
+
+    def lookup(self, url, expired=None):
+        if expired is not None and expired[0] is not None:
+            etag = source_etag(url)
+            if etag == expired[1]:
+                return expired
+        document = read_sidecar(url)
+        if document is None:
+            return None, None
+        etag = source_etag(url)
+        if etag is None or document.get("etag") != etag:
+            return None, etag
+        return document, etag
+
+# Middleware answering GET requests for a COG's info, bounds, statistics and
+# WebMercatorQuad TileJSON from its metadata sidecar (see the module
+# docstring), for the services routed to titiler's cog router. Only
+# requests without other parameters than the global access token, checked
+# as titiler checks it, are answered: the sidecar holds the responses for
+# the default parameters. Anything else, and resources without a current
+# sidecar, go on to titiler. Enabled with TITILER_METADATA_SIDECARS; it runs
+# before TitilerMiddleware rewrites the path.
+class MetadataSidecarMiddleware:
+    def __init__(self, app, sidecars=None, base_url=None, access_token=None, routes=ROUTES):
+        self.app = app
+        self.sidecars = sidecars if sidecars is not None else metadata_sidecars()
+        self.host = base_url or os.getenv("TITILER_BASE_URL")
+        self.access_token = access_token or os.getenv("TITILER_API_GLOBAL_ACCESS_TOKEN")
+        self.services = {service for service, route in routes.items() if route.router == "cog"}
+
+    async def __call__(self, scope, receive, send):
+        endpoint = None
+        if scope["type"] == "http" and scope.get("method") == "GET" and self.default_parameters(scope.get("query_string", b"")):
+            # "/{id}/{service}/{endpoint}"
+            parts = scope["path"].split("/", 3)
+            if len(parts) == 4 and parts[2] in self.services and RESOURCE_ID.fullmatch(parts[1]):
+                endpoint = ENDPOINTS.get(parts[3])
+        if endpoint is None:
+            await self.app(scope, receive, send)
+            return
+
+        sidecar = await self.sidecars.get(resource_url(parts[1], parts[2]))
+        response = sidecar["responses"].get(endpoint) if sidecar is not None else None
+        if response is None:
+            await self.app(scope, receive, send)
+            return
+
+        if endpoint == "tilejson":
+            host = self.host or dict(scope["headers"]).get(b"host", b"").decode()
+            response = {**response, "tiles": [f"{scope.get('scheme', 'https')}://{host}{path}" for path in response["tiles"]]}
+        body = json.dumps(response).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    # Whether a query string asks for the default parameters: none, or only
+    # the valid access token when titiler requires one.
+    def default_parameters(self, query_string):
+        if not self.access_token:
+            return not query_string
+        return parse_qsl(query_string.decode("latin-1"), keep_blank_values=True) == [("access_token", self.access_token)]
+
+def metadata_sidecars():
+    return MetadataSidecars(
+        maxsize=int(os.getenv("TITILER_METADATA_CACHE_SIZE", "1024")),
+        ttl=float(os.getenv("TITILER_METADATA_CACHE_TTL", "300")),
+    )
+
+# Render a resource's metadata responses with `app` and write its sidecar.
+# The ETag is read first, so a COG replaced while the sidecar is built leaves
+# a sidecar that no longer matches rather than new responses under the old
+# ETag.
+def write_sidecar(app, resource_id, service="cog"):
+    from seed import asgi_get
+
+    url = resource_url(resource_id, service)
+    etag = source_etag(url)
+    if etag is None:
+        raise RuntimeError(f"{url} not found")
+    token = os.getenv("TITILER_API_GLOBAL_ACCESS_TOKEN")
+    query = {"access_token": token} if token else None
+    responses = {}
+    for path, endpoint in ENDPOINTS.items():
+        status, _, body = asgi_get(app, f"/{resource_id}/{service}/{path}", query)
+        if status != 200:
+            raise RuntimeError(f"{resource_id}/{service}/{path} returned {status}")
+        responses[endpoint] = json.loads(body)
+    # Tile urls are stored as paths; the middleware adds the host it serves.
+    tilejson = responses["tilejson"]
+    tilejson["tiles"] = [urlsplit(tile).path for tile in tilejson["tiles"]]
+
+    data = json.dumps({"version": VERSION, "etag": etag, "responses": responses}, separators=(",", ":")).encode()
+    if url.startswith("s3://"):
+        bucket, key = split_s3_url(url + SIDECAR_SUFFIX)
+        s3_client().put_object(Bucket=bucket, Key=key, Body=data, ContentType="application/json")
+    else:
+        with open(url + SIDECAR_SUFFIX, "wb") as f:
+            f.write(data)
+    return len(data)
+
+def main():
+    parser = argparse.ArgumentParser(description="Write metadata sidecars for COG resources.")
+    parser.add_argument("resources", nargs="*", help='resource ids, or "{id}/{service}" for a service other than cog')
+    parser.add_argument("--from-file", help="file with one resource per line")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    resources = list(args.resources)
+    if args.from_file:
+        with open(args.from_file) as f:
+            resources += [line.strip() for line in f if line.strip()]
+    if not resources:
+        parser.error("no resources given")
+
+    from application import create_app
+
+    # Render with titiler itself, not from existing sidecars.
+    os.environ.pop("TITILER_METADATA_SIDECARS", None)
+    app = create_app()
+
+    def write(resource):
+        resource_id, _, service = resource.partition("/")
+        try:
+            return resource, write_sidecar(app, resource_id, service or "cog"), None
+        except Exception as e:
+            return resource_id, None, e
+
+    failed = 0
+    with ThreadPoolExecutor(args.workers) as pool:
+        for resource, size, error in pool.map(write, resources):
+            if error is not None:
+                failed += 1
+                print(f"{resource}: {error}")
+            else:
+                print(f"{resource}: {size} bytes")
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,111 +1,217 @@
-import urllib3
-from starlette.datastructures import URL, QueryParams
-from starlette.requests import Request
+from urllib.parse import parse_qs, parse_qsl, quote_plus, urlencode, urlsplit
 import json
 import os
-
-# Middleware adds the CloudFront alternative hostname (e.g. map-tiles.princeton.edu)
-# to a header so that TiTiler can generate TileJSON documents with the correct url.
-class HostMiddleware:
-    def __init__(self, app):
-        self.app = app
-
-    async def __call__(self, scope, receive, send):
-        if scope["type"] not in (
-          "http"
-        ):
-            await self.app(scope, receive, send)
+from caches import LRUCache
+import routing
+
+# CloudFront prefixes tile requests that have a query string with this path
+# so they miss the pre-rendered tile store and fall back to the function.
+DYNAMIC_PREFIX = "/_dynamic/"
+
+# Services that can be addressed by resource id (see routing.py).
+ROUTES = routing.ROUTES
+
+# Root of the geodata layout: the stage's bucket, or TITILER_DATA_ROOT when
+# set (e.g. a local directory for benchmarks).
+def data_root(bucket=None):
+    return os.getenv("TITILER_DATA_ROOT") or f"s3://{bucket or os.getenv('TITILER_S3_BUCKET')}"
+
+# url of the file backing a service for a resource id, e.g.
+# ("123456", "cog") -> s3://figgy-geo-staging/12/34/56/123456/display_raster.tif
+def resource_url(resource_id, service, bucket=None):
+    return f"{data_root(bucket)}/{resource_id[0:2]}/{resource_id[2:4]}/{resource_id[4:6]}/{resource_id}/{ROUTES[service].file_name}"
+
+# Rewritten TileJSON documents, keyed by the original request path (which holds
+# the resource id) and query string. Repeated viewer requests are then answered
+# without calling titiler. The ttl bounds how long an updated resource can be
+# served stale from a warm container.
+def tilejson_cache():
+    return LRUCache(
+        maxsize=int(os.getenv("TITILER_TILEJSON_CACHE_SIZE", "512")),
+        ttl=float(os.getenv("TITILER_TILEJSON_CACHE_TTL", "300")),
+    )
+
+# Run the app and rewrite the tile url in its TileJSON response. The body is
+# buffered across http.response.body messages and Content-Length is fixed up;
+# error, non-JSON and already-encoded responses are passed through unparsed.
+# Rewritten documents are stored in the cache, which callers check first.
+async def rewrite_tilejson(app, scope, receive, send, cache=None, cache_key=None):
+    start = None
+    chunks = []
+
+    async def buffered_send(message):
+        nonlocal start
+        if message["type"] == "http.response.start":
+            if message["status"] == 200 and is_plain_json(message.get("headers", [])):
+                start = message
+                return
+        elif message["type"] == "http.response.body" and start is not None:
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(chunks)
+            try:
+                obj = json.loads(body)
+                obj["tiles"] = [tilejson_tile_url(obj["tiles"][0])]
+                body = json.dumps(obj).encode()
+            except (ValueError, KeyError, IndexError, TypeError):
+                await send(start)
+                await send({"type": "http.response.body", "body": body})
+                return
+
+            headers = [(k, v) for k, v in start.get("headers", []) if k.lower() != b"content-length"]
+            headers.append((b"content-length", str(len(body)).encode()))
+            if cache is not None:
+                cache.set(cache_key, (headers, body))
+
+            await send({**start, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
             return
 
-        headers = dict(scope["headers"])
-        headers[b"host"] = bytes(os.getenv("TITILER_BASE_URL"), 'utf-8')
-        scope["headers"] = [(k, v) for k, v in headers.items()]
-
-        await self.app(scope, receive, send)
-
-# Middleware to rewrite requests URLs before passing to TiTiler.
-# https://map-tiles.princeton.edu/{id}/{service} ->
-# https://map-tiles.princeton.edu/{service}?url=s3://{bucket}/{path}
-#
-# Examples:
-#   https://map-tiles.princeton.edu/1234567/mosaicjson
-#   https://map-tiles.princeton.edu/mosaicjson?url=s3://figgy-geo-production/12/34/56/1234567/mosaic.json
-#
-#   https://map-tiles.princeton.edu/1234567/cog ->
-#   https://map-tiles.princeton.edu/cog?url=s3://figgy-geo-production/12/34/56/1234567/display_raster.tif
-class RewriteMiddleware:
-    def __init__(self, app):
+        await send(message)
+
+    await app(scope, receive, buffered_send)
+
+async def send_cached_tilejson(send, cached):
+    headers, body = cached
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+def is_plain_json(headers):
+    content_type = b""
+    for key, value in headers:
+        key = key.lower()
+        if key == b"content-encoding" and value != b"identity":
+            return False
+        if key == b"content-type":
+            content_type = value
+    return b"json" in content_type
+
+# Middleware between the public urls and titiler, in one pass:
+# - rewrites "/{id}/{service}/..." to "/{router}/...?url=s3://{bucket}/{path}",
+#   e.g. /1234567/cog/info ->
+#   /cog/info?url=s3://figgy-geo-production/12/34/56/1234567/display_raster.tif
+# - sets the Host header to the CloudFront alternative hostname
+#   (TITILER_BASE_URL, e.g. map-tiles.princeton.edu) so TiTiler generates
+#   TileJSON documents with the correct url;
+# - rewrites the tile url of TileJSON responses to carry the resource id in
+#   the path, so the CloudFront cache can be invalidated per resource.
+# Settings are read once when the middleware is built, resource urls are
+# memoized by routing.Resolver and the ASGI scope is edited in place, so a
+# warm Lambda does no per-request Request/URL parsing.
+class TitilerMiddleware:
+    def __init__(self, app, base_url=None, bucket=None, routes=ROUTES):
         self.app = app
+        base_url = base_url or os.getenv("TITILER_BASE_URL")
+        self.host = base_url.encode() if base_url else None
+        self.routes = dict(routes)
+        self.resolver = routing.resolver(data_root(bucket), self.routes)
+        self.tilejson_cache = tilejson_cache()
 
     async def __call__(self, scope, receive, send):
-        if scope["type"] not in (
-          "http"
-        ):
+        if scope["type"] != "http":
             await self.app(scope, receive, send)
             return
 
-        request = Request(scope)
-
-        url = URL(scope=scope)
-        path = url.path
-        base_path = path.split('/')
-        item_id = base_path[1]
-
-        if (len(base_path) > 2 and base_path[2] == 'mosaicjson'):
-            item_url = self.s3_url(item_id, "mosaic.json")
-            base_path.pop(1)
-            url = url.include_query_params(url=item_url)
-            request.scope["path"] = '/'.join(base_path)
-            request.scope["query_string"] = url.query
-        elif (len(base_path) > 2 and base_path[2] == 'cog'):
-            item_url = self.s3_url(item_id, "display_raster.tif")
-            base_path.pop(1)
-            url = url.include_query_params(url=item_url)
-            request.scope["path"] = '/'.join(base_path)
-            request.scope["query_string"] = url.query
-
-        await self.app(scope, receive, send)
-
-    def s3_url(self, resource_id, file_name):
-        path = f"{resource_id[0:2]}/{resource_id[2:4]}/{resource_id[4:6]}/{resource_id}/{file_name}"
-        bucket = os.getenv("TITILER_S3_BUCKET")
-        return f"s3://{bucket}/{path}"
-
-# Middleware to intercept a tilejson document response and generate
-# a new tile url value with the id of the resource in the path. This is
-# to allow the CloudFront cache to be invalidated when the data is updated.
-class TileJSONMiddleware:
-    def __init__(self, app):
-        self.app = app
-
-    async def __call__(self, scope, receive, send):
-        if scope["type"] != "http" or "tilejson" not in scope["path"]:
+        path = scope["path"]
+        if path.startswith(DYNAMIC_PREFIX):
+            path = path[len(DYNAMIC_PREFIX) - 1:]
+            scope["path"] = path
+        is_tilejson = "tilejson" in path and scope.get("method") == "GET"
+        if is_tilejson:
+            cache_key = (path, scope.get("query_string", b""))
+            cached = self.tilejson_cache.get(cache_key)
+            if cached is not None:
+                await send_cached_tilejson(send, cached)
+                return
+
+        # "/{id}/{service}/..." -> ["", id, service, ...]
+        parts = path.split("/", 3)
+        route = self.routes.get(parts[2]) if len(parts) > 2 else None
+        item_url = None
+        if route is not None:
+            item_id = parts[1]
+            item_url = await self.resolver.resolve(item_id, route.service)
+            if item_url is None:
+                await routing.send_not_found(send)
+                return
+            scope["path"] = f"/{route.router}{path[len(item_id) + len(route.service) + 2:]}"
+            scope["query_string"] = self.add_url_param(scope.get("query_string", b""), item_url)
+
+        if self.host is not None:
+            headers = [(k, v) for k, v in scope["headers"] if k != b"host"]
+            headers.append((b"host", self.host))
+            scope["headers"] = headers
+
+        status = None
+        if item_url is not None:
+            app_send = send
+
+            async def send(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                await app_send(message)
+
+        if is_tilejson:
+            await rewrite_tilejson(self.app, scope, receive, send, self.tilejson_cache, cache_key)
+        else:
             await self.app(scope, receive, send)
-            return
-        elif "method" in scope.keys() and scope["method"] != "GET":
-            # Do not process tilejson for OPTIONS method (used in CORS preflight request)
-            await self.app(scope, receive, send)
-            return
-
-        async def update_tilejson(message):
-            if message["type"] == "http.response.body":
-                # convert json string to dict
-                obj = json.loads(message["body"].decode())
-
-                # get tiles url and extract the resource id
-                tile_url = URL(obj["tiles"][0])
-                query_params = QueryParams(tile_url.query)
-                resource_id = query_params["url"].split("/")[-2]
-
-                # generate a new tile url with id in path and no url parameter
-                tile_url = tile_url.remove_query_params("url")
-                path = f"/{resource_id}{tile_url.path}"
-                tile_url = URL(scheme=tile_url.scheme, netloc=tile_url.netloc, path=path)
-
-                # insert tile url into json object and replace message body
-                obj["tiles"] = [f"{tile_url}"]
-                message["body"] = json.dumps(obj).encode()
-
-            await send(message)
 
-        await self.app(scope, receive, update_tilejson)
+        if status in routing.FAILED_OPEN_STATUSES:
+            await self.resolver.failed(item_url)
+
+    @staticmethod
+    def add_url_param(query_string, item_url):
+        encoded = quote_plus(item_url).encode()
+        if not query_string:
+            return b"url=" + encoded
+        if query_string.startswith(b"url=") or b"&url=" in query_string:
+            # Rare: the client sent its own url parameter, which is replaced.
+            params = [
+                (k, v)
+                for k, v in parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)
+                if k != "url"
+            ]
+            params.append(("url", item_url))
+            return urlencode(params).encode()
+        return query_string + b"&url=" + encoded
+
+# Endpoint names by the first path segment after "/{id}/{service}/". Paths
+# embed coordinates, sizes and matrix set ids, so only these names are used
+# as metric dimensions; anything else is "other".
+ENDPOINTS = {
+    "tiles": "tiles",
+    "bbox": "bbox",
+    "point": "point",
+    "preview": "preview",
+    "info": "info",
+    "statistics": "statistics",
+}
+
+# ("{id}", "{service}", "{endpoint}") for a "/{id}/{service}/..." path, or
+# None. The endpoint is one of ENDPOINTS' names, "batch" for batch tile
+# requests, "tilejson" or "other".
+def resource_from_path(path, routes=ROUTES):
+    if path.startswith(DYNAMIC_PREFIX):
+        path = path[len(DYNAMIC_PREFIX) - 1:]
+    parts = path.split("/", 3)
+    if len(parts) < 3 or parts[2] not in routes:
+        return None
+    rest = parts[3] if len(parts) > 3 else ""
+    if rest.startswith("tiles/batch"):
+        endpoint = "batch"
+    elif rest.endswith("/tilejson.json") or rest == "tilejson.json":
+        endpoint = "tilejson"
+    else:
+        first = rest.split("/", 1)[0].split(".", 1)[0]
+        endpoint = ENDPOINTS.get(first, "other")
+    return parts[1], parts[2], endpoint
+
+# Replace a titiler tile url (".../{service}/tiles/...?url=s3://.../{id}/file")
+# with one that carries the resource id in the path and no query string.
+def tilejson_tile_url(tile_url):
+    parts = urlsplit(tile_url)
+    resource_id = parse_qs(parts.query)["url"][0].split("/")[-2]
+    return f"{parts.scheme}://{parts.netloc}/{resource_id}{parts.path}"
@@ -0,0 +1,258 @@
+import json
+import logging
+import os
+import sys
+import threading
+
+import attr
+import rasterio
+from attrs import define
+from botocore.exceptions import ClientError
+from cogeo_mosaic.backends import MosaicBackend as DefaultMosaicBackend
+from cogeo_mosaic.backends.s3 import S3Backend
+from cogeo_mosaic.backends.utils import _decompress_gz, get_hash
+from cogeo_mosaic.errors import _HTTP_EXCEPTIONS, MosaicError, NoAssetFoundError
+from cogeo_mosaic.mosaic import MosaicJSON
+from fastapi import Depends
+from rio_tiler.errors import PointOutsideBounds
+from rio_tiler.mosaic import mosaic_reader
+from rio_tiler.tasks import multi_values
+from titiler.mosaic import factory
+
+import instrumentation
+from caches import LRUCache
+from quadkey_index import SIDECAR_SUFFIX, QuadkeyIndex
+from storage import error_status, s3_client, split_s3_url
+
+logger = logging.getLogger(__name__)
+
+# Parsed mosaic.json documents kept across invocations of a warm container.
+# Entries are bounded by an estimate of their in-memory size and, once older
+# than the ttl, are revalidated with a conditional GET on their ETag instead
+# of being downloaded and parsed again.
+class MosaicDocumentCache:
+    def __init__(self, maxbytes=256 * 1024 * 1024, maxsize=64, ttl=300):
+        self.documents = LRUCache(maxsize=maxsize, maxbytes=maxbytes, ttl=ttl)
+        self.revalidations = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+
+    # (mosaic definition, QuadkeyIndex or None) for url. fetch(etag) returns
+    # (body, etag) or None when the document is unchanged; fetch_sidecar()
+    # returns the document's index sidecar or None.
+    def get(self, url, fetch, fetch_sidecar=None):
+        entry = self.documents.get(url)
+        if entry is not None:
+            return entry[:2]
+
+        cached = self.documents.peek(url)
+        if cached is not None:
+            with self._lock:
+                self.revalidations += 1
+        elif fetch_sidecar is not None:
+            cached = read_sidecar(fetch_sidecar)
+
+        result = fetch(cached[2]) if cached is not None and cached[2] else fetch(None)
+        if result is None:
+            with self._lock:
+                self.not_modified += 1
+            self.documents.set(url, cached, size=cached[3])
+            return cached[:2]
+
+        body, etag = result
+        if url.endswith(".gz"):
+            body = _decompress_gz(body)
+        mosaic_def = MosaicJSON(**json.loads(body))
+        index = None
+        if is_web_mercator(mosaic_def):
+            index = QuadkeyIndex.from_tiles(mosaic_def.tiles, mosaic_def.quadkey_zoom or mosaic_def.minzoom)
+        if index is not None:
+            # The index answers asset lookups, so only it and the definition
+            # without its tiles are kept; document() rebuilds the tiles for
+            # the few endpoints that need them.
+            mosaic_def = mosaic_def.model_copy(update={"tiles": {}})
+        size = mosaic_sizeof(mosaic_def) + (index.nbytes if index is not None else 0)
+        self.documents.set(url, (mosaic_def, index, etag, size), size=size)
+        logger.info("mosaic cache %s", json.dumps(self.stats()))
+        return mosaic_def, index
+
+    def stats(self):
+        stats = self.documents.stats()
+        stats["revalidations"] = self.revalidations
+        stats["not_modified"] = self.not_modified
+        return stats
+
+    def clear(self):
+        self.documents.clear()
+
+# Cache entry from a mosaic's index sidecar, or None when there is none. The
+# sidecar records the ETag of the document it was built from; the caller
+# checks it with a conditional GET before using the entry, which costs a 304
+# instead of downloading and parsing the whole document.
+def read_sidecar(fetch_sidecar):
+    data = fetch_sidecar()
+    if data is None:
+        return None
+    try:
+        index, metadata = QuadkeyIndex.from_bytes(data)
+    except ValueError:
+        logger.warning("ignoring invalid mosaic index sidecar")
+        return None
+    # The sidecar stores the definition without its tiles, as the cache does.
+    mosaic_def = MosaicJSON(**metadata["mosaic"])
+    return mosaic_def, index, metadata.get("etag"), mosaic_sizeof(mosaic_def) + index.nbytes
+
+def is_web_mercator(mosaic_def):
+    tms = mosaic_def.tilematrixset
+    return tms is None or tms.id == "WebMercatorQuad"
+
+# Approximate memory held by a parsed mosaic; the quadkey -> assets map
+# dominates it.
+def mosaic_sizeof(mosaic_def):
+    size = sys.getsizeof(mosaic_def.tiles)
+    for quadkey, assets in mosaic_def.tiles.items():
+        size += sys.getsizeof(quadkey) + sys.getsizeof(assets)
+        size += sum(sys.getsizeof(asset) for asset in assets)
+    return size
+
+documents = MosaicDocumentCache(
+    maxbytes=int(os.getenv("TITILER_MOSAIC_CACHE_MB", "256")) * 1024 * 1024,
+    ttl=float(os.getenv("TITILER_MOSAIC_CACHE_TTL", "300")),
+)
+
+# S3 backend that reads mosaic documents through the process-wide cache and
+# shares one S3 client, instead of creating a client and parsing the
+# document on every request. Assets for a tile are looked up in the
+# document's QuadkeyIndex. With TITILER_MOSAIC_SIDECARS set, a document is
+# first loaded from its index sidecar (mosaic.json.idx, written by
+# quadkey_index.py) when there is one. When there is an index, mosaic_def
+# has no tiles; document() is the full definition.
+@attr.s
+class CachedS3Backend(S3Backend):
+    index = attr.ib(default=None, init=False)
+
+    def document(self):
+        if self.index is None:
+            return self.mosaic_def
+        return self.mosaic_def.model_copy(update={"tiles": self.index.tiles()})
+
+    @property
+    def mosaicid(self):
+        return get_hash(**self.document().model_dump(exclude_none=True))
+
+    @property
+    def _quadkeys(self):
+        if self.index is None:
+            return super()._quadkeys
+        return self.index.quadkey_strings()
+
+    def __attrs_post_init__(self):
+        self.client = self.client or s3_client()
+        with instrumentation.stage("open"):
+            super().__attrs_post_init__()
+
+    # As S3Backend.tile and point, with the per-asset reader bound to the
+    # request's context so range reads in rio-tiler's threads are counted.
+    def tile(self, x, y, z, reverse=False, **kwargs):
+        with instrumentation.stage("read"):
+            assets = self.assets_for_tile(x, y, z)
+            if not assets:
+                raise NoAssetFoundError(f"No assets found for tile {z}-{x}-{y}")
+            if reverse:
+                assets = list(reversed(assets))
+
+            def _reader(asset, x, y, z, **kwargs):
+                with self.reader(asset, tms=self.tms, **self.reader_options) as src_dst:
+                    return src_dst.tile(x, y, z, **kwargs)
+
+            return mosaic_reader(assets, instrumentation.in_context(_reader), x, y, z, **kwargs)
+
+    def point(self, lon, lat, coord_crs=None, reverse=False, **kwargs):
+        coord_crs = coord_crs or self.tms.rasterio_geographic_crs
+        assets = self.assets_for_point(lon, lat, coord_crs=coord_crs)
+        if not assets:
+            raise NoAssetFoundError(f"No assets found for point ({lon},{lat})")
+        if reverse:
+            assets = list(reversed(assets))
+
+        def _reader(asset, lon, lat, coord_crs, **kwargs):
+            with self.reader(asset, **self.reader_options) as src_dst:
+                return src_dst.point(lon, lat, coord_crs=coord_crs, **kwargs)
+
+        kwargs.setdefault("allowed_exceptions", (PointOutsideBounds,))
+        values = multi_values(assets, instrumentation.in_context(_reader), lon, lat, coord_crs, **kwargs)
+        return list(values.items())
+
+    def _read(self):
+        fetch_sidecar = self._fetch_sidecar if os.getenv("TITILER_MOSAIC_SIDECARS") else None
+        mosaic_def, self.index = documents.get(self.input, self._fetch, fetch_sidecar)
+        return mosaic_def
+
+    def get_assets(self, x, y, z):
+        if self.index is None:
+            return super().get_assets(x, y, z)
+        assets = self.index.assets_for_tile(x, y, z)
+        if self.mosaic_def.asset_prefix:
+            assets = [self.mosaic_def.asset_prefix + asset for asset in assets]
+        return assets
+
+    def _fetch_sidecar(self):
+        bucket, key = split_s3_url(self.input)
+        try:
+            return self.client.get_object(Bucket=bucket, Key=key + SIDECAR_SUFFIX)["Body"].read()
+        except ClientError as e:
+            if error_status(e) in (403, 404):
+                return None
+            raise
+
+    def _fetch(self, etag):
+        bucket, key = split_s3_url(self.input)
+        kwargs = {"IfNoneMatch": etag} if etag else {}
+        try:
+            response = self.client.get_object(Bucket=bucket, Key=key, **kwargs)
+        except ClientError as e:
+            status_code = error_status(e)
+            if status_code == 304:
+                return None
+            exc = _HTTP_EXCEPTIONS.get(status_code, MosaicError)
+            raise exc(e.response["Error"]["Message"]) from e
+
+        body = response["Body"].read()
+        self._file_byte_size = len(body)
+        return body, response.get("ETag")
+
+# MosaicTilerFactory whose "/" endpoint serves the full document of a cached
+# mosaic, as titiler's serves mosaic_def.
+@define(kw_only=True)
+class MosaicTilerFactory(factory.MosaicTilerFactory):
+    def read(self):
+        @self.router.get(
+            "/",
+            response_model=MosaicJSON,
+            response_model_exclude_none=True,
+            responses={200: {"description": "Return MosaicJSON definition"}},
+        )
+        def read(
+            src_path=Depends(self.path_dependency),
+            backend_params=Depends(self.backend_dependency),
+            reader_params=Depends(self.reader_dependency),
+            env=Depends(self.environment_dependency),
+        ):
+            """Read a MosaicJSON"""
+            with rasterio.Env(**env):
+                with self.backend(
+                    src_path,
+                    reader=self.dataset_reader,
+                    reader_options=reader_params.as_dict(),
+                    **backend_params.as_dict(),
+                ) as src_dst:
+                    if isinstance(src_dst, CachedS3Backend):
+                        return src_dst.document()
+                    return src_dst.mosaic_def
+
+# Drop-in for cogeo_mosaic.backends.MosaicBackend that routes s3:// mosaics
+# through CachedS3Backend.
+def MosaicBackend(input, *args, **kwargs):
+    if input.startswith("s3://"):
+        return CachedS3Backend(input, *args, **kwargs)
+    return DefaultMosaicBackend(input, *args, **kwargs)
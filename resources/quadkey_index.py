@@ -0,0 +1,179 @@
+"""Array-backed quadkey index for mosaic.json documents.
+
+Run `python quadkey_index.py s3://bucket/.../mosaic.json` to write the index
+sidecar (mosaic.json.idx) next to a mosaic document.
+"""
+import argparse
+import json
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+SIDECAR_SUFFIX = ".idx"
+MAGIC = b"QKIX"
+VERSION = 1
+# magic, version, quadkey zoom, quadkeys, asset references, assets bytes,
+# metadata bytes
+HEADER = struct.Struct("<4sHHIIII")
+
+# Quadkey -> assets map of a mosaic as sorted arrays. Quadkeys are stored as
+# base-4 integers, all at the mosaic's quadkey zoom, so the quadkeys under a
+# lower zoom tile form one contiguous run found with two binary searches,
+# and a higher zoom tile maps to its ancestor with a bit shift. Assets are
+# stored once; each quadkey's assets are a slice of `refs` given by
+# `offsets`. Lookups no longer enumerate child tiles or build quadkey
+# strings, and the index takes a fraction of the memory of the parsed dict.
+class QuadkeyIndex:
+    def __init__(self, quadkey_zoom, quadkeys, offsets, refs, assets):
+        self.quadkey_zoom = quadkey_zoom
+        self.quadkeys = quadkeys
+        self.offsets = offsets
+        self.refs = refs
+        self.assets = assets
+
+    # Index of a mosaic's tiles, or None when they aren't all quadkeys at
+    # quadkey_zoom (the index can't answer for such a mosaic).
+    @classmethod
+    def from_tiles(cls, tiles, quadkey_zoom):
+        if any(len(quadkey) != quadkey_zoom for quadkey in tiles):
+            return None
+        ids = {}
+        quadkeys = array("Q")
+        offsets = array("I", [0])
+        refs = array("I")
+        for quadkey, assets in sorted(tiles.items()):
+            quadkeys.append(int(quadkey, 4) if quadkey else 0)
+            refs.extend(ids.setdefault(asset, len(ids)) for asset in assets)
+            offsets.append(len(refs))
+        return cls(quadkey_zoom, quadkeys, offsets, refs, list(ids))
+
+    # Assets for a tile, in the order MosaicBackend.get_assets returns them:
+    # by quadkey, then by their order in the mosaic, without duplicates.
+    def assets_for_tile(self, x, y, z):
+        zoom = self.quadkey_zoom
+        if z >= zoom:
+            key = tile_quadkey(x >> (z - zoom), y >> (z - zoom), zoom)
+            first = bisect_left(self.quadkeys, key)
+            last = first + 1 if first < len(self.quadkeys) and self.quadkeys[first] == key else first
+        else:
+            shift = 2 * (zoom - z)
+            key = tile_quadkey(x, y, z)
+            first = bisect_left(self.quadkeys, key << shift)
+            last = bisect_left(self.quadkeys, (key + 1) << shift)
+        refs = self.refs[self.offsets[first]:self.offsets[last]]
+        return [self.assets[i] for i in dict.fromkeys(refs)]
+
+    def quadkey_strings(self):
+        zoom = self.quadkey_zoom
+        return [quadkey_string(key, zoom) for key in self.quadkeys]
+
+    # The quadkey -> assets map the index was built from, by quadkey.
+    def tiles(self):
+        return {
+            quadkey: [self.assets[i] for i in self.refs[self.offsets[n]:self.offsets[n + 1]]]
+            for n, quadkey in enumerate(self.quadkey_strings())
+        }
+
+    @property
+    def nbytes(self):
+        arrays = (self.quadkeys, self.offsets, self.refs)
+        return sum(a.itemsize * len(a) for a in arrays) + sum(sys.getsizeof(a) for a in self.assets)
+
+    # Binary sidecar: header, mosaic metadata (JSON), then the arrays
+    # little-endian, then the assets separated by newlines.
+    def to_bytes(self, metadata):
+        meta = json.dumps(metadata).encode()
+        assets = "\n".join(self.assets).encode()
+        parts = [
+            HEADER.pack(MAGIC, VERSION, self.quadkey_zoom, len(self.quadkeys), len(self.refs), len(assets), len(meta)),
+            meta,
+        ]
+        for values in (self.quadkeys, self.offsets, self.refs):
+            values = array(values.typecode, values)
+            if sys.byteorder != "little":
+                values.byteswap()
+            parts.append(values.tobytes())
+        parts.append(assets)
+        return b"".join(parts)
+
+    # (index, metadata) from a sidecar.
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, zoom, count, ref_count, assets_size, meta_size = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a quadkey index")
+        position = HEADER.size
+        metadata = json.loads(data[position:position + meta_size])
+        position += meta_size
+        arrays = []
+        for typecode, length in (("Q", count), ("I", count + 1), ("I", ref_count)):
+            values = array(typecode)
+            size = values.itemsize * length
+            values.frombytes(data[position:position + size])
+            if sys.byteorder != "little":
+                values.byteswap()
+            arrays.append(values)
+            position += size
+        blob = data[position:position + assets_size].decode()
+        assets = blob.split("\n") if blob else []
+        return cls(zoom, *arrays, assets), metadata
+
+# Quadkey of a WebMercatorQuad tile as a base-4 integer.
+def tile_quadkey(x, y, z):
+    key = 0
+    for i in range(z - 1, -1, -1):
+        key = (key << 2) | ((x >> i) & 1) | (((y >> i) & 1) << 1)
+    return key
+
+def quadkey_string(key, zoom):
+    digits = []
+    for _ in range(zoom):
+        digits.append("0123"[key & 3])
+        key >>= 2
+    return "".join(reversed(digits))
+
+# Write the sidecar for the mosaic document at `url` (s3:// or a local path)
+# next to it. The sidecar records the document's ETag so a reader can tell
+# whether it is still current.
+def write_sidecar(url):
+    from cogeo_mosaic.mosaic import MosaicJSON
+
+    if url.startswith("s3://"):
+        from storage import s3_client, split_s3_url
+
+        bucket, key = split_s3_url(url)
+        response = s3_client().get_object(Bucket=bucket, Key=key)
+        body, etag = response["Body"].read(), response.get("ETag")
+    else:
+        with open(url, "rb") as f:
+            body, etag = f.read(), None
+
+    mosaic_def = MosaicJSON(**json.loads(body))
+    index = QuadkeyIndex.from_tiles(mosaic_def.tiles, mosaic_def.quadkey_zoom or mosaic_def.minzoom)
+    if index is None:
+        raise ValueError(f"{url}: quadkeys are not all at the quadkey zoom")
+    metadata = {"etag": etag, "mosaic": mosaic_metadata(mosaic_def)}
+    data = index.to_bytes(metadata)
+
+    if url.startswith("s3://"):
+        s3_client().put_object(Bucket=bucket, Key=key + SIDECAR_SUFFIX, Body=data, ContentType="application/octet-stream")
+    else:
+        with open(url + SIDECAR_SUFFIX, "wb") as f:
+            f.write(data)
+    return index, len(data)
+
+# A mosaic definition without its tiles, as JSON.
+def mosaic_metadata(mosaic_def):
+    return json.loads(mosaic_def.model_copy(update={"tiles": {}}).model_dump_json(exclude_none=True))
+
+def main():
+    parser = argparse.ArgumentParser(description="Write quadkey index sidecars for mosaic.json documents.")
+    parser.add_argument("urls", nargs="+", help="s3:// urls or paths of mosaic.json documents")
+    args = parser.parse_args()
+    for url in args.urls:
+        index, size = write_sidecar(url)
+        print(f"{url}{SIDECAR_SUFFIX}: {len(index.quadkeys)} quadkeys, {len(index.assets)} assets, {size} bytes")
+
+if __name__ == "__main__":
+    main()
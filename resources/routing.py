@@ -0,0 +1,126 @@
+import functools
+import json
+import logging
+import os
+import re
+from typing import NamedTuple
+
+from starlette.concurrency import run_in_threadpool
+
+import storage
+from caches import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Services that can be addressed by resource id ("/{id}/{service}/..."),
+# declared in routes.json. Each names the file that backs it in the geodata
+# layout and the titiler router that serves it (the service name unless
+# "router" is given), so one router can serve several renditions, e.g.
+#   "original": {"router": "cog", "file": "original.tif"}
+ROUTES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "routes.json")
+
+# Resource ids are Figgy ids: at least the 6 characters the layout shards
+# by, and nothing that could step outside the resource's directory.
+RESOURCE_ID = re.compile(r"[0-9A-Za-z_-]{6,}")
+
+class Route(NamedTuple):
+    service: str
+    router: str
+    file_name: str
+
+def load_routes(path=ROUTES_FILE):
+    with open(path) as f:
+        table = json.load(f)["routes"]
+    routes = {}
+    for service, route in table.items():
+        unknown = set(route) - {"router", "file"}
+        if unknown or "file" not in route:
+            raise ValueError(f"Invalid route {service!r} in {path}: expected a file and optionally a router")
+        routes[service] = Route(service, route.get("router", service), route["file"])
+    return routes
+
+ROUTES = load_routes()
+
+# Statuses titiler answers with when it can't open a resource's file
+# (RasterioIOError for a COG). A missing mosaic is a 404, but so is every
+# tile outside a resource's bounds, and looking the file up on each of those
+# would put an S3 HEAD on the response path; missing mosaics are found by
+# check_resources instead.
+FAILED_OPEN_STATUSES = (500,)
+
+# Maps resource ids to the urls of the files backing them, for a data root
+# (see middleware.data_root). Urls are built once per (id, service) and
+# memoized. With check_exists, resolve() also looks the file up in storage,
+# so requests for missing resources are answered with a 404 before titiler
+# opens anything. Files found are remembered for the ttl, files missing for
+# missing_ttl: a negative cache that turns repeated requests for missing
+# resources (crawlers, stale links) into a dict lookup. Without
+# check_exists, failed() fills the negative cache from failed opens.
+class Resolver:
+    def __init__(self, data_root, routes=None, maxsize=4096, check_exists=False, ttl=300, missing_ttl=60):
+        self.url_prefix = f"{data_root}/"
+        self.routes = dict(routes if routes is not None else ROUTES)
+        self.check_exists = check_exists
+        self.found = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.missing = LRUCache(maxsize=maxsize, ttl=missing_ttl)
+        self.url = functools.lru_cache(maxsize=maxsize)(self._url)
+
+    # url of the file backing a service for a resource id, or None for an
+    # unknown service or an invalid id.
+    def _url(self, resource_id, service):
+        route = self.routes.get(service)
+        if route is None or not RESOURCE_ID.fullmatch(resource_id):
+            return None
+        return f"{self.url_prefix}{resource_id[0:2]}/{resource_id[2:4]}/{resource_id[4:6]}/{resource_id}/{route.file_name}"
+
+    # url for a request's resource id and service, or None when the request
+    # should be rejected.
+    async def resolve(self, resource_id, service):
+        url = self.url(resource_id, service)
+        if url is None or self.missing.get(url):
+            return None
+        if not self.check_exists or self.found.get(url):
+            return url
+        return url if await self.lookup(url) else None
+
+    # Called when titiler failed to open `url` (see FAILED_OPEN_STATUSES).
+    # The same status also means a transient S3 error, so the file is looked
+    # up before it is cached as missing, at most once per ttl for files that
+    # exist.
+    async def failed(self, url):
+        if not self.found.get(url) and not self.missing.get(url):
+            await self.lookup(url)
+
+    # Whether `url` exists, caching the answer. Errors looking it up count
+    # as found, uncached: the request goes on to titiler as before.
+    async def lookup(self, url):
+        try:
+            exists = await run_in_threadpool(storage.exists, url)
+        except Exception as e:
+            logger.warning("could not look up %s: %s", url, e)
+            return True
+        if exists:
+            self.found.set(url, True)
+        else:
+            self.missing.set(url, True)
+        return exists
+
+def resolver(data_root, routes=None):
+    return Resolver(
+        data_root,
+        routes,
+        maxsize=int(os.getenv("TITILER_RESOURCE_CACHE_SIZE", "4096")),
+        check_exists=bool(os.getenv("TITILER_CHECK_RESOURCES")),
+        ttl=float(os.getenv("TITILER_RESOURCE_CACHE_TTL", "300")),
+        missing_ttl=float(os.getenv("TITILER_MISSING_RESOURCE_TTL", "60")),
+    )
+
+# titiler's error body for a resource that can't be served.
+async def send_not_found(send):
+    body = b'{"detail":"Resource not found"}'
+    await send({
+        "type": "http.response.start",
+        "status": 404,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
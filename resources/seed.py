@@ -0,0 +1,191 @@
+"""Pre-render tiles of newly published resources into a tile store.
+
+Reads each resource's bounds and zoom range from its TileJSON, lists the
+tiles in the requested zooms and renders them with a process pool through
+the same app and middleware as handler.py, writing every tile with data to a
+tile store (a directory or s3://bucket/prefix) under the path CloudFront
+serves it from: the extension-less path TileJSON tile urls request, for
+which titiler picks the format, unless --format is given. --dry-run only
+counts tiles and estimates the time from a few sample renders.
+
+    python seed.py 1234567/cog abcdef/mosaicjson --maxzoom 14 \\
+        --store s3://figgy-geo-tiles-staging --processes 4 --rate 50
+    python seed.py 1234567/cog --maxzoom 16 --dry-run
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from urllib.parse import urlencode
+
+logger = logging.getLogger(__name__)
+
+_app = None
+_store = None
+
+def init_worker(store_location):
+    global _app, _store
+    from application import create_app
+    from tile_store import open_tile_store
+
+    # Tiles are written to the store given here, not also by TileStoreMiddleware.
+    os.environ.pop("TITILER_TILE_STORE", None)
+    _app = create_app()
+    _store = open_tile_store(store_location) if store_location else None
+
+# Run one GET request through the ASGI app: (status, headers, body).
+def asgi_get(app, path, query=None):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "https",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": urlencode(query or {}).encode(),
+        "headers": [(b"host", b"localhost")],
+        "client": ("127.0.0.1", 0),
+        "server": ("localhost", 443),
+    }
+    response = {"status": None, "headers": {}, "body": []}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {k.decode().lower(): v.decode() for k, v in message.get("headers", [])}
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+
+    asyncio.run(app(scope, receive, send))
+    return response["status"], response["headers"], b"".join(response["body"])
+
+def render_tile(task, store=True):
+    resource_id, service, tms, z, x, y, scale, format = task
+    from tile_store import tile_key
+
+    start = time.perf_counter()
+    status, headers, body = asgi_get(_app, "/" + tile_key(*task))
+    if status == 200 and store and _store is not None:
+        _store.put(tile_key(*task), body, headers.get("content-type", "application/octet-stream"))
+    return status, len(body), time.perf_counter() - start
+
+# (bounds, minzoom, maxzoom) of a resource from its TileJSON.
+def resource_extent(app, resource_id, service, tms):
+    status, _, body = asgi_get(app, f"/{resource_id}/{service}/{tms}/tilejson.json")
+    if status != 200:
+        raise RuntimeError(f"{resource_id}/{service}: tilejson returned {status}")
+    tilejson = json.loads(body)
+    return tilejson["bounds"], tilejson["minzoom"], tilejson["maxzoom"]
+
+def zoom_tiles(tms, bounds, zoom):
+    return list(tms.tiles(*bounds, zooms=[zoom]))
+
+def plan(app, resources, args):
+    import morecantile
+
+    tms = morecantile.tms.get(args.tms)
+    tasks = []
+    counts = {}
+    for resource in resources:
+        resource_id, _, service = resource.partition("/")
+        service = service or "cog"
+        bounds, minzoom, maxzoom = resource_extent(app, resource_id, service, args.tms)
+        minzoom = max(minzoom, args.minzoom) if args.minzoom is not None else minzoom
+        maxzoom = min(maxzoom, args.maxzoom) if args.maxzoom is not None else maxzoom
+        for zoom in range(minzoom, maxzoom + 1):
+            tiles = zoom_tiles(tms, bounds, zoom)
+            counts[f"{resource_id}/{service}/{zoom}"] = len(tiles)
+            tasks += [(resource_id, service, args.tms, t.z, t.x, t.y, args.scale, args.format) for t in tiles]
+    return tasks, counts
+
+def estimate(tasks, args):
+    init_worker(None)
+    sample = random.Random(0).sample(tasks, min(args.sample, len(tasks)))
+    seconds = [render_tile(task, store=False)[2] for task in sample]
+    per_tile = sum(seconds) / len(seconds) if seconds else 0
+    render_time = len(tasks) * per_tile / args.processes
+    rate_time = len(tasks) / args.rate if args.rate else 0
+    return per_tile, max(render_time, rate_time)
+
+def seed(tasks, args):
+    context = multiprocessing.get_context("spawn")
+    summary = {"rendered": 0, "empty": 0, "errors": 0, "bytes": 0}
+    start = time.perf_counter()
+    pending = set()
+    with ProcessPoolExecutor(args.processes, mp_context=context, initializer=init_worker,
+                             initargs=(args.store,)) as pool:
+        for submitted, task in enumerate(tasks):
+            # Keep at most `rate` tiles per second and a bounded queue.
+            if args.rate:
+                delay = submitted / args.rate - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            while len(pending) >= args.processes * 4:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done, summary)
+            pending.add(pool.submit(render_tile, task))
+        collect(wait(pending)[0], summary)
+    summary["seconds"] = round(time.perf_counter() - start, 1)
+    summary["tiles_per_second"] = round(len(tasks) / summary["seconds"], 1) if summary["seconds"] else None
+    return summary
+
+def collect(futures, summary):
+    for future in futures:
+        try:
+            status, size, _ = future.result()
+        except Exception as e:
+            logger.warning("tile failed: %s", e)
+            summary["errors"] += 1
+            continue
+        if status == 200:
+            summary["rendered"] += 1
+            summary["bytes"] += size
+        elif status >= 500:
+            summary["errors"] += 1
+        else:
+            summary["empty"] += 1
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("resources", nargs="+", help='resources as "{id}/cog" or "{id}/mosaicjson"')
+    parser.add_argument("--store", help="directory or s3://bucket/prefix to write tiles to")
+    parser.add_argument("--minzoom", type=int, help="lowest zoom (default: the resource's)")
+    parser.add_argument("--maxzoom", type=int, help="highest zoom (default: the resource's)")
+    parser.add_argument("--tms", default="WebMercatorQuad")
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--format", help="tile format extension, e.g. png (default: none, as in TileJSON tile urls)")
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--rate", type=float, help="maximum tiles per second")
+    parser.add_argument("--dry-run", action="store_true", help="count tiles and estimate the time only")
+    parser.add_argument("--sample", type=int, default=5, help="tiles rendered to estimate the time in --dry-run")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    from application import create_app
+
+    os.environ.pop("TITILER_TILE_STORE", None)
+    tasks, counts = plan(create_app(), args.resources, args)
+    for name, count in counts.items():
+        print(f"{name:<48}{count:>10}")
+    print(f"{'total tiles':<48}{len(tasks):>10}")
+
+    if args.dry_run:
+        per_tile, seconds = estimate(tasks, args)
+        print(f"~{per_tile * 1000:.0f} ms per tile, ~{seconds / 60:.1f} minutes with {args.processes} processes")
+        return
+    if not args.store:
+        parser.error("--store is required unless --dry-run is given")
+    print(json.dumps(seed(tasks, args)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""HTTP server entry point for the streaming and container deployment modes.
+
+In streaming mode (the `streaming` target of the Dockerfile) the Lambda Web
+Adapter extension receives the invocations and proxies them as HTTP requests
+to this uvicorn server, and the function url streams the responses back
+(RESPONSE_STREAM) instead of Mangum buffering them. Large previews, crops and
+statistics then start arriving as soon as they are rendered and aren't
+capped by the buffered payload size. Events that aren't HTTP requests, such
+as the warmer's, are POSTed by the adapter to /events. Only the adapter's
+pass-through may post there: in Lambda that is a request with the
+adapter's x-amzn-lambda-context header and without the
+x-amzn-request-context header it adds to proxied HTTP requests; elsewhere,
+a request from loopback.
+
+In container mode (the `container` target, TitilerContainerStack) the same
+app and middleware are served by TITILER_WORKERS uvicorn worker processes on
+ECS Fargate. Each worker handles requests concurrently and keeps its GDAL
+handles, caches and connections across them.
+
+    python server.py                     # serves on http://localhost:8080 (PORT)
+    TITILER_WORKERS=4 python server.py
+"""
+import json
+import os
+from types import SimpleNamespace
+
+from fastapi import Body, Header, HTTPException, Request
+
+from application import create_app
+import warmer
+
+app = create_app()
+
+LOOPBACK = ("127.0.0.1", "::1")
+
+@app.post("/events", include_in_schema=False)
+def events(
+    request: Request,
+    event: dict = Body(...),
+    lambda_context: str = Header(None, alias="x-amzn-lambda-context"),
+    request_context: str = Header(None, alias="x-amzn-request-context"),
+):
+    if not from_pass_through(request, lambda_context, request_context):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if not warmer.is_warmer_event(event):
+        return {"handled": False}
+    try:
+        return warmer.warm(event, context_from_header(lambda_context), app)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def from_pass_through(request, lambda_context, request_context):
+    if request_context is not None:
+        return False
+    if os.getenv("AWS_LAMBDA_FUNCTION_NAME"):
+        return lambda_context is not None
+    return request.client is not None and request.client.host in LOOPBACK
+
+# Lambda context the adapter passes as JSON in x-amzn-lambda-context, or
+# None outside Lambda.
+def context_from_header(value):
+    if not value:
+        return None
+    return SimpleNamespace(**json.loads(value))
+
+def main():
+    import uvicorn
+
+    workers = int(os.getenv("TITILER_WORKERS", "1"))
+    # Worker processes import the app by name rather than inherit it.
+    uvicorn.run(
+        app if workers == 1 else "server:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", "8080")),
+        workers=workers,
+        log_level="warning",
+    )
+
+if __name__ == "__main__":
+    main()
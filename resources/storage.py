@@ -0,0 +1,37 @@
+import functools
+import os
+from urllib.parse import urlsplit
+
+# One boto3 S3 client per process. Creating a session and client costs tens
+# of milliseconds, so it is built on first use and reused by every request
+# handled in a warm container. boto3 is provided by the Lambda base image.
+@functools.lru_cache(maxsize=None)
+def s3_client():
+    import boto3
+
+    return boto3.session.Session().client("s3")
+
+# s3://{bucket}/{key} -> (bucket, key)
+def split_s3_url(url):
+    parts = urlsplit(url)
+    return parts.netloc, parts.path.lstrip("/")
+
+# HTTP status of a botocore ClientError (e.g. 304, 404).
+def error_status(error):
+    return error.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+
+# Whether the object or local file at `url` exists. A 403 counts as missing:
+# without s3:ListBucket, S3 answers 403 rather than 404 for missing keys.
+def exists(url):
+    if not url.startswith("s3://"):
+        return os.path.exists(url)
+    from botocore.exceptions import ClientError
+
+    bucket, key = split_s3_url(url)
+    try:
+        s3_client().head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if error_status(e) in (403, 404):
+            return False
+        raise
+    return True
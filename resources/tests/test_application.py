@@ -0,0 +1,46 @@
+import pytest
+
+pytest.importorskip("titiler.core")
+
+from starlette.testclient import TestClient
+from application import create_app, profile_imports
+
+def paths(app):
+    return list(app.openapi()["paths"])
+
+def test_create_app_mounts_configured_routers(monkeypatch):
+    monkeypatch.delenv('TITILER_ROUTERS', raising=False)
+    app = create_app()
+    assert('/cog/info' in paths(app))
+    assert('/mosaicjson/info' in paths(app))
+    assert(not any(path.startswith('/stac') for path in paths(app)))
+
+def test_create_app_with_router_list():
+    app = create_app("cog,tms")
+    assert('/cog/info' in paths(app))
+    assert('/tileMatrixSets' in paths(app))
+    assert(not any(path.startswith('/mosaicjson') for path in paths(app)))
+
+def test_create_app_health_check():
+    client = TestClient(create_app("cog"))
+    assert(client.get('/healthz').json()) == {"ping": "pong!"}
+
+def test_profile_imports_reports_packages():
+    total, packages = profile_imports("middleware")
+    assert(total) > 0
+    assert('middleware' in packages)
+
+def test_create_app_mounts_cog_extensions():
+    app = create_app("cog")
+    assert('/cog/validate' in paths(app))
+    assert('/cog/viewer' in paths(app))
+    assert('/cog/stac' in paths(app))
+
+def test_create_app_requires_global_access_token(monkeypatch):
+    monkeypatch.setenv('TITILER_API_GLOBAL_ACCESS_TOKEN', 'secret')
+    client = TestClient(create_app("cog"))
+    assert(client.get('/healthz').status_code) == 401
+    assert(client.get('/healthz', params={'access_token': 'wrong'}).json()) == {'detail': 'Invalid `access_token`'}
+    assert(client.get('/healthz', params={'access_token': 'secret'}).json()) == {"ping": "pong!"}
+    # Kept on tile requests, whose other unknown parameters are dropped.
+    assert(client.get('/cog/tiles/WebMercatorQuad/0/0/0', params={'access_token': 'secret'}).status_code) != 401
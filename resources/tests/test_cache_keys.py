@@ -0,0 +1,59 @@
+import json
+
+import pytest
+from fastapi import FastAPI, Request
+from starlette.testclient import TestClient
+
+from cache_keys import TILE_PARAMETERS, CanonicalQueryMiddleware, canonical_query
+
+TILE = "/1234567/cog/tiles/WebMercatorQuad/10/301/384@1x.png"
+
+def test_parameters_are_sorted_and_lowercased():
+    assert(canonical_query("/1234567/cog/info", b"Bidx=1&Rescale=0,255&a=b")) == b"a=b&bidx=1&rescale=0,255"
+    assert(canonical_query(TILE, b"rescale=0%2C255&bidx=1")) == canonical_query(TILE, b"bidx=1&RESCALE=0%2C255")
+
+def test_repeated_parameters_keep_their_order():
+    assert(canonical_query(TILE, b"bidx=3&rescale=0,1&bidx=1&bidx=2")) == b"bidx=3&bidx=1&bidx=2&rescale=0,1"
+    assert(canonical_query(TILE, b"bidx=1&Bidx=2&bidx=3")) == b"bidx=1&bidx=3&bidx=2"
+
+def test_tile_paths_drop_unknown_parameters():
+    assert(canonical_query(TILE, b"cachebust=123&bidx=1&_=1")) == b"bidx=1"
+    assert(canonical_query(TILE, b"cachebust=123")) == b""
+    assert(canonical_query("/1234567/cog/info", b"cachebust=123")) == b"cachebust=123"
+
+def test_empty_values_and_separators():
+    assert(canonical_query(TILE, b"")) == b""
+    assert(canonical_query(TILE, b"&bidx&&nodata=")) == b"bidx=&nodata="
+
+def test_middleware_normalizes_the_query_string():
+    app = FastAPI()
+
+    @app.get("/{path:path}")
+    async def route(req: Request):
+        return {"query": req.url.query}
+
+    app.add_middleware(CanonicalQueryMiddleware)
+    with TestClient(app) as client:
+        response = client.get(f"{TILE}?Rescale=0,255&cachebust=1&bidx=1")
+        assert(response.json()["query"]) == "bidx=1&rescale=0,255"
+
+# The allow-list must keep every query parameter of the tile endpoints.
+def test_allow_list_covers_tile_endpoints():
+    pytest.importorskip("titiler.core")
+    from application import create_app
+
+    spec = create_app().openapi()
+    for path, operations in spec["paths"].items():
+        if "/tiles" not in path:
+            continue
+        for operation in operations.values():
+            for parameter in operation.get("parameters", []):
+                if parameter["in"] == "query":
+                    assert(parameter["name"].lower() in TILE_PARAMETERS)
+
+def test_allow_list_is_sorted_and_lowercase():
+    import os
+
+    with open(os.path.join(os.path.dirname(os.path.dirname(__file__)), "cache_keys.json")) as f:
+        parameters = json.load(f)["tile_parameters"]
+    assert(parameters) == sorted(p.lower() for p in parameters)
@@ -0,0 +1,64 @@
+import time
+
+from caches import DiskCache, LRUCache
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert(cache.get("a")) == 1
+    assert(cache.get("b")) is None
+    assert(cache.get("c")) == 3
+    assert(cache.stats()["evictions"]) == 1
+
+def test_lru_cache_bounds_bytes():
+    cache = LRUCache(maxsize=10, maxbytes=100)
+    cache.set("a", "a", size=60)
+    cache.set("b", "b", size=60)
+    cache.set("huge", "huge", size=200)
+    assert("a" not in cache)
+    assert("b" in cache)
+    assert("huge" not in cache)
+    assert(cache.currbytes) == 60
+
+def test_lru_cache_expires_entries():
+    cache = LRUCache(maxsize=10, ttl=0.01)
+    cache.set("a", 1)
+    assert(cache.get("a")) == 1
+    time.sleep(0.02)
+    assert(cache.get("a")) is None
+    assert(cache.peek("a")) == 1
+
+def test_lru_cache_counts_hits_and_misses():
+    cache = LRUCache(maxsize=10)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("b")
+    assert(cache.stats()["hits"]) == 1
+    assert(cache.stats()["misses"]) == 1
+
+def test_disk_cache_round_trip(tmp_path):
+    cache = DiskCache(str(tmp_path), maxbytes=100)
+    cache.set("a", b"tile")
+    assert(cache.get("a")) == b"tile"
+    assert(cache.get("b")) is None
+    assert(cache.stats()["hits"]) == 1
+    assert(cache.stats()["misses"]) == 1
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path), maxbytes=100)
+    cache.set("a", b"a" * 40)
+    cache.set("b", b"b" * 40)
+    cache.get("a")
+    cache.set("c", b"c" * 40)
+    assert(cache.get("a")) is not None
+    assert(cache.get("b")) is None
+    assert(cache.stats()["bytes"]) == 80
+
+def test_disk_cache_survives_new_process(tmp_path):
+    DiskCache(str(tmp_path), maxbytes=100).set("a", b"tile")
+    cache = DiskCache(str(tmp_path), maxbytes=100)
+    assert(cache.get("a")) == b"tile"
+    assert(cache.stats()["bytes"]) == 4
@@ -0,0 +1,86 @@
+import json
+import os
+
+import pytest
+
+rasterio = pytest.importorskip("rasterio")
+pytest.importorskip("rio_tiler")
+
+import numpy
+from rasterio.transform import from_bounds
+from rio_cogeo.cogeo import cog_translate
+from rio_cogeo.profiles import cog_profiles
+
+import cog_cache
+from cog_cache import CogHeaderCache, CogReader
+
+@pytest.fixture
+def cog(tmp_path):
+    src_path = str(tmp_path / "src.tif")
+    cog_path = str(tmp_path / "display_raster.tif")
+    profile = dict(driver="GTiff", width=1024, height=1024, count=1, dtype="uint8", crs="EPSG:4326", transform=from_bounds(-75, 40, -74, 41, 1024, 1024))
+    with rasterio.open(src_path, "w", **profile) as dst:
+        dst.write(numpy.arange(1024 * 1024, dtype="uint8").reshape(1, 1024, 1024))
+    cog_translate(src_path, cog_path, cog_profiles.get("deflate"), quiet=True)
+    return cog_path
+
+@pytest.fixture
+def header_cache(tmp_path, monkeypatch):
+    cache = CogHeaderCache(str(tmp_path / "headers"))
+    monkeypatch.setattr(cog_cache, "header_cache", cache)
+    return cache
+
+def test_cog_headers_are_stored_and_reused(cog, header_cache):
+    with CogReader(cog) as src:
+        assert(src.bounds) == pytest.approx((-75, 40, -74, 41))
+
+    entry = header_cache.get(cog)
+    assert(entry["overviews"]) == [2]
+    assert(entry["dtypes"]) == ["uint8"]
+    assert(0 < entry["header_size"] < os.path.getsize(cog))
+
+    with CogReader(cog) as src:
+        assert(src.tile(0, 0, 0).data.shape) == (1, 256, 256)
+    assert(header_cache.stats()["hits"]) == 2
+
+def test_cog_headers_are_revalidated_by_etag(cog, header_cache, monkeypatch):
+    with rasterio.open(cog) as dataset:
+        header_cache.put(cog, dataset, etag='"old"')
+    header_cache.ttl = 0
+
+    monkeypatch.setattr(cog_cache, "object_etag", lambda url: '"old"')
+    assert(header_cache.get(cog)) is not None
+
+    monkeypatch.setattr(cog_cache, "object_etag", lambda url: '"new"')
+    assert(header_cache.get(cog)) is None
+    assert(os.listdir(header_cache.files.directory)) == []
+
+def test_cog_header_cache_is_size_bounded(cog, header_cache):
+    header_cache.files.maxbytes = 1000
+    with rasterio.open(cog) as dataset:
+        for i in range(5):
+            header_cache.put(f"s3://bucket/{i}/display_raster.tif", dataset, etag=str(i))
+
+    assert(header_cache.stats()["bytes"]) <= 1000
+    assert(header_cache.stats()["evictions"]) > 0
+    assert(header_cache.get("s3://bucket/4/display_raster.tif")) is not None
+
+def test_cog_header_etag_is_recorded_in_the_background(cog, header_cache, monkeypatch):
+    lookups = []
+    monkeypatch.setattr(cog_cache, "object_etag", lambda url: lookups.append(url) or '"abc"')
+    with rasterio.open(cog) as dataset:
+        entry = header_cache.put(cog, dataset)
+    assert(entry["etag"]) is None
+    header_cache.etags.shutdown(wait=True)
+    assert(lookups) == [cog]
+    assert(header_cache.get(cog)["etag"]) == '"abc"'
+
+def test_cog_header_without_etag_takes_it_on_revalidation(cog, header_cache, monkeypatch):
+    with rasterio.open(cog) as dataset:
+        header_cache.put(cog, dataset, etag='"old"')
+    entry = json.loads(header_cache.files.get(cog))
+    entry["etag"] = None
+    header_cache._write(cog, entry)
+    header_cache.ttl = 0
+    monkeypatch.setattr(cog_cache, "object_etag", lambda url: '"new"')
+    assert(header_cache.get(cog)["etag"]) == '"new"'
@@ -0,0 +1,56 @@
+import asyncio
+import gzip
+import json
+import zlib
+
+from starlette.testclient import TestClient
+
+from compression import JSONCompressionMiddleware
+
+def streaming_app(content_type, chunks):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", content_type), (b"vary", b"Origin")]})
+        for i, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1})
+    return app
+
+def test_json_is_gzipped_chunk_by_chunk():
+    document = json.dumps({"values": list(range(1000))}).encode()
+    chunks = [document[:2000], document[2000:]]
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def receive():
+        return {"type": "http.request"}
+
+    scope = {"type": "http", "headers": [(b"accept-encoding", b"gzip, br")]}
+    asyncio.run(JSONCompressionMiddleware(streaming_app(b"application/json", chunks))(scope, receive, send))
+    headers = dict(sent[0]["headers"])
+    assert(headers[b"content-encoding"]) == b"gzip"
+    assert(headers[b"vary"]) == b"Origin, Accept-Encoding"
+    assert(sent[1]["more_body"]) == True
+    # The first chunk can be decompressed before the response ends.
+    assert(zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(sent[1]["body"])) == chunks[0]
+    assert(gzip.decompress(b"".join(m["body"] for m in sent[1:]))) == document
+
+def test_json_is_decoded_by_clients():
+    document = {"values": list(range(1000))}
+    client = TestClient(JSONCompressionMiddleware(streaming_app(b"application/json", [json.dumps(document).encode()])))
+    response = client.get("/1234567/cog/statistics", headers={"accept-encoding": "gzip"})
+    assert(response.headers["content-encoding"]) == "gzip"
+    assert(response.json()) == document
+
+def test_images_small_bodies_and_other_clients_are_not_compressed():
+    png = TestClient(JSONCompressionMiddleware(streaming_app(b"image/png", [b"\x89PNG" * 1000])))
+    assert("content-encoding" not in png.get("/", headers={"accept-encoding": "gzip"}).headers)
+
+    small = TestClient(JSONCompressionMiddleware(streaming_app(b"application/json", [b'{"ping": "pong!"}'])))
+    assert("content-encoding" not in small.get("/", headers={"accept-encoding": "gzip"}).headers)
+
+    document = json.dumps({"values": list(range(1000))}).encode()
+    plain = TestClient(JSONCompressionMiddleware(streaming_app(b"application/json", [document])))
+    response = plain.get("/", headers={"accept-encoding": "identity"})
+    assert("content-encoding" not in response.headers)
+    assert(response.content) == document
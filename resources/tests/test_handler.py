@@ -0,0 +1,104 @@
+import base64
+import json
+
+import pytest
+
+pytest.importorskip("titiler.core")
+pytest.importorskip("rio_cogeo")
+
+from mangum import Mangum
+
+from application import create_app
+from benchmarks.events import cors_preflight_event, function_url_event, lambda_context
+from benchmarks.synthetic import center_tile, make_dataset
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory):
+    root = str(tmp_path_factory.mktemp("geodata"))
+    return root, make_dataset(root, grid=1, size=512)
+
+@pytest.fixture
+def handler(dataset, monkeypatch, tmp_path):
+    root, _ = dataset
+    monkeypatch.setenv('TITILER_DATA_ROOT', root)
+    monkeypatch.setenv('TITILER_BASE_URL', 'map-tiles.princeton.edu')
+    monkeypatch.setenv('TITILER_COG_CACHE_DIR', str(tmp_path / 'headers'))
+    return Mangum(create_app(), lifespan="off")
+
+def test_handler_renders_cog_tile(dataset, handler):
+    _, manifest = dataset
+    z, x, y = center_tile(manifest["cog"]["bounds"], 10)
+    event = function_url_event("GET", f"/{manifest['cog']['id']}/cog/tiles/WebMercatorQuad/{z}/{x}/{y}@1x.png")
+    response = handler(event, lambda_context())
+    assert(response["statusCode"]) == 200
+    assert(response["headers"]["content-type"]) == "image/png"
+    assert(base64.b64decode(response["body"])[:4]) == b"\x89PNG"
+
+def test_handler_rewrites_mosaic_tilejson(dataset, handler):
+    _, manifest = dataset
+    mosaic_id = manifest["mosaicjson"]["id"]
+    event = function_url_event("GET", f"/{mosaic_id}/mosaicjson/WebMercatorQuad/tilejson.json")
+    response = handler(event, lambda_context())
+    assert(response["statusCode"]) == 200
+    tiles = json.loads(response["body"])["tiles"]
+    assert(tiles) == [f"https://map-tiles.princeton.edu/{mosaic_id}/mosaicjson/tiles/WebMercatorQuad/{{z}}/{{x}}/{{y}}@1x"]
+
+def test_handler_answers_cors_preflight(dataset, handler):
+    _, manifest = dataset
+    event = cors_preflight_event(f"/{manifest['cog']['id']}/cog/WebMercatorQuad/tilejson.json")
+    response = handler(event, lambda_context())
+    assert(response["statusCode"]) == 200
+    assert(response["headers"]["access-control-allow-origin"]) == "https://maps.princeton.edu"
+
+def parse_multipart(response):
+    boundary = response["headers"]["content-type"].split("boundary=")[1]
+    body = base64.b64decode(response["body"])
+    parts = []
+    for chunk in body.split(f"--{boundary}".encode())[1:-1]:
+        head, content = chunk[2:].split(b"\r\n\r\n", 1)
+        headers = dict(line.split(": ", 1) for line in head.decode().split("\r\n"))
+        parts.append((headers, content[: int(headers["Content-Length"])]))
+    return parts
+
+@pytest.mark.parametrize("service", ["cog", "mosaicjson"])
+def test_handler_renders_tile_batch(dataset, handler, service):
+    _, manifest = dataset
+    z, x, y = center_tile(manifest[service]["bounds"], 10)
+    tiles = f"{z}/{x}/{y},{z}/{x + 1}/{y},{z}/0/0"
+    event = function_url_event("GET", f"/{manifest[service]['id']}/{service}/tiles/batch", f"tiles={tiles}&format=png")
+    response = handler(event, lambda_context())
+    assert(response["statusCode"]) == 200
+    parts = parse_multipart(response)
+    assert([headers["Content-Location"] for headers, _ in parts]) == tiles.split(",")
+    assert(parts[0][1][:4]) == b"\x89PNG"
+    assert(parts[2][0]["X-Tile-Status"]) == "404"
+
+def test_handler_rejects_invalid_tile_batch(dataset, handler):
+    _, manifest = dataset
+    event = function_url_event("GET", f"/{manifest['cog']['id']}/cog/tiles/batch", "tiles=10/1")
+    assert(handler(event, lambda_context())["statusCode"]) == 400
+
+def test_handler_reads_tile_batch_matrix_set(dataset, handler):
+    _, manifest = dataset
+    path = f"/{manifest['cog']['id']}/cog/tiles/batch"
+    event = function_url_event("GET", path, "tiles=0/0/0&tileMatrixSetId=NotAMatrixSet")
+    assert(handler(event, lambda_context())["statusCode"]) == 422
+    event = function_url_event("GET", path, "tiles=0/0/0&tileMatrixSetId=WorldCRS84Quad&format=png")
+    assert(handler(event, lambda_context())["statusCode"]) == 200
+
+def test_handler_compresses_rewritten_tilejson(dataset, monkeypatch, tmp_path):
+    import gzip
+
+    root, manifest = dataset
+    monkeypatch.setenv('TITILER_DATA_ROOT', root)
+    monkeypatch.setenv('TITILER_BASE_URL', 'map-tiles.princeton.edu')
+    monkeypatch.setenv('TITILER_COG_CACHE_DIR', str(tmp_path / 'headers'))
+    monkeypatch.setenv('TITILER_COMPRESS_JSON', '1')
+    handler = Mangum(create_app(), lifespan="off")
+    cog_id = manifest["cog"]["id"]
+    response = handler(function_url_event("GET", f"/{cog_id}/cog/statistics"), lambda_context())
+    assert(response["headers"]["content-encoding"]) == "gzip"
+    assert("histogram" in json.loads(gzip.decompress(base64.b64decode(response["body"])))["b1"])
+    response = handler(function_url_event("GET", f"/{cog_id}/cog/WebMercatorQuad/tilejson.json"), lambda_context())
+    tilejson = json.loads(gzip.decompress(base64.b64decode(response["body"])) if response["isBase64Encoded"] else response["body"])
+    assert(tilejson["tiles"][0].startswith(f"https://map-tiles.princeton.edu/{cog_id}/cog/tiles/"))
@@ -0,0 +1,149 @@
+import asyncio
+import io
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.testclient import TestClient
+
+import instrumentation
+from instrumentation import GDALRequestCounter, InstrumentationMiddleware, RequestRecord, stage
+from middleware import resource_from_path
+
+def staged_app():
+    async def app(scope, receive, send):
+        with stage("open"):
+            with stage("read"):
+                pass
+        with stage("read"):
+            counter = GDALRequestCounter()
+            counter.handle(logging.makeLogRecord({"levelno": logging.DEBUG, "msg": "S3: Downloading 0-16383 (http://bucket/file.tif)..."}))
+            counter.handle(logging.makeLogRecord({"levelno": logging.DEBUG, "msg": "S3: Got response_code=206"}))
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"image/png")]})
+        await send({"type": "http.response.body", "body": b"tile"})
+    return app
+
+def test_instrumentation_adds_server_timing_and_emf():
+    stream = io.StringIO()
+    client = TestClient(InstrumentationMiddleware(staged_app(), server_timing=True, emf=True, trace_gdal=False, stream=stream))
+
+    response = client.get('/1234567/cog/tiles/WebMercatorQuad/1/0/0@1x.png')
+
+    names = [entry.split(';')[0] for entry in response.headers['server-timing'].split(', ')]
+    assert(names) == ['open', 'read', 'render', 'middleware', 'total', 'ranges', 'fetched', 'cold']
+    entry = json.loads(stream.getvalue())
+    assert(entry['Service']) == 'cog'
+    assert(entry['Endpoint']) == 'tiles'
+    assert(entry['ResourceId']) == '1234567'
+    assert(entry['RangeRequests']) == 1
+    assert(entry['BytesFetched']) == 16384
+    assert(entry['_aws']['CloudWatchMetrics'][0]['Namespace']) == 'Geoservices/TiTiler'
+
+def test_emf_endpoint_dimension_is_a_route_name():
+    stream = io.StringIO()
+    client = TestClient(InstrumentationMiddleware(staged_app(), server_timing=False, emf=True, trace_gdal=False, stream=stream))
+
+    client.get('/1234567/cog/bbox/-74.7,40.3,-74.6,40.4/256x256.png')
+    client.get('/1234567/cog/point/-74.65,40.35')
+    client.get('/1234567/cog/bbox/-74.8,40.2,-74.5,40.5.png')
+
+    endpoints = [json.loads(line)['Endpoint'] for line in stream.getvalue().splitlines()]
+    assert(endpoints) == ['bbox', 'point', 'bbox']
+
+def test_instrumentation_can_be_header_only():
+    stream = io.StringIO()
+    client = TestClient(InstrumentationMiddleware(staged_app(), server_timing=True, emf=False, trace_gdal=False, stream=stream))
+
+    response = client.get('/healthz')
+
+    assert('total;dur=' in response.headers['server-timing'])
+    assert(stream.getvalue()) == ''
+
+def test_nested_stages_are_counted_once():
+    record = RequestRecord()
+    token = instrumentation._record.set(record)
+    try:
+        with stage("read"):
+            with stage("open"):
+                pass
+    finally:
+        instrumentation._record.reset(token)
+
+    assert(list(record.stages)) == ['read']
+
+def test_overlapping_requests_count_their_own_worker_thread_reads():
+    stream = io.StringIO()
+    pool = ThreadPoolExecutor(max_workers=4)
+    counter = GDALRequestCounter()
+
+    def read(size):
+        counter.handle(logging.makeLogRecord({"levelno": logging.DEBUG, "msg": f"S3: Downloading 0-{size - 1} (http://bucket/file.tif)..."}))
+
+    async def app(scope, receive, send):
+        size = 100 if scope["path"].startswith("/1") else 1000
+        for _ in range(2):
+            pool.submit(instrumentation.in_context(read), size).result()
+            await asyncio.sleep(0)
+        pool.submit(read, size).result()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    middleware = InstrumentationMiddleware(app, server_timing=False, emf=True, trace_gdal=False, stream=stream)
+
+    async def request(path):
+        async def receive():
+            return {"type": "http.request", "body": b""}
+        async def send(message):
+            pass
+        await middleware({"type": "http", "path": path}, receive, send)
+
+    async def both():
+        await asyncio.gather(request("/1/cog/info"), request("/2/cog/info"))
+
+    asyncio.run(both())
+
+    entries = {entry["ResourceId"]: entry for entry in map(json.loads, stream.getvalue().splitlines())}
+    assert(entries["1"]["RangeRequests"], entries["1"]["BytesFetched"]) == (2, 200)
+    assert(entries["2"]["RangeRequests"], entries["2"]["BytesFetched"]) == (2, 2000)
+    assert(instrumentation.current()) is None
+
+def test_resource_from_path():
+    assert(resource_from_path('/1234567/mosaicjson/WebMercatorQuad/tilejson.json')) == ('1234567', 'mosaicjson', 'tilejson')
+    assert(resource_from_path('/1234567/cog/preview.png')) == ('1234567', 'cog', 'preview')
+    assert(resource_from_path('/1234567/cog/tiles/WebMercatorQuad/1/0/0@1x')) == ('1234567', 'cog', 'tiles')
+    assert(resource_from_path('/1234567/cog/tiles/batch')) == ('1234567', 'cog', 'batch')
+    assert(resource_from_path('/1234567/cog/info.geojson')) == ('1234567', 'cog', 'info')
+    assert(resource_from_path('/1234567/cog/bbox/-74.7,40.3,-74.6,40.4/256x256.png')) == ('1234567', 'cog', 'bbox')
+    assert(resource_from_path('/1234567/cog/point/-74.65,40.35')) == ('1234567', 'cog', 'point')
+    assert(resource_from_path('/1234567/mosaicjson/-74.65,40.35/assets')) == ('1234567', 'mosaicjson', 'other')
+    assert(resource_from_path('/1234567/cog/WebMercatorQuad/map')) == ('1234567', 'cog', 'other')
+    assert(resource_from_path('/healthz')) is None
+
+def cold_start_client(monkeypatch, cold=True, initialization_type="on-demand"):
+    monkeypatch.setattr(instrumentation, "_cold", cold)
+    monkeypatch.setattr(instrumentation, "_cold_start_counted", False)
+    monkeypatch.setenv("AWS_LAMBDA_INITIALIZATION_TYPE", initialization_type)
+    monkeypatch.setenv("AWS_LAMBDA_FUNCTION_NAME", "titiler-staging-TitilerFunction")
+    stream = io.StringIO()
+    return TestClient(instrumentation.ColdStartMiddleware(staged_app(), stream=stream)), stream
+
+def test_cold_start_is_counted_once(monkeypatch):
+    client, stream = cold_start_client(monkeypatch)
+    client.get('/healthz')
+    client.get('/1234567/cog/tiles/WebMercatorQuad/1/0/0@1x.png')
+    client.get('/1234567/cog/tiles/WebMercatorQuad/1/0/0@1x.png')
+    entries = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert(len(entries)) == 1
+    assert(entries[0]['ColdStarts']) == 1
+    assert(entries[0]['FunctionName']) == 'titiler-staging-TitilerFunction'
+    assert(entries[0]['_aws']['CloudWatchMetrics'][0]['Dimensions']) == [['FunctionName']]
+
+def test_provisioned_and_warmed_environments_are_not_cold_starts(monkeypatch):
+    client, stream = cold_start_client(monkeypatch, initialization_type="provisioned-concurrency")
+    client.get('/1234567/cog/tiles/WebMercatorQuad/1/0/0@1x.png')
+    assert(stream.getvalue()) == ''
+
+    client, stream = cold_start_client(monkeypatch)
+    instrumentation.mark_warm()
+    client.get('/1234567/cog/tiles/WebMercatorQuad/1/0/0@1x.png')
+    assert(stream.getvalue()) == ''
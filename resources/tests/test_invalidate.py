@@ -0,0 +1,98 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+import invalidate
+
+def test_one_path_per_resource_when_they_fit():
+    assert(invalidate.invalidation_paths(["b2", "a1", "a1"])) == ["/a1/*", "/b2/*"]
+
+def test_resources_are_coalesced_by_longest_prefix():
+    ids = ["1234561", "1234562", "1234563", "1239999", "abcdef1", "abcdef2"]
+    paths = invalidate.invalidation_paths(ids, max_paths=3)
+    assert(paths) == ["/123456*", "/1239999/*", "/abcdef*"]
+    assert(invalidate.invalidation_paths(ids, max_paths=2)) == ["/123*", "/abcdef*"]
+    with pytest.raises(ValueError):
+        invalidate.invalidation_paths(ids, max_paths=1)
+    assert(invalidate.invalidation_paths(ids, max_paths=1, allow_all=True)) == ["/*"]
+
+def test_settle_waits_out_the_longest_in_process_ttl():
+    assert(invalidate.settle_seconds()) == 300
+    assert(invalidate.settle_seconds({"TITILER_MISSING_RESOURCE_TTL": "900"})) == 900
+
+def test_settle_reads_the_function_configuration():
+    class FakeLambda:
+        def get_function_configuration(self, FunctionName):
+            assert(FunctionName) == "titiler-staging-function"
+            return {"Environment": {"Variables": {"TITILER_TILE_CACHE_TTL": "600"}}}
+
+    environment = invalidate.function_environment(FakeLambda(), "titiler-staging-function")
+    assert(invalidate.settle_seconds(environment)) == 600
+
+def test_paths_cover_every_resource():
+    ids = [f"{i:07d}" for i in range(0, 5000, 37)]
+    paths = invalidate.invalidation_paths(ids)
+    assert(len(paths)) <= invalidate.MAX_WILDCARD_PATHS
+    for resource_id in ids:
+        assert(any(f"/{resource_id}/".startswith(path.rstrip("*")) for path in paths))
+
+class FakeCloudFront:
+    def __init__(self):
+        self.batches = []
+        self.waited = []
+
+    def create_invalidation(self, DistributionId, InvalidationBatch):
+        self.batches.append((DistributionId, InvalidationBatch))
+        return {"Invalidation": {"Id": "I1"}}
+
+    def get_waiter(self, name):
+        client = self
+
+        class Waiter:
+            def wait(self, **kwargs):
+                client.waited.append(kwargs)
+        return Waiter()
+
+def test_invalidate_waits_for_completion():
+    client = FakeCloudFront()
+    assert(invalidate.invalidate(client, "E1", ["/a1/*", "/b2/*"])) == "I1"
+    distribution, batch = client.batches[0]
+    assert(distribution) == "E1"
+    assert(batch["Paths"]) == {"Quantity": 2, "Items": ["/a1/*", "/b2/*"]}
+    assert(client.waited) == [{"DistributionId": "E1", "Id": "I1"}]
+
+def test_warm_urls_follow_the_tilejson():
+    pytest.importorskip("morecantile")
+    tilejson = {
+        "minzoom": 2,
+        "maxzoom": 12,
+        "bounds": [-74.7, 40.3, -74.6, 40.4],
+        "tiles": ["https://map-tiles.princeton.edu/1234567/cog/tiles/WebMercatorQuad/{z}/{x}/{y}@1x"],
+    }
+    requested = []
+
+    def fetch(url):
+        requested.append(url)
+        return 200, json.dumps(tilejson).encode()
+
+    urls = invalidate.warm_urls("https://map-tiles.princeton.edu", "1234567", "cog", 2, fetch=fetch)
+    assert(urls[0]) == "https://map-tiles.princeton.edu/1234567/cog/WebMercatorQuad/tilejson.json"
+    assert(urls[1:]) == [
+        "https://map-tiles.princeton.edu/1234567/cog/tiles/WebMercatorQuad/2/1/1@1x",
+        "https://map-tiles.princeton.edu/1234567/cog/tiles/WebMercatorQuad/3/2/3@1x",
+    ]
+    assert(invalidate.warm(urls, fetch=lambda url: (200, b""))) == {"ok": 3, "empty": 0, "errors": 0}
+
+def test_failed_requests_are_counted_as_errors(monkeypatch):
+    def urlopen(request, timeout):
+        raise urllib.error.URLError("connection refused")
+    monkeypatch.setattr(urllib.request, "urlopen", urlopen)
+    assert(invalidate.fetch("https://map-tiles.princeton.edu/1234567/cog/WebMercatorQuad/tilejson.json")) == (None, b"")
+
+    def timeout(request, timeout):
+        raise TimeoutError("timed out")
+    monkeypatch.setattr(urllib.request, "urlopen", timeout)
+    urls = ["https://map-tiles.princeton.edu/a", "https://map-tiles.princeton.edu/b"]
+    assert(invalidate.warm(urls)) == {"ok": 0, "empty": 0, "errors": 2}
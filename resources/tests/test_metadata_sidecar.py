@@ -0,0 +1,126 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+pytest.importorskip("titiler.core")
+pytest.importorskip("rio_cogeo")
+
+from fastapi.testclient import TestClient
+
+import metadata_sidecar
+from benchmarks.synthetic import make_dataset
+from middleware import resource_url
+from routing import Route
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    root = str(tmp_path / 'geodata')
+    manifest = make_dataset(root, grid=1, size=512)
+    monkeypatch.setenv('TITILER_DATA_ROOT', root)
+    monkeypatch.setenv('TITILER_COG_CACHE_DIR', str(tmp_path / 'headers'))
+    monkeypatch.setenv('TITILER_BASE_URL', 'map-tiles.princeton.edu')
+    return manifest['cog']['id']
+
+def create_app(sidecars=False):
+    from application import create_app
+
+    if sidecars:
+        os.environ['TITILER_METADATA_SIDECARS'] = '1'
+    try:
+        return create_app()
+    finally:
+        os.environ.pop('TITILER_METADATA_SIDECARS', None)
+
+def test_sidecar_responses_match_titiler(dataset):
+    metadata_sidecar.write_sidecar(create_app(), dataset)
+    sidecar = json.load(open(resource_url(dataset, 'cog') + metadata_sidecar.SIDECAR_SUFFIX))
+    assert(sidecar['etag']) == metadata_sidecar.source_etag(resource_url(dataset, 'cog'))
+
+    plain = TestClient(create_app())
+    client = TestClient(create_app(sidecars=True))
+    for path in metadata_sidecar.ENDPOINTS:
+        expected = plain.get(f"/{dataset}/cog/{path}").json()
+        assert(client.get(f"/{dataset}/cog/{path}").json()) == expected
+    assert(client.get(f"/{dataset}/cog/WebMercatorQuad/tilejson.json").json()['tiles'][0]).startswith(f"http://map-tiles.princeton.edu/{dataset}/cog/tiles/")
+
+def test_sidecar_skips_opening_the_cog(dataset, monkeypatch):
+    metadata_sidecar.write_sidecar(create_app(), dataset)
+    client = TestClient(create_app(sidecars=True))
+
+    import cog_cache
+
+    def fail(*args, **kwargs):
+        raise AssertionError("COG opened")
+
+    monkeypatch.setattr(cog_cache.CogReader, '__attrs_post_init__', fail)
+    assert(client.get(f"/{dataset}/cog/info").status_code) == 200
+    assert(client.get(f"/{dataset}/cog/bounds").status_code) == 200
+    # Requests with parameters still go to titiler.
+    with pytest.raises(AssertionError):
+        client.get(f"/{dataset}/cog/statistics", params={'bidx': 1})
+
+def test_stale_sidecar_is_ignored(dataset):
+    metadata_sidecar.write_sidecar(create_app(), dataset)
+    path = resource_url(dataset, 'cog') + metadata_sidecar.SIDECAR_SUFFIX
+    sidecar = json.load(open(path))
+    sidecar['etag'] = 'replaced'
+    sidecar['responses']['bounds']['bounds'] = [0, 0, 0, 0]
+    json.dump(sidecar, open(path, 'w'))
+
+    response = TestClient(create_app(sidecars=True)).get(f"/{dataset}/cog/bounds")
+    assert(response.status_code) == 200
+    assert(response.json()['bounds']) != [0, 0, 0, 0]
+
+def test_missing_sidecars_are_cached(dataset, monkeypatch):
+    reads = []
+    read_sidecar = metadata_sidecar.read_sidecar
+    monkeypatch.setattr(metadata_sidecar, 'read_sidecar', lambda url: reads.append(url) or read_sidecar(url))
+    client = TestClient(create_app(sidecars=True))
+    assert(client.get(f"/{dataset}/cog/info").status_code) == 200
+    assert(client.get(f"/{dataset}/cog/info").status_code) == 200
+    assert(reads) == [resource_url(dataset, 'cog')]
+
+def test_a_missing_sidecar_costs_one_request(dataset, monkeypatch):
+    heads = []
+    source_etag = metadata_sidecar.source_etag
+    monkeypatch.setattr(metadata_sidecar, 'source_etag', lambda url: heads.append(url) or source_etag(url))
+    sidecars = metadata_sidecar.MetadataSidecars(ttl=0)
+    url = resource_url(dataset, 'cog')
+    assert(asyncio.run(sidecars.get(url))) is None
+    assert(heads) == []
+
+    # An expired entry with a sidecar is revalidated with the COG's ETag alone.
+    metadata_sidecar.write_sidecar(create_app(), dataset)
+    heads.clear()
+    reads = []
+    read_sidecar = metadata_sidecar.read_sidecar
+    monkeypatch.setattr(metadata_sidecar, 'read_sidecar', lambda url: reads.append(url) or read_sidecar(url))
+    assert(asyncio.run(sidecars.get(url))) is not None
+    assert(asyncio.run(sidecars.get(url))) is not None
+    assert((len(reads), len(heads))) == (1, 2)
+
+def test_sidecars_require_the_global_access_token(dataset, monkeypatch):
+    monkeypatch.setenv('TITILER_API_GLOBAL_ACCESS_TOKEN', 'secret')
+    metadata_sidecar.write_sidecar(create_app(), dataset)
+    client = TestClient(create_app(sidecars=True))
+
+    import cog_cache
+
+    def fail(*args, **kwargs):
+        raise AssertionError("COG opened")
+
+    monkeypatch.setattr(cog_cache.CogReader, '__attrs_post_init__', fail)
+    assert(client.get(f"/{dataset}/cog/info").status_code) == 401
+    assert(client.get(f"/{dataset}/cog/info", params={'access_token': 'wrong'}).status_code) == 401
+    assert(client.get(f"/{dataset}/cog/info", params={'access_token': 'secret'}).status_code) == 200
+
+def test_sidecars_serve_every_service_routed_to_the_cog_router():
+    routes = {
+        "cog": Route("cog", "cog", "display_raster.tif"),
+        "original": Route("original", "cog", "original.tif"),
+        "mosaicjson": Route("mosaicjson", "mosaicjson", "mosaic.json"),
+    }
+    middleware = metadata_sidecar.MetadataSidecarMiddleware(None, sidecars=object(), routes=routes)
+    assert(middleware.services) == {"cog", "original"}
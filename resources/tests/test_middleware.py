@@ -3,7 +3,7 @@ import json
 
 from fastapi import FastAPI, Request
 from starlette.testclient import TestClient
-from middleware import HostMiddleware, RewriteMiddleware, TileJSONMiddleware
+from middleware import TitilerMiddleware
 
 def test_staging_middleware_for_mosaics_with_id_in_url(monkeypatch):
     monkeypatch.setenv('TITILER_BASE_URL', 'base_url')
@@ -15,9 +15,7 @@ def test_staging_middleware_for_mosaics_with_id_in_url(monkeypatch):
         request_args = dict(req.query_params)
         return json.dumps(request_args)
 
-    app.add_middleware(HostMiddleware)
-    app.add_middleware(RewriteMiddleware)
-    app.add_middleware(TileJSONMiddleware)
+    app.add_middleware(TitilerMiddleware)
 
     with TestClient(app) as client:
         response = client.get('/123456/mosaicjson?stage=staging')
@@ -33,9 +31,7 @@ def test_production_middleware_for_mosaics_with_id_in_url(monkeypatch):
         request_args = dict(req.query_params)
         return json.dumps(request_args)
 
-    app.add_middleware(HostMiddleware)
-    app.add_middleware(RewriteMiddleware)
-    app.add_middleware(TileJSONMiddleware)
+    app.add_middleware(TitilerMiddleware)
 
     with TestClient(app) as client:
         response = client.get('/123456/mosaicjson?stage=production')
@@ -51,9 +47,7 @@ def test_staging_middleware_for_cogs_with_id_in_url(monkeypatch):
         request_args = dict(req.query_params)
         return json.dumps(request_args)
 
-    app.add_middleware(HostMiddleware)
-    app.add_middleware(RewriteMiddleware)
-    app.add_middleware(TileJSONMiddleware)
+    app.add_middleware(TitilerMiddleware)
 
     with TestClient(app) as client:
         response = client.get('/123456/cog?stage=staging')
@@ -69,9 +63,7 @@ def test_production_middleware_for_cogs_with_id_in_url(monkeypatch):
         request_args = dict(req.query_params)
         return json.dumps(request_args)
 
-    app.add_middleware(HostMiddleware)
-    app.add_middleware(RewriteMiddleware)
-    app.add_middleware(TileJSONMiddleware)
+    app.add_middleware(TitilerMiddleware)
 
     with TestClient(app) as client:
         response = client.get('/123456/cog?stage=production')
@@ -87,9 +79,7 @@ def test_middleware_for_mosaic_tilejson(monkeypatch):
         tilejson = {"tilejson":"2.2.0","version":"1.0.0","scheme":"xyz","tiles":["https://tiles.prod/mosaicjson/tiles/WebMercatorQuad/{z}/{x}/{y}@1x?url=s3%3A%2F%2Fgeo-production%2F24%2F43%2F18%2F2443189116dd4a28bdd7da1384deb51e%2Fmosaic.json"],"minzoom":8,"maxzoom":13,"bounds":[67.50154032366855,9.00205452967639,94.49732854268473,31.999615061786308],"center":[80.99943443317665,20.50083479573135,8]}
         return tilejson
 
-    app.add_middleware(HostMiddleware)
-    app.add_middleware(RewriteMiddleware)
-    app.add_middleware(TileJSONMiddleware)
+    app.add_middleware(TitilerMiddleware)
 
     with TestClient(app) as client:
         response = client.get('/2443189116dd4a28bdd7da1384deb51e/mosaicjson/tilejson.json?stage=production')
@@ -105,15 +95,12 @@ def test_middleware_for_cog_tilejson(monkeypatch):
         tilejson = {"tilejson":"2.2.0","version":"1.0.0","scheme":"xyz","tiles":["https://tiles.prod/cog/tiles/WebMercatorQuad/{z}/{x}/{y}@1x?url=s3%3A%2F%2Fgeo-production%2F24%2F43%2F18%2F2443189116dd4a28bdd7da1384deb51e%2Fdisplay_raster.tif"],"minzoom":8,"maxzoom":13,"bounds":[67.50154032366855,9.00205452967639,94.49732854268473,31.999615061786308],"center":[80.99943443317665,20.50083479573135,8]}
         return tilejson
 
-    app.add_middleware(HostMiddleware)
-    app.add_middleware(RewriteMiddleware)
-    app.add_middleware(TileJSONMiddleware)
+    app.add_middleware(TitilerMiddleware)
 
     with TestClient(app) as client:
         response = client.get('/2443189116dd4a28bdd7da1384deb51e/cog/tilejson.json?stage=production')
         assert(response.json()['tiles']) == ['https://tiles.prod/2443189116dd4a28bdd7da1384deb51e/cog/tiles/WebMercatorQuad/{z}/{x}/{y}@1x']
 
-
 def test_middleware_with_cors_preflight_options_method(monkeypatch):
     monkeypatch.setenv('TITILER_BASE_URL', 'base_url')
     monkeypatch.setenv('TITILER_S3_BUCKET', 'figgy-geo-production')
@@ -124,12 +111,111 @@ def test_middleware_with_cors_preflight_options_method(monkeypatch):
         tilejson = {"tilejson":"2.2.0","version":"1.0.0","scheme":"xyz","tiles":["https://tiles.prod/mosaicjson/tiles/WebMercatorQuad/{z}/{x}/{y}@1x?url=s3%3A%2F%2Fgeo-production%2F24%2F43%2F18%2F2443189116dd4a28bdd7da1384deb51e%2Fmosaic.json"],"minzoom":8,"maxzoom":13,"bounds":[67.50154032366855,9.00205452967639,94.49732854268473,31.999615061786308],"center":[80.99943443317665,20.50083479573135,8]}
         return tilejson
 
-    app.add_middleware(HostMiddleware)
-    app.add_middleware(RewriteMiddleware)
-    app.add_middleware(TileJSONMiddleware)
+    app.add_middleware(TitilerMiddleware)
 
     with TestClient(app) as client:
         try:
             client.options('/2443189116dd4a28bdd7da1384deb51e/mosaicjson/tilejson.json?stage=production')
         except KeyError:
             pytest.fail("OPTIONS method raises an error")
+
+def test_titiler_middleware_for_cogs_with_id_in_url(monkeypatch):
+    monkeypatch.setenv('TITILER_BASE_URL', 'base_url')
+    monkeypatch.setenv('TITILER_S3_BUCKET', 'figgy-geo-production')
+    app = FastAPI()
+
+    @app.get("/cog/tiles/{z}/{x}/{y}")
+    async def route1(req: Request, z: int, x: int, y: int):
+        request_args = dict(req.query_params)
+        return json.dumps(request_args)
+
+    app.add_middleware(TitilerMiddleware)
+
+    with TestClient(app) as client:
+        response = client.get('/123456/cog/tiles/1/2/3')
+        assert(json.loads(response.json())['url']) == 's3://figgy-geo-production/12/34/56/123456/display_raster.tif'
+
+def test_titiler_middleware_replaces_url_parameter(monkeypatch):
+    monkeypatch.setenv('TITILER_BASE_URL', 'base_url')
+    monkeypatch.setenv('TITILER_S3_BUCKET', 'figgy-geo-production')
+    app = FastAPI()
+
+    @app.get("/cog")
+    async def route1(req: Request):
+        return json.dumps(req.query_params.getlist('url'))
+
+    app.add_middleware(TitilerMiddleware)
+
+    with TestClient(app) as client:
+        response = client.get('/123456/cog?url=s3://elsewhere/file.tif')
+        assert(json.loads(response.json())) == ['s3://figgy-geo-production/12/34/56/123456/display_raster.tif']
+
+def test_titiler_middleware_sets_host(monkeypatch):
+    monkeypatch.setenv('TITILER_BASE_URL', 'tiles.example.edu')
+    monkeypatch.setenv('TITILER_S3_BUCKET', 'figgy-geo-production')
+    app = FastAPI()
+
+    @app.get("/healthz")
+    async def route1(req: Request):
+        return req.headers.getlist('host')
+
+    app.add_middleware(TitilerMiddleware)
+
+    with TestClient(app) as client:
+        response = client.get('/healthz')
+        assert(response.json()) == ['tiles.example.edu']
+
+TILEJSON = {"tilejson":"2.2.0","version":"1.0.0","scheme":"xyz","tiles":["https://tiles.prod/cog/tiles/WebMercatorQuad/{z}/{x}/{y}@1x?url=s3%3A%2F%2Fgeo-production%2F24%2F43%2F18%2F2443189116dd4a28bdd7da1384deb51e%2Fdisplay_raster.tif"],"minzoom":8,"maxzoom":13}
+
+def tilejson_app(calls, status=200, content_type=b"application/json", chunk_size=16):
+    async def app(scope, receive, send):
+        calls.append(scope["path"])
+        body = json.dumps(TILEJSON).encode()
+        await send({"type": "http.response.start", "status": status, "headers": [
+            (b"content-type", content_type),
+            (b"content-length", str(len(body)).encode()),
+        ]})
+        chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+        for i, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1})
+    return app
+
+def test_titiler_middleware_rewrites_multi_chunk_tilejson(monkeypatch):
+    monkeypatch.setenv('TITILER_S3_BUCKET', 'figgy-geo-production')
+    calls = []
+
+    client = TestClient(TitilerMiddleware(tilejson_app(calls)))
+    response = client.get('/2443189116dd4a28bdd7da1384deb51e/cog/tilejson.json')
+    assert(response.json()['tiles']) == ['https://tiles.prod/2443189116dd4a28bdd7da1384deb51e/cog/tiles/WebMercatorQuad/{z}/{x}/{y}@1x']
+    assert(int(response.headers['content-length'])) == len(response.content)
+
+def test_titiler_middleware_caches_tilejson(monkeypatch):
+    monkeypatch.setenv('TITILER_S3_BUCKET', 'figgy-geo-production')
+    calls = []
+
+    client = TestClient(TitilerMiddleware(tilejson_app(calls)))
+    first = client.get('/2443189116dd4a28bdd7da1384deb51e/cog/tilejson.json?tile_scale=2')
+    second = client.get('/2443189116dd4a28bdd7da1384deb51e/cog/tilejson.json?tile_scale=2')
+    client.get('/2443189116dd4a28bdd7da1384deb51e/cog/tilejson.json?tile_scale=1')
+    assert(first.content) == second.content
+    assert(second.headers['content-length']) == first.headers['content-length']
+    assert(len(calls)) == 2
+
+def test_titiler_middleware_skips_tilejson_errors(monkeypatch):
+    monkeypatch.setenv('TITILER_S3_BUCKET', 'figgy-geo-production')
+    calls = []
+
+    client = TestClient(TitilerMiddleware(tilejson_app(calls, status=500)))
+    response = client.get('/2443189116dd4a28bdd7da1384deb51e/cog/tilejson.json')
+    client.get('/2443189116dd4a28bdd7da1384deb51e/cog/tilejson.json')
+    assert(response.status_code) == 500
+    assert(response.json()) == TILEJSON
+    assert(len(calls)) == 2
+
+def test_titiler_middleware_skips_non_json_tilejson(monkeypatch):
+    monkeypatch.setenv('TITILER_S3_BUCKET', 'figgy-geo-production')
+    calls = []
+
+    client = TestClient(TitilerMiddleware(tilejson_app(calls, content_type=b"text/html")))
+    response = client.get('/2443189116dd4a28bdd7da1384deb51e/cog/tilejson.json')
+    assert(response.json()) == TILEJSON
@@ -0,0 +1,150 @@
+import io
+import json
+
+import pytest
+
+pytest.importorskip("cogeo_mosaic")
+botocore_exceptions = pytest.importorskip("botocore.exceptions")
+
+from cogeo_mosaic.backends.s3 import S3Backend
+from cogeo_mosaic.mosaic import MosaicJSON
+from mosaic_cache import CachedS3Backend, MosaicDocumentCache
+from quadkey_index import QuadkeyIndex, mosaic_metadata
+import mosaic_cache
+
+MOSAIC = MosaicJSON(
+    mosaicjson="0.0.3",
+    minzoom=7,
+    maxzoom=9,
+    quadkey_zoom=7,
+    bounds=[-75.0, 40.0, -74.0, 41.0],
+    tiles={
+        "0320100": ["s3://figgy-geo-staging/12/34/56/123456/display_raster.tif"],
+        "0320011": ["s3://figgy-geo-staging/ab/cd/ef/abcdef/display_raster.tif"],
+    },
+)
+
+class FakeS3:
+    def __init__(self, body, etag='"abc"', sidecar=None):
+        self.body = body
+        self.etag = etag
+        self.sidecar = sidecar
+        self.requests = []
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        if Key.endswith(".idx"):
+            self.requests.append("sidecar")
+            if self.sidecar is None:
+                raise botocore_exceptions.ClientError(
+                    {"Error": {"Code": "404", "Message": "Not Found"}, "ResponseMetadata": {"HTTPStatusCode": 404}},
+                    "GetObject",
+                )
+            return {"Body": io.BytesIO(self.sidecar)}
+        self.requests.append(IfNoneMatch)
+        if IfNoneMatch == self.etag:
+            raise botocore_exceptions.ClientError(
+                {"Error": {"Code": "304", "Message": "Not Modified"}, "ResponseMetadata": {"HTTPStatusCode": 304}},
+                "GetObject",
+            )
+        return {"Body": io.BytesIO(self.body), "ETag": self.etag}
+
+@pytest.fixture
+def documents(monkeypatch):
+    cache = MosaicDocumentCache(ttl=300)
+    monkeypatch.setattr(mosaic_cache, "documents", cache)
+    return cache
+
+def test_mosaic_documents_are_cached(documents):
+    client = FakeS3(MOSAIC.model_dump_json().encode())
+    url = "s3://figgy-geo-staging/12/34/56/123456/mosaic.json"
+
+    with CachedS3Backend(url, client=client) as mosaic:
+        assert(sorted(mosaic._quadkeys)) == sorted(MOSAIC.tiles)
+        assert(mosaic.assets_for_tile(36, 48, 7)) == MOSAIC.tiles["0320100"]
+    with CachedS3Backend(url, client=client) as mosaic:
+        assert(mosaic.bounds) == MOSAIC.bounds
+
+    assert(client.requests) == [None]
+    assert(documents.stats()["hits"]) == 1
+    assert(documents.stats()["misses"]) == 1
+    assert(documents.stats()["bytes"]) > 0
+
+def test_mosaic_documents_are_revalidated_with_etag(documents):
+    client = FakeS3(MOSAIC.model_dump_json().encode())
+    url = "s3://figgy-geo-staging/12/34/56/123456/mosaic.json"
+    documents.documents.ttl = 0
+
+    CachedS3Backend(url, client=client)
+    CachedS3Backend(url, client=client)
+    client.etag = '"def"'
+    CachedS3Backend(url, client=client)
+
+    assert(client.requests) == [None, '"abc"', '"abc"']
+    assert(documents.stats()["revalidations"]) == 2
+    assert(documents.stats()["not_modified"]) == 1
+
+def test_mosaic_documents_are_bounded_by_size(documents):
+    client = FakeS3(MOSAIC.model_dump_json().encode())
+    documents.documents.maxbytes = 1
+
+    CachedS3Backend("s3://figgy-geo-staging/12/34/56/123456/mosaic.json", client=client)
+
+    assert(len(documents.documents)) == 0
+
+def test_mosaic_documents_load_from_index_sidecar(documents, monkeypatch):
+    monkeypatch.setenv("TITILER_MOSAIC_SIDECARS", "1")
+    index = QuadkeyIndex.from_tiles(MOSAIC.tiles, 7)
+    sidecar = index.to_bytes({"etag": '"abc"', "mosaic": mosaic_metadata(MOSAIC)})
+    client = FakeS3(b"not parsed", sidecar=sidecar)
+
+    with CachedS3Backend("s3://figgy-geo-staging/12/34/56/123456/mosaic.json", client=client) as mosaic:
+        assert(mosaic.assets_for_tile(36, 48, 7)) == MOSAIC.tiles["0320100"]
+        assert(mosaic.bounds) == MOSAIC.bounds
+
+    assert(client.requests) == ["sidecar", '"abc"']
+
+def test_stale_index_sidecars_are_ignored(documents, monkeypatch):
+    monkeypatch.setenv("TITILER_MOSAIC_SIDECARS", "1")
+    sidecar = QuadkeyIndex.from_tiles({"0320101": ["old.tif"]}, 7).to_bytes({"etag": '"old"', "mosaic": mosaic_metadata(MOSAIC)})
+    client = FakeS3(MOSAIC.model_dump_json().encode(), sidecar=sidecar)
+
+    with CachedS3Backend("s3://figgy-geo-staging/12/34/56/123456/mosaic.json", client=client) as mosaic:
+        assert(sorted(mosaic._quadkeys)) == sorted(MOSAIC.tiles)
+
+    assert(client.requests) == ["sidecar", '"old"']
+
+def test_cached_documents_match_the_uncached_backend(documents, monkeypatch):
+    url = "s3://figgy-geo-staging/12/34/56/123456/mosaic.json"
+    uncached = S3Backend(url, client=FakeS3(MOSAIC.model_dump_json().encode()))
+
+    def assert_matches(mosaic):
+        assert(mosaic.document().model_dump()) == uncached.mosaic_def.model_dump()
+        assert(mosaic.mosaic_def.tiles) == {}
+        assert(mosaic.mosaicid) == uncached.mosaicid
+        assert(mosaic.info().model_dump()) == uncached.info().model_dump()
+        assert(sorted(mosaic.info(quadkeys=True).quadkeys)) == sorted(MOSAIC.tiles)
+
+    # Parsed from the document, then from the cache.
+    client = FakeS3(MOSAIC.model_dump_json().encode())
+    assert_matches(CachedS3Backend(url, client=client))
+    assert_matches(CachedS3Backend(url, client=client))
+    assert(client.requests) == [None]
+
+    # Loaded from the index sidecar.
+    documents.clear()
+    monkeypatch.setenv("TITILER_MOSAIC_SIDECARS", "1")
+    sidecar = QuadkeyIndex.from_tiles(MOSAIC.tiles, 7).to_bytes({"etag": '"abc"', "mosaic": mosaic_metadata(MOSAIC)})
+    assert_matches(CachedS3Backend(url, client=FakeS3(b"not parsed", sidecar=sidecar)))
+
+def test_document_endpoint_serves_the_tiles(documents, monkeypatch):
+    from fastapi import FastAPI
+    from starlette.testclient import TestClient
+
+    monkeypatch.setattr(mosaic_cache, "s3_client", lambda: FakeS3(MOSAIC.model_dump_json().encode()))
+    app = FastAPI()
+    app.include_router(mosaic_cache.MosaicTilerFactory(backend=mosaic_cache.MosaicBackend).router)
+    client = TestClient(app)
+
+    response = client.get("/", params={"url": "s3://figgy-geo-staging/12/34/56/123456/mosaic.json"})
+    assert(response.status_code) == 200
+    assert(response.json()["tiles"]) == MOSAIC.tiles
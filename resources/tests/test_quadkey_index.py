@@ -0,0 +1,47 @@
+import random
+
+import pytest
+
+pytest.importorskip("cogeo_mosaic")
+
+import morecantile
+from cogeo_mosaic.backends.memory import MemoryBackend
+from cogeo_mosaic.mosaic import MosaicJSON
+
+from quadkey_index import QuadkeyIndex, quadkey_string, tile_quadkey
+
+WEB_MERCATOR = morecantile.tms.get("WebMercatorQuad")
+
+def random_mosaic(quadkey_zoom=9, count=300, seed=1):
+    rng = random.Random(seed)
+    tiles = {}
+    for _ in range(count):
+        x, y = rng.randrange(140, 160), rng.randrange(180, 200)
+        tiles[WEB_MERCATOR.quadkey(x, y, quadkey_zoom)] = [f"s3://bucket/{rng.randrange(50)}.tif" for _ in range(rng.randrange(1, 4))]
+    return MosaicJSON(mosaicjson="0.0.3", minzoom=6, maxzoom=12, quadkey_zoom=quadkey_zoom,
+                      bounds=[-80.0, 35.0, -70.0, 45.0], tiles=tiles)
+
+def test_tile_quadkey_matches_morecantile():
+    for x, y, z in [(0, 0, 0), (1, 0, 1), (301, 384, 10), (9647, 12321, 15)]:
+        assert(quadkey_string(tile_quadkey(x, y, z), z)) == WEB_MERCATOR.quadkey(x, y, z)
+
+def test_index_matches_mosaic_backend_lookups():
+    mosaic = random_mosaic()
+    index = QuadkeyIndex.from_tiles(mosaic.tiles, 9)
+    with MemoryBackend(mosaic_def=mosaic) as backend:
+        for z in (5, 7, 9, 11):
+            scale = 2 ** (z - 9)
+            for x in range(int(138 * scale), int(162 * scale) + 1, max(1, int(scale))):
+                for y in range(int(178 * scale), int(202 * scale) + 1, max(1, int(scale))):
+                    assert(index.assets_for_tile(x, y, z)) == backend.get_assets(x, y, z)
+
+def test_index_sidecar_round_trip():
+    mosaic = random_mosaic()
+    index = QuadkeyIndex.from_tiles(mosaic.tiles, 9)
+    loaded, metadata = QuadkeyIndex.from_bytes(index.to_bytes({"etag": '"abc"'}))
+    assert(metadata) == {"etag": '"abc"'}
+    assert(loaded.quadkey_strings()) == sorted(mosaic.tiles)
+    assert(loaded.assets_for_tile(37, 48, 7)) == index.assets_for_tile(37, 48, 7)
+
+def test_index_requires_quadkeys_at_quadkey_zoom():
+    assert(QuadkeyIndex.from_tiles({"0320": ["a.tif"], "03201": ["b.tif"]}, 4)) is None
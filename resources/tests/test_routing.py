@@ -0,0 +1,105 @@
+import json
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from starlette.testclient import TestClient
+
+import routing
+from middleware import TitilerMiddleware
+
+def echo_app(middleware, **kwargs):
+    app = FastAPI()
+
+    @app.get("/{service}/info")
+    async def info(req: Request, service: str):
+        return {"service": service, **dict(req.query_params)}
+
+    app.add_middleware(middleware, **kwargs)
+    return app
+
+def record_lookups(monkeypatch):
+    lookups = []
+    exists = routing.storage.exists
+    monkeypatch.setattr(routing.storage, 'exists', lambda url: lookups.append(url) or exists(url))
+    return lookups
+
+def test_load_routes(tmp_path):
+    path = tmp_path / 'routes.json'
+    path.write_text(json.dumps({"routes": {"cog": {"file": "display_raster.tif"}, "original": {"router": "cog", "file": "original.tif"}}}))
+    routes = routing.load_routes(str(path))
+    assert(routes['cog']) == routing.Route('cog', 'cog', 'display_raster.tif')
+    assert(routes['original']) == routing.Route('original', 'cog', 'original.tif')
+
+    path.write_text(json.dumps({"routes": {"cog": {"router": "cog"}}}))
+    with pytest.raises(ValueError):
+        routing.load_routes(str(path))
+
+def test_resolver_builds_and_memoizes_urls():
+    resolver = routing.Resolver('s3://figgy-geo-staging')
+    assert(resolver.url('123456', 'cog')) == 's3://figgy-geo-staging/12/34/56/123456/display_raster.tif'
+    assert(resolver.url('123456', 'mosaicjson')) == 's3://figgy-geo-staging/12/34/56/123456/mosaic.json'
+    assert(resolver.url('123456', 'cog')) == 's3://figgy-geo-staging/12/34/56/123456/display_raster.tif'
+    assert(resolver.url.cache_info().hits) == 1
+    assert(resolver.url('12345', 'cog')) is None
+    assert(resolver.url('..', 'cog')) is None
+    assert(resolver.url('123456', 'stac')) is None
+
+def test_routes_can_share_a_router(monkeypatch):
+    monkeypatch.setenv('TITILER_S3_BUCKET', 'figgy-geo-staging')
+    routes = {**routing.ROUTES, 'original': routing.Route('original', 'cog', 'original.tif')}
+    with TestClient(echo_app(TitilerMiddleware, routes=routes)) as client:
+        assert(client.get('/123456/original/info').json()) == {
+            'service': 'cog', 'url': 's3://figgy-geo-staging/12/34/56/123456/original.tif'
+        }
+
+def test_invalid_resource_ids_are_rejected(monkeypatch):
+    monkeypatch.setenv('TITILER_S3_BUCKET', 'figgy-geo-staging')
+    with TestClient(echo_app(TitilerMiddleware)) as client:
+        response = client.get('/12/cog/info')
+        assert(response.status_code) == 404
+        assert(response.json()) == {'detail': 'Resource not found'}
+
+def test_missing_resources_are_rejected(monkeypatch, tmp_path):
+    monkeypatch.setenv('TITILER_DATA_ROOT', str(tmp_path))
+    monkeypatch.setenv('TITILER_CHECK_RESOURCES', '1')
+    lookups = record_lookups(monkeypatch)
+    cog = tmp_path / '12' / '34' / '56' / '123456' / 'display_raster.tif'
+    cog.parent.mkdir(parents=True)
+    cog.write_bytes(b'')
+
+    with TestClient(echo_app(TitilerMiddleware)) as client:
+        assert(client.get('/123456/cog/info').status_code) == 200
+        assert(client.get('/123456/cog/info').status_code) == 200
+        assert(client.get('/123456/mosaicjson/info').status_code) == 404
+        assert(client.get('/123456/mosaicjson/info').status_code) == 404
+    assert(lookups) == [str(cog), str(cog.parent / 'mosaic.json')]
+
+def test_failed_opens_of_missing_resources_are_cached(monkeypatch, tmp_path):
+    monkeypatch.setenv('TITILER_DATA_ROOT', str(tmp_path))
+    lookups = record_lookups(monkeypatch)
+    existing = tmp_path / 'ab' / 'cd' / 'ef' / 'abcdef' / 'display_raster.tif'
+    existing.parent.mkdir(parents=True)
+    existing.write_bytes(b'')
+    opens = []
+    app = FastAPI()
+
+    # titiler answers 500 when a COG can't be opened and 404 for tiles
+    # outside its bounds.
+    @app.get("/cog/info")
+    async def info(url: str):
+        opens.append(url)
+        if url == str(existing):
+            return JSONResponse({'detail': 'Tile is outside bounds'}, status_code=404)
+        return JSONResponse({'detail': 'No such file or directory'}, status_code=500)
+
+    app.add_middleware(TitilerMiddleware)
+    with TestClient(app) as client:
+        assert(client.get('/123456/cog/info').status_code) == 500
+        assert(client.get('/123456/cog/info').json()) == {'detail': 'Resource not found'}
+        assert(client.get('/abcdef/cog/info').status_code) == 404
+        assert(client.get('/abcdef/cog/info').status_code) == 404
+    missing = str(tmp_path / '12' / '34' / '56' / '123456' / 'display_raster.tif')
+    assert(opens) == [missing, str(existing), str(existing)]
+    # Tiles outside the bounds don't look the file up.
+    assert(lookups) == [missing]
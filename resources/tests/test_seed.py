@@ -0,0 +1,53 @@
+import argparse
+import os
+
+import pytest
+
+pytest.importorskip("titiler.core")
+pytest.importorskip("rio_cogeo")
+
+import seed
+from benchmarks.synthetic import make_dataset
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory):
+    root = str(tmp_path_factory.mktemp("geodata"))
+    return root, make_dataset(root, grid=1, size=512)
+
+@pytest.fixture
+def app(dataset, monkeypatch, tmp_path):
+    root, _ = dataset
+    monkeypatch.setenv('TITILER_DATA_ROOT', root)
+    monkeypatch.setenv('TITILER_COG_CACHE_DIR', str(tmp_path / 'headers'))
+    from application import create_app
+    return create_app()
+
+def test_seed_plans_tiles_from_tilejson(dataset, app):
+    _, manifest = dataset
+    args = argparse.Namespace(tms="WebMercatorQuad", minzoom=None, maxzoom=None, scale=1, format=None)
+    _, minzoom, maxzoom = seed.resource_extent(app, manifest['cog']['id'], 'cog', 'WebMercatorQuad')
+    tasks, counts = seed.plan(app, [f"{manifest['cog']['id']}/cog"], args)
+    assert(len(tasks)) == sum(counts.values())
+    assert(sorted({task[3] for task in tasks})) == list(range(minzoom, maxzoom + 1))
+
+    args.maxzoom = minzoom
+    assert({task[3] for task in seed.plan(app, [f"{manifest['cog']['id']}/cog"], args)[0]}) == {minzoom}
+
+def test_seed_renders_tiles_into_store(dataset, app, tmp_path, monkeypatch):
+    _, manifest = dataset
+    monkeypatch.setenv('TITILER_TILE_STORE', str(tmp_path / 'middleware'))
+    seed.init_worker(str(tmp_path / 'tiles'))
+    args = argparse.Namespace(tms="WebMercatorQuad", minzoom=None, maxzoom=None, scale=1, format=None)
+    tasks, _ = seed.plan(app, [f"{manifest['cog']['id']}/cog"], args)
+    status, size, _ = seed.render_tile(tasks[0])
+    assert(status) == 200
+    resource_id, service, tms, z, x, y, _, _ = tasks[0]
+    # The path TileJSON tile urls request.
+    path = tmp_path / 'tiles' / resource_id / service / 'tiles' / tms / str(z) / str(x) / f"{y}@1x"
+    assert(os.path.getsize(path)) == size
+    # Written once, by the seeder, not again by TileStoreMiddleware.
+    assert('TileStoreMiddleware' in [m.cls.__name__ for m in seed._app.user_middleware]) is False
+
+    status, size, _ = seed.render_tile(tasks[0][:-1] + ("png",))
+    assert(status) == 200
+    assert(os.path.getsize(path.with_name(f"{y}@1x.png"))) == size
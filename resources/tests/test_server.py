@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+pytest.importorskip("titiler.core")
+
+from starlette.testclient import TestClient
+
+import server
+
+def test_warmer_events_are_handled():
+    client = TestClient(server.app, client=("127.0.0.1", 50000))
+    response = client.post("/events", json={"warmer": {"concurrency": 1}})
+    assert(response.status_code) == 200
+    assert(response.json()["warmed"]) == True
+    assert(client.post("/events", json={"Records": []}).json()) == {"handled": False}
+    assert(client.post("/events", json={"warmer": {"concurrency": -1}}).status_code) == 400
+
+def test_events_come_only_from_the_adapter_pass_through(monkeypatch):
+    monkeypatch.delenv("AWS_LAMBDA_FUNCTION_NAME", raising=False)
+    event = {"warmer": {"concurrency": 1}}
+    assert(TestClient(server.app).post("/events", json=event).status_code) == 403
+
+    # In Lambda, requests that reach the server through the function url
+    # carry the adapter's request context.
+    monkeypatch.setenv("AWS_LAMBDA_FUNCTION_NAME", "titiler")
+    client = TestClient(server.app)
+    lambda_context = json.dumps({"invoked_function_arn": "arn:aws:lambda:us-east-1:1:function:titiler"})
+    assert(client.post("/events", json=event).status_code) == 403
+    headers = {"x-amzn-lambda-context": lambda_context, "x-amzn-request-context": "{}"}
+    assert(client.post("/events", json=event, headers=headers).status_code) == 403
+    assert(client.post("/events", json=event, headers={"x-amzn-lambda-context": lambda_context}).status_code) == 200
+
+def test_lambda_context_from_adapter_header():
+    context = server.context_from_header(json.dumps({"invoked_function_arn": "arn:aws:lambda:us-east-1:1:function:titiler"}))
+    assert(context.invoked_function_arn) == "arn:aws:lambda:us-east-1:1:function:titiler"
+    assert(server.context_from_header(None)) is None
+
+def test_workers_import_the_app_by_name(monkeypatch):
+    uvicorn = pytest.importorskip("uvicorn")
+    runs = []
+    monkeypatch.setattr(uvicorn, "run", lambda app, **kwargs: runs.append((app, kwargs["workers"])))
+    server.main()
+    monkeypatch.setenv("TITILER_WORKERS", "4")
+    server.main()
+    assert(runs) == [(server.app, 1), ("server:app", 4)]
@@ -0,0 +1,56 @@
+import time
+
+from starlette.testclient import TestClient
+
+from caches import DiskCache
+from tile_cache import TileCacheMiddleware, cache_key, decode_entry, encode_entry
+
+def tile_app(calls, status=200):
+    async def app(scope, receive, send):
+        calls.append(scope["path"])
+        await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"image/png")]})
+        await send({"type": "http.response.body", "body": b"\x89PNG", "more_body": True})
+        await send({"type": "http.response.body", "body": b"tile"})
+    return app
+
+def test_tile_cache_serves_repeat_requests(tmp_path):
+    calls = []
+    client = TestClient(TileCacheMiddleware(tile_app(calls), DiskCache(str(tmp_path), 1024)))
+
+    first = client.get('/cog/tiles/WebMercatorQuad/1/0/0@1x?url=s3://bucket/file.tif&bidx=1')
+    second = client.get('/cog/tiles/WebMercatorQuad/1/0/0@1x?bidx=1&url=s3://bucket/file.tif')
+
+    assert(first.content) == b"\x89PNGtile"
+    assert(second.content) == first.content
+    assert(second.headers['content-type']) == 'image/png'
+    assert(len(calls)) == 1
+
+def test_tile_cache_entries_expire(tmp_path):
+    calls = []
+    cache = DiskCache(str(tmp_path), 1024)
+    client = TestClient(TileCacheMiddleware(tile_app(calls), cache, ttl=300))
+    path = '/cog/tiles/WebMercatorQuad/1/0/0@1x?url=s3://bucket/file.tif'
+    client.get(path)
+    client.get(path)
+    assert(len(calls)) == 1
+
+    key = cache_key('/cog/tiles/WebMercatorQuad/1/0/0@1x', b'url=s3://bucket/file.tif')
+    _, headers, body = decode_entry(cache.get(key))
+    cache.set(key, encode_entry(headers, body, stored=time.time() - 301))
+    assert(client.get(path).content) == b"\x89PNGtile"
+    assert(len(calls)) == 2
+
+def test_tile_cache_skips_errors_and_other_paths(tmp_path):
+    calls = []
+    client = TestClient(TileCacheMiddleware(tile_app(calls, status=500), DiskCache(str(tmp_path), 1024)))
+
+    client.get('/cog/tiles/WebMercatorQuad/1/0/0@1x')
+    client.get('/cog/tiles/WebMercatorQuad/1/0/0@1x')
+    client.get('/cog/info')
+    client.get('/cog/info')
+
+    assert(len(calls)) == 4
+
+def test_tile_cache_key_keeps_repeated_parameter_order():
+    assert(cache_key('/cog/tiles/1/0/0', b'bidx=3&bidx=1&rescale=0,255')) != cache_key('/cog/tiles/1/0/0', b'bidx=1&bidx=3&rescale=0,255')
+    assert(cache_key('/cog/tiles/1/0/0', b'rescale=0,255&bidx=1')) == cache_key('/cog/tiles/1/0/0', b'bidx=1&rescale=0,255')
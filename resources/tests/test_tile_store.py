@@ -0,0 +1,76 @@
+import gzip
+
+from starlette.testclient import TestClient
+
+from middleware import TitilerMiddleware
+from tile_store import DirectoryTileStore, S3TileStore, TileStoreMiddleware, open_tile_store
+
+def tile_app(calls, status=200):
+    async def app(scope, receive, send):
+        calls.append((scope["path"], scope["query_string"]))
+        await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"image/png")]})
+        await send({"type": "http.response.body", "body": b"\x89PNG", "more_body": True})
+        await send({"type": "http.response.body", "body": b"tile"})
+    return app
+
+def wait_for_uploads(middleware):
+    middleware.uploads.shutdown(wait=True)
+
+def test_tile_store_writes_back_rendered_tiles(tmp_path):
+    store = DirectoryTileStore(str(tmp_path))
+    app = TileStoreMiddleware(TitilerMiddleware(tile_app([]), base_url='map-tiles.princeton.edu', bucket='figgy-geo-staging'), store)
+    client = TestClient(app)
+
+    response = client.get('/1234567/cog/tiles/WebMercatorQuad/1/0/0@1x.png')
+    wait_for_uploads(app)
+
+    assert(response.content) == b"\x89PNGtile"
+    assert((tmp_path / '1234567/cog/tiles/WebMercatorQuad/1/0/0@1x.png').read_bytes()) == b"\x89PNGtile"
+
+def test_tile_store_skips_query_strings_errors_encoded_bodies_and_other_paths(tmp_path):
+    store = DirectoryTileStore(str(tmp_path))
+    app = TileStoreMiddleware(tile_app([], status=500), store)
+    client = TestClient(app)
+    client.get('/1234567/cog/tiles/WebMercatorQuad/1/0/0@1x.png')
+    wait_for_uploads(app)
+
+    app = TileStoreMiddleware(tile_app([]), store)
+    client = TestClient(app)
+    client.get('/1234567/cog/tiles/WebMercatorQuad/1/0/0@1x.png?rescale=0,100')
+    client.get('/1234567/cog/WebMercatorQuad/tilejson.json')
+    client.get('/1234567/cog/tiles/WebMercatorQuad')
+    client.get('/1234567/cog/tiles/batch')
+    wait_for_uploads(app)
+
+    async def gzipped(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"image/png"), (b"content-encoding", b"gzip")]})
+        await send({"type": "http.response.body", "body": gzip.compress(b"tile")})
+
+    app = TileStoreMiddleware(gzipped, store)
+    TestClient(app).get('/1234567/cog/tiles/WebMercatorQuad/1/0/0@1x.png')
+    wait_for_uploads(app)
+
+    assert(list(tmp_path.iterdir())) == []
+
+def test_dynamic_prefix_is_removed():
+    calls = []
+    client = TestClient(TitilerMiddleware(tile_app(calls), bucket='figgy-geo-staging'))
+    client.get('/_dynamic/1234567/cog/tiles/WebMercatorQuad/1/0/0@1x.png?rescale=0,100')
+    path, query_string = calls[0]
+    assert(path) == '/cog/tiles/WebMercatorQuad/1/0/0@1x.png'
+    assert(query_string) == b'rescale=0,100&url=s3%3A%2F%2Ffiggy-geo-staging%2F12%2F34%2F56%2F1234567%2Fdisplay_raster.tif'
+
+def test_open_tile_store():
+    store = open_tile_store('s3://figgy-geo-tiles/seeded')
+    assert(isinstance(store, S3TileStore))
+    assert(store.object_key('1234/cog/tiles/WebMercatorQuad/1/0/0@1x.png')) == 'seeded/1234/cog/tiles/WebMercatorQuad/1/0/0@1x.png'
+    assert(isinstance(open_tile_store('/tmp/tiles'), DirectoryTileStore))
+
+def test_directory_store_deletes_a_resource(tmp_path):
+    store = DirectoryTileStore(str(tmp_path))
+    store.put('1234567/cog/tiles/WebMercatorQuad/1/0/0@1x.png', b'tile', 'image/png')
+    store.put('1234567/cog/tiles/WebMercatorQuad/1/1/0@1x.png', b'tile', 'image/png')
+    store.put('1234568/cog/tiles/WebMercatorQuad/1/0/0@1x.png', b'tile', 'image/png')
+    assert(store.delete_prefix('1234567/')) == 2
+    assert(not store.exists('1234567/cog/tiles/WebMercatorQuad/1/0/0@1x.png'))
+    assert(store.exists('1234568/cog/tiles/WebMercatorQuad/1/0/0@1x.png'))
@@ -0,0 +1,97 @@
+from types import SimpleNamespace
+
+import pytest
+
+import warmer
+
+class FakeApp:
+    def __init__(self):
+        self.middleware_stack = None
+
+    def build_middleware_stack(self):
+        return "stack"
+
+def test_is_warmer_event():
+    assert(warmer.is_warmer_event({"warmer": {"concurrency": 2}}))
+    assert(warmer.is_warmer_event({"source": "aws.events", "detail-type": "Scheduled Event"}))
+    assert(not warmer.is_warmer_event({"version": "2.0", "rawPath": "/123456/cog/info"}))
+
+def test_warm_opens_resources():
+    opened = []
+    app = FakeApp()
+    result = warmer.warm(
+        {"warmer": {"resources": ["123456/cog", "abcdef/mosaicjson", "999999"]}},
+        None,
+        app,
+        open_resource=lambda resource_id, service: opened.append((resource_id, service)),
+    )
+    assert(opened) == [("123456", "cog"), ("abcdef", "mosaicjson"), ("999999", "cog")]
+    assert(app.middleware_stack) == "stack"
+    assert(result["fanout"]) == 0
+
+def test_warm_reports_resources_that_fail():
+    def fail(resource_id, service):
+        raise IOError("missing")
+
+    result = warmer.warm({"warmer": {"resources": ["123456/cog"]}}, None, FakeApp(), open_resource=fail)
+    assert(result["resources"]) == {"123456/cog": None}
+
+def test_warm_fans_out_to_more_containers(monkeypatch):
+    monkeypatch.setenv("TITILER_WARMER_MAX_CONCURRENCY", "8")
+    invocations = []
+    context = SimpleNamespace(invoked_function_arn="arn:aws:lambda:us-east-1:1:function:titiler")
+    result = warmer.warm(
+        {"warmer": {"concurrency": 4, "resources": []}},
+        context,
+        FakeApp(),
+        invoke=lambda arn, payload: invocations.append(payload),
+    )
+    assert(result["fanout"]) == 3
+    assert(invocations) == [{"warmer": {"concurrency": 1, "resources": [], "child": True}}] * 3
+
+def test_warm_concurrency_is_clamped_to_the_configured_maximum(monkeypatch):
+    invocations = []
+    context = SimpleNamespace(invoked_function_arn="arn:aws:lambda:us-east-1:1:function:titiler")
+    event = {"warmer": {"concurrency": 1000}}
+    invoke = lambda arn, payload: invocations.append(payload)
+    assert(warmer.warm(event, context, FakeApp(), invoke=invoke)["fanout"]) == 0
+    monkeypatch.setenv("TITILER_WARMER_MAX_CONCURRENCY", "4")
+    assert(warmer.warm(event, context, FakeApp(), invoke=invoke)["fanout"]) == 3
+    assert(len(invocations)) == 3
+
+@pytest.mark.parametrize("concurrency", [-1, 0, 2.5, "4", True, None])
+def test_warm_rejects_invalid_concurrency(concurrency):
+    with pytest.raises(ValueError):
+        warmer.warm({"warmer": {"concurrency": concurrency}}, None, FakeApp())
+
+def test_warm_counts_failed_invocations_and_still_opens_resources(monkeypatch):
+    monkeypatch.setenv("TITILER_WARMER_MAX_CONCURRENCY", "8")
+    opened = []
+    calls = []
+    context = SimpleNamespace(invoked_function_arn="arn:aws:lambda:us-east-1:1:function:titiler")
+
+    def invoke(arn, payload):
+        calls.append(payload)
+        if len(calls) % 2:
+            raise RuntimeError("Rate exceeded")
+
+    result = warmer.warm(
+        {"warmer": {"concurrency": 5, "resources": ["123456/cog"]}},
+        context,
+        FakeApp(),
+        invoke=invoke,
+        open_resource=lambda resource_id, service: opened.append(resource_id),
+    )
+    assert(len(calls)) == 4
+    assert(result["fanout"]) == 2
+    assert(result["fanout_failed"]) == 2
+    assert(opened) == ["123456"]
+
+def test_warm_children_hold_their_environment(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(warmer.time, 'sleep', sleeps.append)
+    warmer.warm({"warmer": {"concurrency": 1, "child": True, "hold_ms": 500}}, None, FakeApp())
+    assert(len(sleeps)) == 1
+    assert(0.4 < sleeps[0] <= 0.5)
+    warmer.warm({"warmer": {"concurrency": 4}}, None, FakeApp())
+    assert(len(sleeps)) == 1
@@ -0,0 +1,90 @@
+import json
+import os
+import time
+from urllib.parse import parse_qsl, urlencode
+
+from caches import DiskCache
+
+# Middleware keeping rendered tiles on local disk (/tmp) in a warm Lambda
+# container. CloudFront edge locations and the regional cache miss
+# independently, so the same tile is often requested from the function more
+# than once; repeats are answered from disk without touching GDAL.
+#
+# It runs after TitilerMiddleware, so entries are keyed on the rewritten
+# path and a canonical form of the query string (which includes the s3 url).
+# Only successful GET responses from tile endpoints are stored. Entries
+# expire after ttl seconds (TITILER_TILE_CACHE_TTL), like the mosaic and COG
+# header caches, so tiles of an updated resource are rendered again.
+class TileCacheMiddleware:
+    def __init__(self, app, cache=None, ttl=None):
+        self.app = app
+        self.cache = cache if cache is not None else tile_cache()
+        self.ttl = ttl if ttl is not None else float(os.getenv("TITILER_TILE_CACHE_TTL", "300"))
+
+    async def __call__(self, scope, receive, send):
+        if (
+            self.cache is None
+            or scope["type"] != "http"
+            or scope.get("method") != "GET"
+            or "/tiles/" not in scope["path"]
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        key = cache_key(scope["path"], scope.get("query_string", b""))
+        data = self.cache.get(key)
+        if data is not None:
+            stored, headers, body = decode_entry(data)
+            if time.time() - stored > self.ttl:
+                self.cache.pop(key)
+                data = None
+        if data is not None:
+            await send({"type": "http.response.start", "status": 200, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        start = None
+        chunks = []
+
+        async def caching_send(message):
+            nonlocal start
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                start = message
+            elif message["type"] == "http.response.body" and start is not None:
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    self.cache.set(key, encode_entry(start.get("headers", []), b"".join(chunks)))
+            await send(message)
+
+        await self.app(scope, receive, caching_send)
+
+# Tile cache configured from the environment; None (disabled) unless
+# TITILER_TILE_CACHE_MB is set.
+def tile_cache():
+    maxbytes = int(os.getenv("TITILER_TILE_CACHE_MB", "0")) * 1024 * 1024
+    if maxbytes <= 0:
+        return None
+    return DiskCache(os.getenv("TITILER_TILE_CACHE_DIR", "/tmp/titiler-tiles"), maxbytes)
+
+# Parameters are ordered by name; repeated parameters (e.g. bidx) keep their
+# relative order because it is significant.
+def cache_key(path, query_string):
+    if isinstance(query_string, bytes):
+        query_string = query_string.decode("latin-1")
+    params = sorted(parse_qsl(query_string, keep_blank_values=True), key=lambda kv: kv[0])
+    return f"{path}?{urlencode(params)}"
+
+# Entries are a JSON line with the time they were stored and the response
+# headers, followed by the body.
+def encode_entry(headers, body, stored=None):
+    header_line = json.dumps({
+        "stored": stored if stored is not None else time.time(),
+        "headers": [[k.decode("latin-1"), v.decode("latin-1")] for k, v in headers],
+    })
+    return header_line.encode() + b"\n" + body
+
+def decode_entry(data):
+    header_line, body = data.split(b"\n", 1)
+    entry = json.loads(header_line)
+    headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in entry["headers"]]
+    return entry["stored"], headers, body
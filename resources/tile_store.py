@@ -0,0 +1,169 @@
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from storage import s3_client, split_s3_url
+
+logger = logging.getLogger(__name__)
+
+CACHE_CONTROL = "public, max-age=31536000"
+
+# Key of a rendered tile: the path CloudFront serves it from, without the
+# leading slash, e.g. "{id}/cog/tiles/WebMercatorQuad/10/301/384@1x.png", or
+# "...@1x" without a format, as TileJSON tile urls request it.
+def tile_key(resource_id, service, tms, z, x, y, scale=1, format=None):
+    extension = f".{format}" if format else ""
+    return f"{resource_id}/{service}/tiles/{tms}/{z}/{x}/{y}@{scale}x{extension}"
+
+# Request paths of the form tile_key() gives. Other paths under tiles/ (the
+# TileSet documents at tiles/{tms}, batch requests) aren't image tiles.
+TILE_PATH = re.compile(r"/[^/]+/[^/]+/tiles/[^/]+/\d+/\d+/\d+(@\d+x)?(\.\w+)?")
+
+# Rendered tiles written to a local directory, for testing seeds and for
+# serving from disk.
+class DirectoryTileStore:
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def put(self, key, body, content_type):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(body)
+        os.replace(tmp, path)
+
+    # Remove every tile under `prefix` (e.g. "{id}/"); returns the count.
+    def delete_prefix(self, prefix):
+        count = 0
+        for directory, _, files in os.walk(self.path(prefix)):
+            for name in files:
+                os.remove(os.path.join(directory, name))
+                count += 1
+        return count
+
+# Rendered tiles written to S3 under `prefix`, with the content type and
+# cache headers CloudFront passes on to clients.
+class S3TileStore:
+    def __init__(self, bucket, prefix="", client=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.client = client
+
+    def object_key(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            (self.client or s3_client()).head_object(Bucket=self.bucket, Key=self.object_key(key))
+            return True
+        except ClientError:
+            return False
+
+    def put(self, key, body, content_type):
+        (self.client or s3_client()).put_object(
+            Bucket=self.bucket,
+            Key=self.object_key(key),
+            Body=body,
+            ContentType=content_type,
+            CacheControl=CACHE_CONTROL,
+        )
+
+    def delete_prefix(self, prefix):
+        client = self.client or s3_client()
+        count = 0
+        for page in client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=self.object_key(prefix)):
+            keys = [{"Key": item["Key"]} for item in page.get("Contents", [])]
+            if keys:
+                client.delete_objects(Bucket=self.bucket, Delete={"Objects": keys, "Quiet": True})
+                count += len(keys)
+        return count
+
+# Tile store for "s3://bucket/prefix" or a local directory.
+def open_tile_store(location):
+    if location.startswith("s3://"):
+        bucket, prefix = split_s3_url(location)
+        return S3TileStore(bucket, prefix)
+    return DirectoryTileStore(location)
+
+# Middleware writing tiles rendered by the function back to the tile store
+# (TITILER_TILE_STORE), so CloudFront finds them in S3 next time instead of
+# invoking the function. Only successful GET responses for tile paths
+# (TILE_PATH) without a query string are stored: the store is keyed by path
+# alone, and CloudFront sends requests with a query string to the function
+# (see DYNAMIC_PREFIX in middleware.py). Responses with a Content-Encoding
+# are skipped too, since the store keeps only the body and content type.
+#
+# Uploads run on a background thread so they don't delay the response. In
+# Lambda the thread is frozen with the execution environment between
+# invocations and carries on in the next one; uploads still pending when an
+# environment is shut down are lost, which only costs a later re-render.
+class TileStoreMiddleware:
+    def __init__(self, app, store=None, max_pending=64):
+        self.app = app
+        self.store = store if store is not None else tile_store()
+        self.uploads = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tile-store")
+        self.pending = threading.BoundedSemaphore(max_pending)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            self.store is None
+            or scope["type"] != "http"
+            or scope.get("method") != "GET"
+            or scope.get("query_string")
+            or not TILE_PATH.fullmatch(scope["path"])
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        # Read before TitilerMiddleware rewrites the path.
+        key = scope["path"].lstrip("/")
+        start = None
+        chunks = []
+
+        async def storing_send(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                if message["status"] == 200 and header(message, b"content-encoding") is None:
+                    start = message
+            elif message["type"] == "http.response.body" and start is not None:
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    self.upload(key, b"".join(chunks), header(start, b"content-type"))
+            await send(message)
+
+        await self.app(scope, receive, storing_send)
+
+    def upload(self, key, body, content_type):
+        # Drop the tile rather than queue without bound when S3 is slow.
+        if not self.pending.acquire(blocking=False):
+            return
+        future = self.uploads.submit(self.store.put, key, body, content_type or "application/octet-stream")
+        future.add_done_callback(self.uploaded)
+
+    def uploaded(self, future):
+        self.pending.release()
+        if future.exception() is not None:
+            logger.warning("could not store tile: %s", future.exception())
+
+def header(message, name):
+    for key, value in message.get("headers", []):
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+# Tile store the function writes to; None (disabled) unless
+# TITILER_TILE_STORE is set to s3://bucket/prefix or a directory.
+def tile_store():
+    location = os.getenv("TITILER_TILE_STORE")
+    return open_tile_store(location) if location else None
@@ -0,0 +1,118 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import instrumentation
+import middleware
+
+logger = logging.getLogger(__name__)
+
+# Events sent by the titiler-{stage}-warmer EventBridge rule. They are not
+# HTTP requests, so the handler answers them here without going through
+# Mangum and the ASGI app. The rule's input looks like
+#
+#   {"warmer": {"concurrency": 4, "resources": ["123456/cog", "abcdef/mosaicjson"]}}
+#
+# concurrency > 1 makes this invocation call the function concurrency - 1
+# more times in parallel, so that many containers are warm rather than one.
+# Each child holds its environment for hold_ms (default 1000) before
+# returning, so Lambda can't hand a finished child's environment to a
+# sibling and the fan-out reaches concurrency environments. Each listed
+# resource has its COG header or mosaic document opened, which primes the
+# GDAL and in-process caches for its tiles, whether or not the fan-out
+# succeeds. concurrency must be a positive integer and is clamped to
+# TITILER_WARMER_MAX_CONCURRENCY (the stack's warm_concurrency, default 1),
+# so an event can't make the function invoke itself without bound.
+def is_warmer_event(event):
+    return isinstance(event, dict) and ("warmer" in event or event.get("source") == "aws.events")
+
+def warm(event, context, app, invoke=None, open_resource=None):
+    start = time.perf_counter()
+    config = event.get("warmer")
+    if not isinstance(config, dict):
+        config = {}
+    concurrency = config.get("concurrency", 1)
+    if not isinstance(concurrency, int) or isinstance(concurrency, bool) or concurrency < 1:
+        raise ValueError(f"warmer concurrency must be a positive integer, not {concurrency!r}")
+    concurrency = min(concurrency, int(os.getenv("TITILER_WARMER_MAX_CONCURRENCY", "1")))
+    resources = config.get("resources", [])
+
+    instrumentation.mark_warm()
+
+    # Build the middleware stack now instead of on the first tile request.
+    if app.middleware_stack is None:
+        app.middleware_stack = app.build_middleware_stack()
+
+    pool = None
+    fanout = []
+    if concurrency > 1 and not config.get("child") and context is not None:
+        invoke = invoke or invoke_function
+        child = {"warmer": {**config, "concurrency": 1, "child": True}}
+        pool = ThreadPoolExecutor(max_workers=concurrency - 1)
+        fanout = [pool.submit(invoke, context.invoked_function_arn, child) for _ in range(concurrency - 1)]
+
+    open_resource = open_resource or prime_resource
+    primed = {}
+    for resource in resources:
+        resource_id, _, service = resource.partition("/")
+        service = service or "cog"
+        resource_start = time.perf_counter()
+        try:
+            open_resource(resource_id, service)
+            primed[resource] = round((time.perf_counter() - resource_start) * 1000, 1)
+        except Exception as e:
+            logger.warning("warmer could not open %s: %s", resource, e)
+            primed[resource] = None
+
+    failed = 0
+    for future in fanout:
+        try:
+            future.result()
+        except Exception as e:
+            logger.warning("warmer could not invoke %s: %s", context.invoked_function_arn, e)
+            failed += 1
+    if pool is not None:
+        pool.shutdown()
+
+    if config.get("child"):
+        hold = float(config.get("hold_ms", 1000)) / 1000 - (time.perf_counter() - start)
+        if hold > 0:
+            time.sleep(hold)
+
+    result = {
+        "warmed": True,
+        "fanout": len(fanout) - failed,
+        "fanout_failed": failed,
+        "resources": primed,
+        "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+    logger.info("warmer %s", json.dumps(result))
+    return result
+
+def invoke_function(function_arn, payload):
+    import boto3
+
+    response = boto3.client("lambda").invoke(
+        FunctionName=function_arn,
+        InvocationType="RequestResponse",
+        Payload=json.dumps(payload).encode(),
+    )
+    # Errors raised by the child are reported in FunctionError, not raised.
+    if response.get("FunctionError"):
+        raise RuntimeError(f"{response['FunctionError']}: {response['Payload'].read().decode()}")
+    return response.get("StatusCode")
+
+def prime_resource(resource_id, service):
+    url = middleware.resource_url(resource_id, service)
+    if service == "mosaicjson":
+        import mosaic_cache
+
+        with mosaic_cache.MosaicBackend(url):
+            pass
+    else:
+        import cog_cache
+
+        with cog_cache.CogReader(url):
+            pass
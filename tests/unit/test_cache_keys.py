@@ -0,0 +1,82 @@
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from geoservices.cache_keys import TILE_PARAMETERS_FILE, canonical_query_function
+
+# The function's canonical_query, loaded from resources/ (the Lambda task root).
+spec = importlib.util.spec_from_file_location("function_cache_keys", os.path.join(os.path.dirname(TILE_PARAMETERS_FILE), "cache_keys.py"))
+function_cache_keys = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(function_cache_keys)
+
+URIS = [
+    "/1234567/cog/tiles/WebMercatorQuad/10/301/384@1x.png",
+    "/abcdef/mosaicjson/tiles/batch",
+    "/1234567/cog/WebMercatorQuad/tilejson.json",
+]
+QUERIES = [
+    "",
+    "bidx=1&rescale=0,255",
+    "rescale=0,255&bidx=1",
+    "Rescale=0%2C255&BIDX=1&cachebust=123",
+    "bidx=3&bidx=1&Bidx=2&bidx=4",
+    "colormap_name=viridis&expression=b1%2Fb2&nodata=0&_=1700000000",
+    "tiles=10/1/1,10/2/1&tileMatrixSetId=WebMercatorQuad&Format=png",
+    "minzoom=2&maxzoom=12&tile_scale=2",
+]
+
+# The viewer request event CloudFront builds for `uri` and raw `query`:
+# one entry per parameter name as sent, with multiValue when it repeats.
+def cloudfront_event(uri, query):
+    querystring = {}
+    for item in filter(None, query.split("&")):
+        name, _, value = item.partition("=")
+        if name in querystring:
+            param = querystring[name]
+            param.setdefault("multiValue", [{"value": param["value"]}]).append({"value": value})
+        else:
+            querystring[name] = {"value": value}
+    return {"version": "1.0", "request": {"method": "GET", "uri": uri, "querystring": querystring, "headers": {}}}
+
+# (uri, query string) CloudFront forwards after running the function.
+RUNNER = """
+var request = handler(JSON.parse(require('fs').readFileSync(0, 'utf8')));
+var query = [];
+Object.keys(request.querystring).forEach(function (name) {
+    var param = request.querystring[name];
+    (param.multiValue || [param]).forEach(function (v) { query.push(name + '=' + v.value); });
+});
+console.log(JSON.stringify([request.uri, query.join('&')]));
+"""
+
+def run_function(code, uri, query):
+    result = subprocess.run(
+        ["node", "-e", code + RUNNER],
+        input=json.dumps(cloudfront_event(uri, query)),
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout)
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+@pytest.mark.parametrize("uri", URIS)
+def test_function_and_middleware_produce_the_same_key(uri):
+    code = canonical_query_function()
+    for query in QUERIES:
+        forwarded_uri, forwarded_query = run_function(code, uri, query)
+        assert(forwarded_uri) == uri
+        assert(forwarded_query.encode()) == function_cache_keys.canonical_query(uri, query.encode())
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+def test_tile_store_function_routes_dynamic_tiles():
+    code = canonical_query_function(dynamic_tiles=True)
+    tile = URIS[0]
+    assert(run_function(code, tile, "cachebust=1")) == [tile, ""]
+    assert(run_function(code, tile, "Bidx=1")) == ["/_dynamic" + tile, "bidx=1"]
+
+def test_function_embeds_the_allow_list():
+    code = canonical_query_function()
+    assert(json.dumps(sorted(function_cache_keys.TILE_PARAMETERS)) in code)
@@ -0,0 +1,82 @@
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from helpers import ip_list
+from helpers.ip_list import IpList, collapse
+
+def test_collapse_removes_covered_and_merges_adjacent_blocks():
+    cidrs = ["128.112.0.0/16", "128.112.65.0/24", "66.180.177.0/24", "66.180.176.0/24", "10.0.0.1/32"]
+    assert(collapse(cidrs)) == ["10.0.0.1/32", "66.180.176.0/23", "128.112.0.0/16"]
+
+def test_campus_ranges_are_collapsed(monkeypatch, tmp_path):
+    monkeypatch.setattr(IpList, "global_protect_fqdns", lambda self: [])
+    addresses = IpList(last_known=str(tmp_path / "ips.json")).ip4()
+    assert("128.112.0.0/16" in addresses)
+    assert(not any(a.startswith("128.112.6") for a in addresses))
+    assert(addresses) == collapse(addresses)
+
+def test_failed_and_slow_lookups_raise(monkeypatch, tmp_path):
+    release = threading.Event()
+    def gethostbyname(hostname):
+        if hostname == "slow":
+            release.wait(5)
+        if hostname == "missing":
+            raise socket.gaierror("not found")
+        return {"a": "192.0.2.1", "b": "192.0.2.2", "slow": "192.0.2.3"}[hostname]
+    monkeypatch.setattr(socket, "gethostbyname", gethostbyname)
+    try:
+        with pytest.raises(RuntimeError) as error:
+            IpList(timeout=0.5, last_known=str(tmp_path / "ips.json")).resolve(["a", "missing", "slow", "b"])
+        assert("missing (not found)" in str(error.value))
+        assert("slow (timed out)" in str(error.value))
+        # The stalled lookup doesn't hold up interpreter exit.
+        assert(all(thread.daemon for thread in threading.enumerate() if thread.name == "ip-list-resolve"))
+    finally:
+        release.set()
+
+def test_each_lookup_has_its_own_timeout(monkeypatch, tmp_path):
+    def gethostbyname(hostname):
+        time.sleep(0.3)
+        return "192.0.2.1"
+    monkeypatch.setattr(socket, "gethostbyname", gethostbyname)
+    ips = IpList(timeout=0.5, max_workers=1, last_known=str(tmp_path / "ips.json"))
+    assert(ips.resolve(["a", "b", "c"])) == ["192.0.2.1/32"] * 3
+
+def test_failed_lookups_keep_the_last_known_address(monkeypatch, tmp_path):
+    answers = {"a": "192.0.2.1", "b": "192.0.2.2"}
+    def gethostbyname(hostname):
+        if hostname not in answers:
+            raise socket.gaierror("not found")
+        return answers[hostname]
+    monkeypatch.setattr(socket, "gethostbyname", gethostbyname)
+    path = tmp_path / "ips.json"
+    assert(IpList(last_known=str(path)).resolve(["a", "b"])) == ["192.0.2.1/32", "192.0.2.2/32"]
+    assert(json.loads(path.read_text())) == {"a": "192.0.2.1/32", "b": "192.0.2.2/32"}
+
+    # A later synth, in a new process, without an answer for b.
+    del answers["b"]
+    assert(IpList(last_known=str(path)).resolve(["a", "b"])) == ["192.0.2.1/32", "192.0.2.2/32"]
+    with pytest.raises(RuntimeError):
+        IpList(last_known=str(path)).resolve(["a", "b", "c"])
+
+def test_resolution_is_cached(monkeypatch, tmp_path):
+    lookups = []
+    def gethostbyname(hostname):
+        lookups.append(hostname)
+        return "192.0.2.1"
+    monkeypatch.setattr(socket, "gethostbyname", gethostbyname)
+    monkeypatch.setattr(IpList, "global_protect_fqdns", lambda self: ["a", "b"])
+    ips = IpList(last_known=str(tmp_path / "ips.json"))
+    ips.ip4()
+    ips.ip4()
+    assert(len(lookups)) == 2
+    ips.ttl = -1
+    ips.ip4()
+    assert(len(lookups)) == 4
+
+def test_shared_instance():
+    assert(ip_list.shared() is ip_list.shared())
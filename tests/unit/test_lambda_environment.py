@@ -0,0 +1,19 @@
+import pytest
+
+from geoservices.lambda_environment import GDAL_ENVIRONMENT, TUNING_PROFILES, tuning_profile
+
+def test_default_profile_is_the_base_environment():
+    memory_size, env = tuning_profile()
+    assert(memory_size) == 3008
+    assert(env) == GDAL_ENVIRONMENT
+
+def test_profiles_override_the_base_environment():
+    for name in TUNING_PROFILES:
+        memory_size, env = tuning_profile(name)
+        assert(set(GDAL_ENVIRONMENT) <= set(env))
+        assert(128 <= memory_size <= 10240)
+    assert(tuning_profile("mosaic")[1]["RIO_TILER_MAX_THREADS"]) == "4"
+
+def test_unknown_profile():
+    with pytest.raises(ValueError):
+        tuning_profile("fast")
@@ -0,0 +1,15 @@
+import pytest
+
+from geoservices.provisioned_concurrency import PROVISIONED_CONCURRENCY, provisioned_concurrency
+
+def test_stage_settings_are_consistent():
+    for stage in PROVISIONED_CONCURRENCY:
+        settings = provisioned_concurrency(stage)
+        assert(1 <= settings["min"] <= settings["max"])
+        assert(0.1 <= settings["utilization"] <= 0.9)
+        for schedule in settings["schedules"]:
+            assert(1 <= schedule["min"] <= schedule["max"])
+
+def test_unknown_stage():
+    with pytest.raises(ValueError):
+        provisioned_concurrency("dev")